@@ -0,0 +1,114 @@
+'''
+This module contains helper functions for an adaptive number of repeats in
+repeated k-fold cross-validation.
+
+Repeats are added in batches, up to the configured maximum, until the results
+have converged. Two convergence criteria are available:
+    1. Confidence interval (CI) of a performance metric. The half-width of the
+    CI of the mean across repeats must be within a tolerance.
+    2. Stability of the top-n feature ranking. The fraction of top features
+    that changed after adding a batch of repeats must be within a tolerance.
+
+Because scikit-learn's RepeatedKFold generates the repeats sequentially from
+the same random state, the repeats used are identical to the first repeats
+of the fixed (non-adaptive) scheme.
+'''
+
+import numpy as np
+from scipy import stats
+
+#region: split_by_repeat
+def split_by_repeat(splits, n_splits):
+    '''
+    Group the train/test splits of a repeated k-fold cross-validation by
+    repeat.
+
+    Parameters
+    ----------
+    splits : list of tuple
+        Train and test indices, as generated by RepeatedKFold.split().
+    n_splits : int
+        Number of folds in each repeat.
+
+    Returns
+    -------
+    list of list of tuple
+        One list of splits for each repeat.
+    '''
+    return [splits[i:i+n_splits] for i in range(0, len(splits), n_splits)]
+#endregion
+
+#region: iter_repeat_batches
+def iter_repeat_batches(n_repeats, min_repeats=None, repeats_per_step=1):
+    '''
+    Generate the ranges of repeats to be evaluated at each step.
+
+    Parameters
+    ----------
+    n_repeats : int
+        Maximum number of repeats.
+    min_repeats : int, optional
+        Number of repeats in the first batch. If None, all repeats are in a
+        single batch (non-adaptive).
+    repeats_per_step : int, optional
+        Number of repeats in each subsequent batch.
+
+    Yields
+    ------
+    start, stop : int
+        The batch contains repeats 'start' to 'stop' - 1.
+    '''
+    if min_repeats is None:
+        yield 0, n_repeats
+        return
+    stop = min(max(min_repeats, 1), n_repeats)
+    yield 0, stop
+    while stop < n_repeats:
+        start, stop = stop, min(stop + max(repeats_per_step, 1), n_repeats)
+        yield start, stop
+#endregion
+
+#region: ci_half_width
+def ci_half_width(repeat_scores, confidence_level=0.95):
+    '''
+    Compute the half-width of the confidence interval of the mean score
+    across repeats, based on the t-distribution.
+
+    Parameters
+    ----------
+    repeat_scores : array-like
+        Score of each repeat, e.g., averaged across folds.
+    confidence_level : float, optional
+
+    Returns
+    -------
+    float
+        Infinity if there are fewer than two repeats.
+    '''
+    repeat_scores = np.asarray(repeat_scores, dtype='float64')
+    n = len(repeat_scores)
+    if n < 2:
+        return np.inf
+    standard_error = repeat_scores.std(ddof=1) / np.sqrt(n)
+    return stats.t.ppf((1 + confidence_level) / 2, n - 1) * standard_error
+#endregion
+
+#region: ranking_instability
+def ranking_instability(previous_top_features, top_features):
+    '''
+    Compute the fraction of top features that changed between two rankings.
+
+    Parameters
+    ----------
+    previous_top_features : list of str
+    top_features : list of str
+
+    Returns
+    -------
+    float
+        Between 0 (same features) and 1 (no feature in common).
+    '''
+    n_features = max(len(top_features), 1)
+    n_shared = len(set(previous_top_features) & set(top_features))
+    return 1. - n_shared / n_features
+#endregion
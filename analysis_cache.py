@@ -0,0 +1,271 @@
+'''
+This module contains the `AnalysisCache` class, which persists the results of
+`ResultsAnalyzer` methods on disk, so that repeated runs of the plotting
+(e.g., after changing the plot configuration) skip the analyses.
+
+Each entry is keyed by the method name, its arguments, and the content hash of
+the files from which the result is derived, i.e., the results and estimator of
+each model key, the input data, and the metadata. With `memoized()`, the key
+also includes the data settings, which determine how the input data are
+loaded. An entry is therefore reused only if none of these changed. The
+content hash of each file is stored along with its modification time and
+size, so that unchanged files are not hashed again.
+
+The cache is on disk, so that it is shared by the parallel workers.
+
+Example
+-------
+analysis_cache = AnalysisCache('Cache/analysis')
+result = analysis_cache.get_or_compute(
+    'describe_performances',
+    {'model_key' : model_key},
+    input_paths,
+    lambda: results_analyzer.describe(model_key, 'performances')
+    )
+'''
+
+import os
+import shutil
+import hashlib
+import inspect
+import functools
+import tempfile
+import joblib
+
+from metadata_log import MetadataLog
+
+# Size of the blocks in which the files are read for hashing
+BLOCK_SIZE = 2**20
+
+#region: AnalysisCache.__init__
+class AnalysisCache:
+    '''
+    Disk-backed memoization of analysis results.
+
+    Attributes
+    ----------
+    location : str
+        Path to the cache directory.
+    '''
+    def __init__(self, location):
+        '''
+        Initialize the AnalysisCache.
+
+        Parameters
+        ----------
+        location : str
+            Path to the cache directory. Created upon the first entry.
+        '''
+        self.location = location
+        self._file_hashes = MetadataLog(
+            os.path.join(location, 'file_hashes.json'))
+        self._hash_for_file = None  # path -> [file_stats, digest]
+#endregion
+
+    #region: __getstate__
+    def __getstate__(self):
+        '''
+        Exclude the loaded file hashes when pickling, e.g., for parallel
+        workers.
+        '''
+        state = self.__dict__.copy()
+        state['_hash_for_file'] = None
+        return state
+    #endregion
+
+    #region: get_or_compute
+    def get_or_compute(self, name, arguments, input_paths, compute):
+        '''
+        Get the cached result, or compute and cache it.
+
+        Parameters
+        ----------
+        name : str
+            Name of the analysis, e.g., the method name.
+        arguments : dict
+            Arguments of the analysis. Must be hashable with joblib.hash.
+        input_paths : list of str
+            Paths to the files or directories from which the result is
+            derived. Paths which do not exist are allowed.
+        compute : callable
+            Function without arguments which computes the result.
+
+        Returns
+        -------
+        object
+            The result, which must be picklable.
+        '''
+        key = joblib.hash((name, arguments, self.hash_files(input_paths)))
+        path = os.path.join(self.location, name, f'{key}.joblib')
+
+        try:
+            result, = joblib.load(path)
+        except FileNotFoundError:
+            result = compute()
+            _dump_atomic((result,), path)
+        return result
+    #endregion
+
+    #region: hash_files
+    def hash_files(self, paths):
+        '''
+        Get the content hash of each file.
+
+        Parameters
+        ----------
+        paths : list of str
+            Paths to files or directories. Directories are hashed file by
+            file, recursively.
+
+        Returns
+        -------
+        list of tuple
+            (path, digest) for each file, in order. The digest is None if the
+            path does not exist.
+        '''
+        if self._hash_for_file is None:
+            self._hash_for_file = self._file_hashes.read()
+
+        hashes = []
+        for path in paths:
+            for file_path in _list_files(path):
+                hashes.append((file_path, self._hash_file(file_path)))
+        return hashes
+    #endregion
+
+    #region: _hash_file
+    def _hash_file(self, path):
+        '''
+        Get the content hash of a file, hashing it only if it changed since it
+        was last hashed.
+        '''
+        file_stats = _get_file_stats(path)
+        if file_stats is None:
+            return None
+
+        entry = self._hash_for_file.get(path)
+        if entry is not None and entry[0] == file_stats:
+            return entry[1]
+
+        digest = hashlib.blake2b()
+        with open(path, 'rb') as file:
+            for block in iter(lambda: file.read(BLOCK_SIZE), b''):
+                digest.update(block)
+        entry = [file_stats, digest.hexdigest()]
+
+        self._hash_for_file[path] = entry
+        self._file_hashes.set([path], entry)
+        return entry[1]
+    #endregion
+
+    #region: clear
+    def clear(self):
+        '''
+        Delete all cached results and file hashes.
+        '''
+        if os.path.isdir(self.location):
+            shutil.rmtree(self.location)
+        self._hash_for_file = None
+    #endregion
+
+#region: memoized
+def memoized(*setting_names):
+    '''
+    Decorator to memoize a method of `ResultsAnalyzer` in its
+    `analysis_cache`, if any.
+
+    The input files are given by `ResultsAnalyzer.get_input_paths()` for the
+    'model_key' or 'model_keys' argument of the method. The data settings of
+    the `DataManager` (e.g., 'drop_missing_for_condition') are part of the
+    key, because they change the loaded features and target.
+
+    Parameters
+    ----------
+    *setting_names : str
+        Names of the plot settings on which the result depends, e.g.,
+        labels. Other plot settings do not invalidate the cached results.
+
+    Returns
+    -------
+    callable
+    '''
+    def decorator(method):
+        signature = inspect.signature(method)
+
+        @functools.wraps(method)
+        def wrapper(results_analyzer, *args, **kwargs):
+            analysis_cache = results_analyzer.analysis_cache
+            if analysis_cache is None:
+                return method(results_analyzer, *args, **kwargs)
+
+            bound = signature.bind(results_analyzer, *args, **kwargs)
+            bound.apply_defaults()
+            arguments = dict(bound.arguments)
+            del arguments['self']
+
+            if 'model_keys' in arguments:
+                model_keys = [tuple(k) for k in arguments['model_keys']]
+                arguments['model_keys'] = model_keys
+            else:
+                model_keys = [tuple(arguments['model_key'])]
+                arguments['model_key'] = model_keys[0]
+            for setting_name in setting_names:
+                arguments[setting_name] = getattr(
+                    results_analyzer.plot_settings, setting_name)
+            arguments['data_settings'] = vars(
+                results_analyzer.data_manager.data_settings)
+
+            return analysis_cache.get_or_compute(
+                method.__name__,
+                arguments,
+                results_analyzer.get_input_paths(model_keys),
+                lambda: method(results_analyzer, *args, **kwargs)
+                )
+        return wrapper
+    return decorator
+#endregion
+
+#region: _list_files
+def _list_files(path):
+    '''
+    Helper function to list the files at a path, recursively and in sorted
+    order if it is a directory. A path which does not exist is listed as is.
+    '''
+    if not os.path.isdir(path):
+        return [path]
+    file_paths = []
+    for directory, directory_names, file_names in os.walk(path):
+        directory_names.sort()
+        for file_name in sorted(file_names):
+            file_paths.append(os.path.join(directory, file_name))
+    return file_paths
+#endregion
+
+#region: _get_file_stats
+def _get_file_stats(path):
+    '''
+    Helper function to identify the version of a file, or None if it does
+    not exist.
+    '''
+    try:
+        stat_result = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return [stat_result.st_ino, stat_result.st_mtime_ns, stat_result.st_size]
+#endregion
+
+#region: _dump_atomic
+def _dump_atomic(obj, path):
+    '''
+    Helper function to write an object with joblib such that concurrent
+    readers never see an incomplete file.
+    '''
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+
+    with tempfile.NamedTemporaryFile(
+            dir=directory, suffix='.tmp', delete=False) as file:
+        temp_path = file.name
+    joblib.dump(obj, temp_path)
+    os.replace(temp_path, path)
+#endregion
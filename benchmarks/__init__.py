@@ -0,0 +1,7 @@
+'''
+This package contains benchmarks for performance-critical steps of the 
+workflow. Each module can be executed as a script from the root directory, 
+e.g.,
+
+    python -m benchmarks.opera_ad_masking
+'''
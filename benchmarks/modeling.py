@@ -0,0 +1,547 @@
+'''
+Benchmark of the modeling hot paths on synthetic OPERA-shaped data.
+
+For each estimator in the estimator configuration, with and without feature
+selection, the stages of a modeling workflow are run and measured in turn:
+    1. 'build_pipeline' : `PipelineBuilder.instantiate_estimators()`
+    2. 'cross_validate' : `ModelEvaluator.cross_validate_model()`
+    3. 'nested_feature_selection' : `FeatureSelector.nested_feature_selection()`
+    on all data (with feature selection only)
+    4. 'final_fit' : fit of the final estimator, as in `ModelBuilder`
+    5. 'write_results' : `ResultsManager.write_results()`
+    6. 'read_results' : `ResultsManager.read_result()` for each result type
+    and `ResultsManager.read_estimator()`
+
+Stages 3 and 4 together are equivalent to `ModelBuilder.train_final_model()`.
+
+Each stage reports the wall time, the CPU time, and the peak resident set
+size (RSS) of the main process. On Linux, the peak RSS is reset before each
+stage. Elsewhere, it is the peak since the start of the process. With
+n_jobs > 1, the CPU time and memory of the workers are not included.
+
+The results are written to a JSON file, along with the revision (git commit)
+and the parameters, so that two revisions can be compared.
+
+Example
+-------
+    python -m benchmarks.modeling --n_chemicals 2000 --output new.json
+    python -m benchmarks.modeling --compare old.json new.json
+'''
+
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import subprocess
+import tempfile
+from types import SimpleNamespace
+import numpy as np
+import pandas as pd
+
+from config_management import UnifiedConfiguration
+from pipeline_factory import PipelineBuilder
+from feature_selection import FeatureSelector
+from metrics_management import MetricsManager
+from model_evaluation import ModelEvaluator
+from model_key_creation import ModelKeyCreator
+from results_management import ResultsManager
+from fit_cache import fit_estimator
+import profiling
+
+# Columns identifying a measurement
+KEY_COLUMNS = ['select_features', 'estimator', 'stage']
+
+#region: main
+def main(
+        config_path='config.json',
+        estimator_names=None,
+        select_features=('false', 'true'),
+        n_chemicals=1000,
+        n_features=40,
+        n_discrete=5,
+        missing_fraction=0.1,
+        n_jobs=1,
+        n_repeats_cv=None,
+        n_repeats_select=None,
+        output_path=None,
+        seed=0
+        ):
+    '''
+    Run the benchmark, print the measurements, and optionally write them.
+
+    Parameters
+    ----------
+    config_path : str, optional
+        Path to the JSON file mapping categories to configuration files. The
+        estimator, preprocessor, feature selection, evaluation, metric, and
+        data configurations are used.
+    estimator_names : list of str, optional
+        Names of the estimators to benchmark. Default is all estimators of
+        the configuration.
+    select_features : tuple of str, optional
+        Whether to run the workflow without ('false') and/or with ('true')
+        feature selection.
+    n_chemicals, n_features, n_discrete, missing_fraction : optional
+        Shape of the synthetic data. See `make_synthetic_data()`.
+    n_jobs : int, optional
+        Number of cores for the cross-validation. Default 1, so that the
+        measurements include all work.
+    n_repeats_cv, n_repeats_select : int, optional
+        Override the number of repeats of the evaluation and the feature
+        selection, e.g., for a quick benchmark. Default is the configuration.
+    output_path : str, optional
+        Path to the JSON file of the results.
+    seed : int, optional
+
+    Returns
+    -------
+    pandas.DataFrame
+        Measurements for each (select_features, estimator, stage).
+    '''
+    config = UnifiedConfiguration(config_path)
+    evaluation_settings = _override(
+        config.evaluation, n_repeats_cv=n_repeats_cv)
+    feature_selection_settings = _override(
+        config.feature_selection, n_repeats_select=n_repeats_select)
+    discrete_suffix = config.data.discrete_column_suffix
+
+    if estimator_names is None:
+        estimator_names = list(config.category_to_dict('estimator'))
+
+    data_condition = 'missing' if missing_fraction > 0 else 'complete'
+    X, y = make_synthetic_data(
+        n_chemicals,
+        n_features,
+        n_discrete=n_discrete,
+        missing_fraction=missing_fraction,
+        discrete_suffix=discrete_suffix,
+        seed=seed
+        )
+    preprocessor_names = (
+        config.preprocessor.preprocessors_for_condition[data_condition])
+
+    pipeline_builder = PipelineBuilder(
+        config.category_to_dict('estimator'),
+        config.preprocessor.settings,
+        discrete_suffix
+        )
+    feature_selector = FeatureSelector(feature_selection_settings, n_jobs)
+    model_evaluator = ModelEvaluator(
+        evaluation_settings,
+        MetricsManager(config.category_to_dict('metric')),
+        feature_selector=feature_selector,
+        n_jobs=n_jobs
+        )
+
+    instructions = [
+        {
+            'target_effect' : 'synthetic',
+            'features_source' : 'synthetic',
+            'ld50_type' : 'predicted',
+            'data_condition' : data_condition,
+            'select_features' : select,
+            'estimators' : list(estimator_names)
+        }
+        for select in select_features
+    ]
+    model_key_creator = ModelKeyCreator(instructions)
+
+    records = []  # initialize
+    with tempfile.TemporaryDirectory(prefix='benchmark_') as results_dir:
+        results_manager = ResultsManager(
+            results_dir,
+            results_file_type=config.data.file_type,
+            model_key_creator=model_key_creator
+            )
+        for instruction in instructions:
+            for estimator_name in estimator_names:
+                print(
+                    f'{estimator_name}, '
+                    f'select_features={instruction["select_features"]}',
+                    flush=True
+                    )
+                measurements = run_workflow(
+                    pipeline_builder,
+                    preprocessor_names,
+                    estimator_name,
+                    model_evaluator,
+                    feature_selector,
+                    results_manager,
+                    model_key_creator.create_model_key(
+                        instruction, estimator_name),
+                    X,
+                    y,
+                    instruction['select_features'] == 'true'
+                    )
+                for stage, measurement in measurements.items():
+                    records.append({
+                        'select_features' : instruction['select_features'],
+                        'estimator' : estimator_name,
+                        'stage' : stage,
+                        **measurement
+                        })
+
+    measurements = pd.DataFrame(records).set_index(KEY_COLUMNS)
+    print(_format_measurements(measurements))
+
+    if output_path is not None:
+        parameters = {
+            'config_path' : config_path,
+            'n_chemicals' : n_chemicals,
+            'n_features' : n_features,
+            'n_discrete' : n_discrete,
+            'missing_fraction' : missing_fraction,
+            'n_jobs' : n_jobs,
+            'n_repeats_cv' : evaluation_settings.n_repeats_cv,
+            'n_repeats_select' : feature_selection_settings.n_repeats_select,
+            'seed' : seed
+        }
+        write_measurements(measurements, output_path, parameters)
+        print(f'Written to {output_path}')
+
+    return measurements
+#endregion
+
+#region: run_workflow
+def run_workflow(
+        pipeline_builder,
+        preprocessor_names,
+        estimator_name,
+        model_evaluator,
+        feature_selector,
+        results_manager,
+        model_key,
+        X,
+        y,
+        select_features
+        ):
+    '''
+    Run the stages of the workflow for one model key and measure each stage.
+
+    Returns
+    -------
+    dict
+        Mapping of each stage to its measurements (dict).
+    '''
+    measurements = {}  # initialize
+
+    with _measure(measurements, 'build_pipeline'):
+        estimator = pipeline_builder.instantiate_estimators(
+            preprocessor_names)[estimator_name]
+
+    with _measure(measurements, 'cross_validate'):
+        results = model_evaluator.cross_validate_model(
+            estimator, X, y, select_features)
+
+    features = list(X.columns)
+    if select_features:
+        with _measure(measurements, 'nested_feature_selection'):
+            estimator, features, results['importances'] = (
+                feature_selector.nested_feature_selection(estimator, X, y))
+
+    with _measure(measurements, 'final_fit'):
+        fit_estimator(estimator, X[features], y)
+    results['estimator'] = estimator
+    results['fit_time'] = measurements['final_fit']['wall_time']
+
+    with _measure(measurements, 'write_results'):
+        results_manager.write_results(model_key, results)
+
+    with _measure(measurements, 'read_results'):
+        for result_type, result_data in results.items():
+            if isinstance(result_data, pd.DataFrame):
+                results_manager.read_result(model_key, result_type)
+        results_manager.read_estimator(model_key)
+
+    return measurements
+#endregion
+
+#region: make_synthetic_data
+def make_synthetic_data(
+        n_chemicals,
+        n_features,
+        n_discrete=5,
+        missing_fraction=0.1,
+        discrete_suffix='_discrete',
+        seed=0
+        ):
+    '''
+    Generate synthetic features and target, shaped like the OPERA features
+    and the log10-transformed points of departure.
+
+    Parameters
+    ----------
+    n_chemicals : int
+        Number of chemicals (rows).
+    n_features : int
+        Number of features (columns), including the discrete ones.
+    n_discrete : int, optional
+        Number of discrete-valued features (small counts), whose names end
+        with the discrete suffix.
+    missing_fraction : float, optional
+        Fraction of missing values (NaN) in each continuous feature, e.g.,
+        predictions outside the applicability domain.
+    discrete_suffix : str, optional
+    seed : int, optional
+
+    Returns
+    -------
+    X : pandas.DataFrame
+        Features, indexed by DTXSID.
+    y : pandas.Series
+        Target, a linear function of some features plus noise.
+    '''
+    rng = np.random.default_rng(seed)
+    index = pd.Index(
+        [f'DTXSID{i:09d}' for i in range(n_chemicals)], name='DTXSID')
+
+    n_continuous = n_features - n_discrete
+    continuous = rng.normal(size=(n_chemicals, n_continuous))
+    discrete = rng.poisson(2., size=(n_chemicals, n_discrete))
+
+    coefficients = rng.normal(size=n_features) * (rng.random(n_features) < 0.3)
+    y = (
+        np.hstack([continuous, discrete]) @ coefficients
+        + rng.normal(scale=0.5, size=n_chemicals)
+    )
+
+    is_missing = rng.random(continuous.shape) < missing_fraction
+    continuous[is_missing] = np.nan
+
+    columns = (
+        [f'Model{i}_pred' for i in range(n_continuous)]
+        + [f'Model{i}_pred{discrete_suffix}' for i in range(n_discrete)]
+    )
+    X = pd.DataFrame(
+        np.hstack([continuous, discrete.astype('float64')]),
+        index=index,
+        columns=columns
+        )
+    return X, pd.Series(y, index=index, name='POD')
+#endregion
+
+#region: write_measurements
+def write_measurements(measurements, output_path, parameters):
+    '''
+    Write the measurements to a JSON file, along with the revision, the
+    parameters, and the machine.
+    '''
+    document = {
+        'revision' : _get_revision(),
+        'timestamp' : time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'parameters' : parameters,
+        'machine' : {
+            'platform' : platform.platform(),
+            'python' : platform.python_version(),
+            'n_cpus' : os.cpu_count()
+        },
+        'measurements' : measurements.reset_index().to_dict('records')
+    }
+    directory = os.path.dirname(output_path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(output_path, 'w') as file:
+        json.dump(document, file, indent=1)
+#endregion
+
+#region: read_measurements
+def read_measurements(path):
+    '''
+    Read the measurements written by `write_measurements()`.
+
+    Returns
+    -------
+    measurements : pandas.DataFrame
+    document : dict
+        Other contents, e.g., the revision and the parameters.
+    '''
+    with open(path, 'r') as file:
+        document = json.load(file)
+    measurements = pd.DataFrame(
+        document.pop('measurements')).set_index(KEY_COLUMNS)
+    return measurements, document
+#endregion
+
+#region: compare
+def compare(base_path, new_path, tolerance=0.1, min_increase=0.05):
+    '''
+    Compare the measurements of two runs, e.g., of two revisions.
+
+    Parameters
+    ----------
+    base_path, new_path : str
+        Paths to the JSON files written by `main()`.
+    tolerance : float, optional
+        Relative increase of the wall time or peak RSS above which a stage is
+        flagged as a regression. Default 0.1, i.e., 10%.
+    min_increase : float, optional
+        Increase of the wall time (s) below which a stage is not flagged, 
+        e.g., for short stages subject to noise. Default 0.05. The peak RSS 
+        must increase by at least 1 MiB.
+
+    Returns
+    -------
+    pandas.DataFrame
+        Base and new values and their ratio (new / base) for each metric.
+    '''
+    base, base_document = read_measurements(base_path)
+    new, new_document = read_measurements(new_path)
+
+    if base_document['parameters'] != new_document['parameters']:
+        print('Warning: the parameters differ between the two runs')
+
+    metrics = ['wall_time', 'cpu_time', 'peak_rss']
+    comparison = pd.concat(
+        {'base' : base[metrics], 'new' : new[metrics]}, axis=1, join='inner')
+    comparison = comparison.swaplevel(axis=1)
+    for metric in metrics:
+        comparison[(metric, 'ratio')] = (
+            comparison[(metric, 'new')] / comparison[(metric, 'base')])
+    comparison = comparison[metrics]
+
+    is_regression = (
+        (
+            (comparison[('wall_time', 'ratio')] > 1 + tolerance)
+            & (comparison[('wall_time', 'new')] 
+               - comparison[('wall_time', 'base')] > min_increase)
+        )
+        | (
+            (comparison[('peak_rss', 'ratio')] > 1 + tolerance)
+            & (comparison[('peak_rss', 'new')] 
+               - comparison[('peak_rss', 'base')] > 2**20)
+        )
+    )
+    comparison['regression'] = is_regression
+
+    print(
+        f'base: {base_document["revision"]}, '
+        f'new: {new_document["revision"]}'
+        )
+    print(comparison.round(3).to_string())
+    if is_regression.any():
+        print(f'{is_regression.sum()} stage(s) regressed by more than '
+              f'{tolerance:.0%}')
+    return comparison
+#endregion
+
+#region: _measure
+class _measure:
+    '''
+    Context manager to measure the wall time, CPU time, and peak RSS of a
+    block of code into a dictionary of measurements.
+    '''
+    def __init__(self, measurements, stage):
+        self.measurements = measurements
+        self.stage = stage
+
+    def __enter__(self):
+        profiling.reset_peak_memory()
+        self._rss_start = profiling.get_memory()
+        self._wall_start = time.perf_counter()
+        self._cpu_start = time.process_time()
+        return self
+
+    def __exit__(self, *exc_info):
+        wall_time = time.perf_counter() - self._wall_start
+        cpu_time = time.process_time() - self._cpu_start
+        peak_rss = profiling.get_peak_memory()
+        self.measurements[self.stage] = {
+            'wall_time' : wall_time,
+            'cpu_time' : cpu_time,
+            'peak_rss' : peak_rss,
+            'peak_rss_increase' : peak_rss - self._rss_start
+        }
+#endregion
+
+#region: _override
+def _override(settings, **values):
+    '''
+    Helper function to copy a SimpleNamespace of settings with the given
+    values, ignoring values which are None.
+    '''
+    values = {k : v for k, v in values.items() if v is not None}
+    return SimpleNamespace(**{**vars(settings), **values})
+#endregion
+
+#region: _get_revision
+def _get_revision():
+    '''
+    Helper function to get the current git commit, with a '-dirty' suffix if
+    there are uncommitted changes, or None if not in a git repository.
+    '''
+    try:
+        revision = subprocess.run(
+            ['git', 'describe', '--always', '--dirty'],
+            capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__))
+            ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return revision
+#endregion
+
+#region: _format_measurements
+def _format_measurements(measurements):
+    '''
+    Helper function to format the measurements for printing, with the memory
+    in MiB.
+    '''
+    formatted = measurements.copy()
+    for column in ['peak_rss', 'peak_rss_increase']:
+        formatted[column] = formatted[column] / 2**20
+    formatted = formatted.rename(columns={
+        'wall_time' : 'wall_time (s)',
+        'cpu_time' : 'cpu_time (s)',
+        'peak_rss' : 'peak_rss (MiB)',
+        'peak_rss_increase' : 'peak_rss_increase (MiB)'
+        })
+    return formatted.round(3).to_string()
+#endregion
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--config', default='config.json')
+    parser.add_argument('--estimators', nargs='+', default=None)
+    parser.add_argument(
+        '--select_features', nargs='+', default=['false', 'true'],
+        choices=['false', 'true'])
+    parser.add_argument('--n_chemicals', type=int, default=1000)
+    parser.add_argument('--n_features', type=int, default=40)
+    parser.add_argument('--n_discrete', type=int, default=5)
+    parser.add_argument('--missing_fraction', type=float, default=0.1)
+    parser.add_argument('--n_jobs', type=int, default=1)
+    parser.add_argument('--n_repeats_cv', type=int, default=None)
+    parser.add_argument('--n_repeats_select', type=int, default=None)
+    parser.add_argument('--output', default=None)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument(
+        '--compare', nargs=2, metavar=('BASE', 'NEW'), default=None,
+        help='Compare two results files instead of running the benchmark')
+    parser.add_argument('--tolerance', type=float, default=0.1)
+    parser.add_argument('--min_increase', type=float, default=0.05)
+    args = parser.parse_args()
+
+    if args.compare is not None:
+        comparison = compare(
+            *args.compare, 
+            tolerance=args.tolerance, 
+            min_increase=args.min_increase
+            )
+        sys.exit(int(comparison['regression'].any()))
+
+    main(
+        config_path=args.config,
+        estimator_names=args.estimators,
+        select_features=tuple(args.select_features),
+        n_chemicals=args.n_chemicals,
+        n_features=args.n_features,
+        n_discrete=args.n_discrete,
+        missing_fraction=args.missing_fraction,
+        n_jobs=args.n_jobs,
+        n_repeats_cv=args.n_repeats_cv,
+        n_repeats_select=args.n_repeats_select,
+        output_path=args.output,
+        seed=args.seed
+        )
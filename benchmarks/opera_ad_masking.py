@@ -0,0 +1,193 @@
+'''
+Benchmark of the applicability domain (AD) flags and masking of unreliable 
+OPERA predictions.
+
+The vectorized implementations in `raw_processing.opera` are compared with 
+the previous, feature-by-feature implementations on a synthetic batch of 
+OPERA output. Both implementations are checked to give identical results.
+
+Example
+-------
+    python -m benchmarks.opera_ad_masking --n_samples 1000000
+'''
+
+import argparse
+import time
+import numpy as np
+import pandas as pd
+
+from raw_processing import opera
+
+#region: main
+def main(n_samples=1_000_000, n_models=8, n_repeats=3, seed=0):
+    '''
+    Run the benchmark and print the timings.
+
+    Parameters
+    ----------
+    n_samples : int, optional
+        Number of chemicals in the synthetic batch.
+    n_models : int, optional
+        Number of OPERA models, each with two features. Half of the models 
+        have a pair of ADs shared by both features, the other half have a 
+        pair of ADs for each feature.
+    n_repeats : int, optional
+        The best time of the repeats is reported.
+    seed : int, optional
+
+    Returns
+    -------
+    pandas.DataFrame
+        Best time (s) of each implementation and the speedup, for each step.
+    '''
+    data_for_model, columns_for_model = make_synthetic_batch(
+        n_samples, n_models, seed=seed)
+
+    predictions = pd.concat(
+        [data_for_model[m][columns_for_model[m]] for m in data_for_model], 
+        axis=1
+        )
+
+    timings = {}  # initialize
+
+    AD_flags_old, timings[('AD flags', 'old')] = _time(
+        _legacy_app_domains_from_model_data, n_repeats, 
+        data_for_model, columns_for_model)
+    AD_flags_new, timings[('AD flags', 'new')] = _time(
+        opera._app_domains_from_model_data, n_repeats, 
+        data_for_model, columns_for_model)
+    pd.testing.assert_frame_equal(AD_flags_old, AD_flags_new)
+
+    masked_old, timings[('masking', 'old')] = _time(
+        _legacy_set_unreliable_values, n_repeats, predictions, AD_flags_new)
+    masked_new, timings[('masking', 'new')] = _time(
+        opera.set_unreliable_values, n_repeats, predictions, AD_flags_new)
+    pd.testing.assert_frame_equal(masked_old, masked_new)
+
+    timings = pd.Series(timings).unstack()[['old', 'new']]
+    timings['speedup'] = timings['old'] / timings['new']
+
+    print(
+        f'{n_samples} chemicals, {predictions.shape[1]} features '
+        f'(best of {n_repeats}, seconds)'
+        )
+    print(timings.round(4).to_string())
+    return timings
+#endregion
+
+#region: make_synthetic_batch
+def make_synthetic_batch(n_samples, n_models, seed=0):
+    '''
+    Generate a synthetic batch of OPERA output, as returned by 
+    `opera._load_model_data_from_csv_files()`.
+
+    Returns
+    -------
+    data_for_model : dict
+        Mapping of model names to the data (pandas.DataFrame).
+    columns_for_model : dict
+        Mapping of model names to the feature columns.
+    '''
+    rng = np.random.default_rng(seed)
+    index = pd.Index(
+        [f'DTXSID{i:09d}' for i in range(n_samples)], name='MoleculeID')
+
+    data_for_model, columns_for_model = {}, {}  # initialize
+    for i in range(n_models):
+        model_name = f'Model{i}'
+        features = [f'{model_name}{suffix}_pred' for suffix in ('a', 'b')]
+        data = {feature : rng.normal(size=n_samples) for feature in features}
+        if i % 2 == 0:
+            # All features share a pair of ADs
+            data[f'AD_{model_name}'] = rng.integers(0, 2, n_samples)
+            data[f'AD_index_{model_name}'] = rng.random(n_samples)
+        else:
+            # Each feature has its own pair of ADs
+            for feature in features:
+                name = feature.strip('_pred')
+                data[f'AD_{name}'] = rng.integers(0, 2, n_samples)
+                data[f'AD_index_{name}'] = rng.random(n_samples)
+        data_for_model[model_name] = pd.DataFrame(data, index=index)
+        columns_for_model[model_name] = features
+
+    return data_for_model, columns_for_model
+#endregion
+
+#region: _time
+def _time(function, n_repeats, *args):
+    '''
+    Helper function to get the result and best time of a function call.
+    '''
+    best_time = np.inf
+    for _ in range(n_repeats):
+        start = time.perf_counter()
+        result = function(*args)
+        best_time = min(best_time, time.perf_counter() - start)
+    return result, best_time
+#endregion
+
+#region: _legacy_app_domains_from_model_data
+def _legacy_app_domains_from_model_data(data_for_model, columns_for_model):
+    '''
+    Previous implementation of `opera._app_domains_from_model_data()`, which 
+    builds the AD flags one feature at a time.
+    '''
+    AD_flags = {}   # initialize
+
+    for model_name, model_data in data_for_model.items():
+        where_ADs = model_data.columns.str.contains('^AD_')
+        ADs = model_data.loc[:, where_ADs]
+        
+        feature_columns = columns_for_model[model_name]
+        if list(ADs):
+            N_ADs = len(ADs.columns)
+            if N_ADs == 2: 
+                for feature in feature_columns:
+                    AD_flags[feature] = (
+                        opera.is_outside_applicability_domain(ADs)
+                        )
+            elif N_ADs//2 == len(feature_columns):
+                for feature in feature_columns:
+                    where_feature_ADs = ADs.columns.str.contains(
+                        feature.strip('_pred'))
+                    feature_specific_ADs = ADs.loc[:, where_feature_ADs]
+                    AD_flags[feature] = (
+                        opera.is_outside_applicability_domain(
+                            feature_specific_ADs)
+                        )
+
+    AD_flags = pd.DataFrame(AD_flags)
+
+    original_columns = [
+        c for c in opera.get_original_columns(columns_for_model) 
+        if c in AD_flags
+        ]
+    return AD_flags[original_columns]
+#endregion
+
+#region: _legacy_set_unreliable_values
+def _legacy_set_unreliable_values(predictions, AD_flags):
+    '''
+    Previous implementation of `opera.set_unreliable_values()`, which masks 
+    the predictions one feature at a time.
+    '''
+    predictions = predictions.copy()
+
+    shared_features = AD_flags.columns.intersection(predictions.columns)
+    if len(shared_features) != len(AD_flags.columns):
+        raise ValueError('The columns of "AD_flags" must be in "predictions"')
+        
+    for feature in shared_features:
+        where_unreliable = AD_flags[feature]
+        predictions.loc[where_unreliable, feature] = np.NaN    
+
+    return predictions
+#endregion
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--n_samples', type=int, default=1_000_000)
+    parser.add_argument('--n_models', type=int, default=8)
+    parser.add_argument('--n_repeats', type=int, default=3)
+    args = parser.parse_args()
+    main(args.n_samples, args.n_models, args.n_repeats)
@@ -0,0 +1,157 @@
+'''
+This module contains the `DataHandle` class, which provides parallel workers
+with read-only access to the features (X) and target (y) without copying the
+pandas objects into each worker.
+
+The data are dumped once to memory-mapped float64 arrays. When a `DataHandle`
+is passed to parallel workers (e.g., joblib.Parallel or an executor), only 
+the file references and the column names are serialized, and each worker 
+reconstructs the rows of a given fold from the shared arrays.
+
+Example
+-------
+with DataHandle(X, y) as data_handle:
+    results = Parallel(n_jobs=n_jobs)(
+        delayed(fit_and_score)(estimator, data_handle, train_ix, test_ix)
+        for train_ix, test_ix in cv.split(X)
+        )
+'''
+
+import os
+import shutil
+import tempfile
+import numpy as np
+import pandas as pd
+import joblib
+
+#region: DataHandle.__init__
+class DataHandle:
+    '''
+    Memory-mapped, read-only copy of the features (X) and target (y).
+
+    Rows are accessed by position, consistent with the indices returned by
+    the scikit-learn cross-validation splitters.
+
+    Attributes
+    ----------
+    columns : pandas.Index
+        Column names of the features.
+    n_samples : int
+        Number of samples (rows).
+    '''
+    def __init__(self, X, y, temp_folder=None):
+        '''
+        Initialize the DataHandle and dump the data to disk.
+
+        Parameters
+        ----------
+        X : pandas.DataFrame
+            Features data. Values are converted to float64.
+        y : pandas.Series
+            Target data, aligned with X.
+        temp_folder : str, optional
+            Parent directory for the memory-mapped files. Default is the
+            system's temporary directory.
+        '''
+        if len(X) != len(y):
+            raise ValueError('X and y must have the same number of samples')
+
+        self.columns = X.columns
+        self.n_samples = len(X)
+        self._y_name = y.name
+
+        self._temp_folder = tempfile.mkdtemp(
+            prefix='data_handle_',
+            dir=temp_folder
+            )
+        self._X_values = _dump_and_memmap(
+            X.to_numpy(dtype='float64'),
+            os.path.join(self._temp_folder, 'X.joblib')
+            )
+        self._y_values = _dump_and_memmap(
+            y.to_numpy(dtype='float64'),
+            os.path.join(self._temp_folder, 'y.joblib')
+            )
+#endregion
+
+    #region: __getstate__
+    def __getstate__(self):
+        '''
+        Serialize only the file references, e.g., for workers of an executor 
+        without the memory-mapping reducers of joblib.Parallel.
+        '''
+        state = self.__dict__.copy()
+        state['_X_values'] = state['_y_values'] = None
+        return state
+    #endregion
+
+    #region: __setstate__
+    def __setstate__(self, state):
+        '''
+        Restore the instance and memory-map the shared arrays.
+        '''
+        self.__dict__.update(state)
+        self._X_values = joblib.load(
+            os.path.join(self._temp_folder, 'X.joblib'), mmap_mode='r')
+        self._y_values = joblib.load(
+            os.path.join(self._temp_folder, 'y.joblib'), mmap_mode='r')
+    #endregion
+
+    #region: take
+    def take(self, ix):
+        '''
+        Get the features and target for the specified rows.
+
+        Parameters
+        ----------
+        ix : array-like of int
+            Positional indices of the rows, e.g., for the training set of a
+            cross-validation fold.
+
+        Returns
+        -------
+        X : pandas.DataFrame
+            Features with the original columns. The index contains the
+            positional indices.
+        y : pandas.Series
+            Target with the same index as X.
+        '''
+        ix = np.asarray(ix)
+        X = pd.DataFrame(self._X_values[ix], index=ix, columns=self.columns)
+        y = pd.Series(self._y_values[ix], index=ix, name=self._y_name)
+        return X, y
+    #endregion
+
+    #region: close
+    def close(self):
+        '''
+        Delete the memory-mapped files.
+        '''
+        self._X_values = self._y_values = None
+        # NOTE: On Windows, files mapped by a worker cannot be deleted until
+        # the worker releases them. Any leftovers are in the temp folder.
+        shutil.rmtree(self._temp_folder, ignore_errors=True)
+    #endregion
+
+    #region: __enter__
+    def __enter__(self):
+        return self
+    #endregion
+
+    #region: __exit__
+    def __exit__(self, *exc_info):
+        self.close()
+    #endregion
+
+#region: _dump_and_memmap
+def _dump_and_memmap(values, path):
+    '''
+    Helper function to write an array to disk and load it as a read-only
+    memory map.
+
+    joblib serializes such arrays as a reference to the file, so the values
+    are not copied into the workers.
+    '''
+    joblib.dump(values, path)
+    return joblib.load(path, mmap_mode='r')
+#endregion
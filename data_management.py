@@ -1,9 +1,17 @@
 '''
 This module contains the `DataManager` class which manages the loading and 
 handling of features and target data.
+
+Loaded features and targets are cached in memory by a `DataCache`, such that 
+repeated requests for the same data (e.g., across modeling instructions or 
+model keys) do not re-read the input files.
 '''
 
+import os
+from collections import OrderedDict
+import numpy as np
 import pandas as pd 
+import pyarrow.parquet as pq
 
 #region: DataManager.__init__
 class DataManager:
@@ -24,8 +32,22 @@ class DataManager:
         # TODO: Should be private attributes? Check other classes too.
         self.data_settings = data_settings
         self.path_settings = path_settings
+
+        self._cache = DataCache(
+            max_bytes=getattr(data_settings, 'cache_max_bytes', 2**31)
+            )
 #endregion
 
+    #region: __getstate__
+    def __getstate__(self):
+        '''
+        Exclude cached data when pickling, e.g., for parallel workers.
+        '''
+        state = self.__dict__.copy()
+        state['_cache'] = DataCache(max_bytes=self._cache.max_bytes)
+        return state
+    #endregion
+
     #region: load_features_and_target
     def load_features_and_target(
             self, 
@@ -59,17 +81,67 @@ class DataManager:
         tuple
             A tuple containing the loaded features (X) and target (y) as 
             pandas objects with a common index.
+
+        Notes
+        -----
+        The returned data may be shared with the cache and should not be 
+        modified in place. Make a copy if needed.
         '''
-        X = self.load_features(
+        cache_key = (
+            'features_and_target', 
+            features_source, 
+            ld50_type, 
+            data_condition, 
+            target_effect, 
+            None
+            )
+        input_paths = self.get_input_paths(
             features_source=features_source, 
-            ld50_type=ld50_type, 
-            data_condition=data_condition
+            ld50_type=ld50_type
             )
 
-        y = self.load_target(target_effect=target_effect)
+        X_y = self._cache.get(cache_key, input_paths)
+        if X_y is None:
+            X = self.load_features(
+                features_source=features_source, 
+                ld50_type=ld50_type, 
+                data_condition=data_condition
+                )
+
+            y = self.load_target(target_effect=target_effect)
+
+            # Use the intersection of chemicals.
+            X_y = DataManager.with_common_index(X, y)
+            X_y = self._cache.put(cache_key, input_paths, X_y)
+
+        return X_y
+    #endregion
+
+    #region: get_input_paths
+    def get_input_paths(self, *, features_source, ld50_type, **kwargs):
+        '''
+        Get the paths to the input files read by `load_features_and_target`.
+
+        Parameters
+        ----------
+        features_source : str
+            The source of the features data.
+        ld50_type : str
+            Type of LD50 data to be used.
+        **kwargs
+            Collects any unneeded key-value pairs from model_keys.
 
-        # Use the intersection of chemicals.
-        return DataManager.with_common_index(X, y)
+        Returns
+        -------
+        list of str
+        '''
+        paths = [
+            self.path_settings.file_for_features_source[features_source],
+            self.path_settings.surrogate_pods_file
+        ]
+        if self.data_settings.use_experimental_for_ld50[ld50_type]:
+            paths.append(self.path_settings.ld50_experimental_file)
+        return paths
     #endregion
 
     #region: load_features
@@ -108,17 +180,158 @@ class DataManager:
         -------
         pandas.DataFrame
             The loaded features (X) as a DataFrame.
+
+        Notes
+        -----
+        The returned data may be shared with the cache and should not be 
+        modified in place. Make a copy if needed.
+        '''
+        if not exclude_training:
+            target_effect = None  # not needed
+        cache_key = (
+            'features', 
+            features_source, 
+            ld50_type, 
+            data_condition, 
+            target_effect, 
+            exclude_training
+            )
+        input_paths = self.get_input_paths(
+            features_source=features_source, 
+            ld50_type=ld50_type
+            )
+
+        X = self._cache.get(cache_key, input_paths)
+        if X is None:
+            X = self._load_features(
+                features_source, 
+                ld50_type, 
+                data_condition, 
+                exclude_training, 
+                target_effect
+                )
+            X = self._cache.put(cache_key, input_paths, X)
+
+        return X
+    #endregion
+
+    #region: _load_features
+    def _load_features(
+            self, 
+            features_source, 
+            ld50_type, 
+            data_condition, 
+            exclude_training, 
+            target_effect
+            ):
+        '''
+        Helper function to read the features from disk.
+
+        Refer to `DataManager.load_features` for documentation.
         '''
         features_path = (
             self.path_settings.file_for_features_source[features_source]
         )
         X = pd.read_parquet(features_path)
 
+        return self._prepare_features(
+            X, 
+            features_source, 
+            ld50_type, 
+            data_condition, 
+            *self._read_feature_adjustments(
+                ld50_type, exclude_training, target_effect)
+            )
+    #endregion
+
+    #region: iter_features
+    def iter_features(
+            self, 
+            *, 
+            features_source, 
+            ld50_type, 
+            data_condition, 
+            exclude_training=False,
+            target_effect=None,
+            batch_size=100_000,
+            columns=None,
+            **kwargs
+            ):
+        '''
+        Read the features (X) in chunks of rows, e.g., to make predictions 
+        for more chemicals than fit in memory.
+
+        The features file is streamed by row groups. Each chunk is processed 
+        as in `DataManager.load_features`, so that the concatenated chunks 
+        are equal to the loaded features.
+
+        Parameters
+        ----------
+        features_source, ld50_type, data_condition, exclude_training, 
+        target_effect
+            Refer to `DataManager.load_features` for documentation.
+        batch_size : int, optional
+            Maximum number of rows in each chunk. Default 100,000.
+        columns : list of str, optional
+            Subset of columns to read. Default is None, i.e., all columns.
+        **kwargs
+            Collects any unneeded key-value pairs.
+
+        Yields
+        ------
+        pandas.DataFrame
+            The features for a chunk of chemicals. Chunks may be empty, e.g., 
+            if all of their chemicals were used for training.
+        '''
+        if not exclude_training:
+            target_effect = None  # not needed
+        adjustments = self._read_feature_adjustments(
+            ld50_type, exclude_training, target_effect)
+
+        if columns is not None and adjustments[1] is not None:
+            # Swapped below. Avoid reading the original column
+            ld50_column = (
+                self.data_settings.ld50_pred_column_for_source[features_source])
+            if ld50_column not in columns:
+                columns = list(columns) + [ld50_column]
+
+        features_path = (
+            self.path_settings.file_for_features_source[features_source]
+        )
+        parquet_file = pq.ParquetFile(features_path)
+        for batch in parquet_file.iter_batches(
+                batch_size=batch_size, 
+                columns=columns, 
+                use_pandas_metadata=True
+                ):
+            yield self._prepare_features(
+                batch.to_pandas(), 
+                features_source, 
+                ld50_type, 
+                data_condition, 
+                *adjustments
+                )
+    #endregion
+
+    #region: _read_feature_adjustments
+    def _read_feature_adjustments(
+            self, ld50_type, exclude_training, target_effect):
+        '''
+        Helper function to read the data used to adjust the features.
+
+        Returns
+        -------
+        training_chemicals : pandas.Index or None
+            Chemicals to be excluded. None if not 'exclude_training'.
+        ld50s_experimental : pandas.Series or None
+            Experimental LD50 values. None if not used for the 'ld50_type'.
+        '''
+        training_chemicals = None
         if exclude_training:
-            y = self.load_target(target_effect=target_effect)
-            training_chemicals = set(y.index.intersection(X.index))
-            X = X.drop(training_chemicals)
+            training_chemicals = self.load_target(
+                target_effect=target_effect).index
 
+        ld50s_experimental = None
         if self.data_settings.use_experimental_for_ld50[ld50_type]:
             ld50s_experimental = (
                 pd.read_csv(
@@ -126,6 +339,27 @@ class DataManager:
                     index_col=0)
                     .squeeze()
                     )
+        return training_chemicals, ld50s_experimental
+    #endregion
+
+    #region: _prepare_features
+    def _prepare_features(
+            self, 
+            X, 
+            features_source, 
+            ld50_type, 
+            data_condition, 
+            training_chemicals, 
+            ld50s_experimental
+            ):
+        '''
+        Helper function to exclude training chemicals, swap the LD50 column, 
+        and handle missing values for the features read from disk.
+        '''
+        if training_chemicals is not None:
+            X = X.drop(set(training_chemicals.intersection(X.index)))
+
+        if ld50s_experimental is not None:
             X = DataManager._swap_column(
                 X, 
                 self.data_settings.ld50_pred_column_for_source[features_source], 
@@ -157,8 +391,16 @@ class DataManager:
         pandas.Series
             The loaded target variable (y) as a Series.
         '''
-        ys = pd.read_csv(self.path_settings.surrogate_pods_file, index_col=0)
-        return ys[target_effect].squeeze().dropna()
+        cache_key = ('target', None, None, None, target_effect, None)
+        input_paths = [self.path_settings.surrogate_pods_file]
+
+        y = self._cache.get(cache_key, input_paths)
+        if y is None:
+            ys = pd.read_csv(self.path_settings.surrogate_pods_file, index_col=0)
+            y = ys[target_effect].squeeze().dropna()
+            y = self._cache.put(cache_key, input_paths, y)
+
+        return y
     #endregion
 
     #region: _swap_column
@@ -340,4 +582,187 @@ class DataManager:
         app_chemicals = set(self.load_application_chemicals())
 
         return list(app_chemicals.union(training_chemicals))
-    #endregion
\ No newline at end of file
+    #endregion
+
+#region: DataCache.__init__
+class DataCache:
+    '''
+    In-memory, least-recently-used (LRU) cache for loaded pandas objects.
+
+    Each entry records the modification time and size of the input files from 
+    which it was derived. If any of these files change, the entry is 
+    invalidated upon the next access.
+
+    Cached objects are returned as read-only views where possible. Objects 
+    with a single dtype are backed by a read-only array, and any attempt to 
+    modify them in place raises a ValueError. Objects with mixed dtypes are 
+    returned as copies.
+    '''
+    def __init__(self, max_bytes=2**31):
+        '''
+        Initialize the DataCache.
+
+        Parameters
+        ----------
+        max_bytes : int, optional
+            Memory cap for all cached objects. The least-recently-used entries 
+            are evicted to stay below this limit. Default is 2 GiB. Use 0 to 
+            disable caching.
+        '''
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._total_bytes = 0
+#endregion
+
+    #region: get
+    def get(self, key, input_paths):
+        '''
+        Get the cached objects for the key, if available and current.
+
+        Parameters
+        ----------
+        key : tuple
+            Key identifying the cached objects.
+        input_paths : list of str
+            Paths to the input files from which the objects were derived.
+
+        Returns
+        -------
+        object or None
+            A view of the cached pandas object (or a list of them), or None if 
+            the key is not cached or the input files have changed.
+        '''
+        if key not in self._entries:
+            return None
+
+        file_stats, objects, nbytes = self._entries[key]
+        if file_stats != _get_file_stats(input_paths):
+            self._evict(key)
+            return None
+
+        self._entries.move_to_end(key)  # most recently used
+        return _map_objects(_view, objects)
+    #endregion
+
+    #region: put
+    def put(self, key, input_paths, objects):
+        '''
+        Cache the objects and return a view of them.
+
+        Parameters
+        ----------
+        key : tuple
+            Key identifying the cached objects.
+        input_paths : list of str
+            Paths to the input files from which the objects were derived.
+        objects : pandas.DataFrame, pandas.Series, or list of them
+            The objects to be cached.
+
+        Returns
+        -------
+        object
+            A view of the cached objects, as returned by `DataCache.get`.
+        '''
+        objects = _map_objects(_to_read_only, objects)
+        nbytes = sum(_map_objects(_memory_usage, objects, as_list=True))
+
+        if key in self._entries:
+            self._evict(key)
+        if nbytes <= self.max_bytes:
+            file_stats = _get_file_stats(input_paths)
+            self._entries[key] = (file_stats, objects, nbytes)
+            self._total_bytes += nbytes
+
+            # Evict the least-recently-used entries, if needed
+            while self._total_bytes > self.max_bytes:
+                self._evict(next(iter(self._entries)))
+
+        return _map_objects(_view, objects)
+    #endregion
+
+    #region: clear
+    def clear(self):
+        '''
+        Remove all entries from the cache.
+        '''
+        self._entries.clear()
+        self._total_bytes = 0
+    #endregion
+
+    #region: _evict
+    def _evict(self, key):
+        '''
+        Helper function to remove an entry from the cache.
+        '''
+        _, _, nbytes = self._entries.pop(key)
+        self._total_bytes -= nbytes
+    #endregion
+
+#region: _get_file_stats
+def _get_file_stats(paths):
+    '''
+    Helper function to get the modification time and size of each file.
+    '''
+    stats = []
+    for path in paths:
+        stat_result = os.stat(path)
+        stats.append((path, stat_result.st_mtime_ns, stat_result.st_size))
+    return tuple(stats)
+#endregion
+
+#region: _map_objects
+def _map_objects(function, objects, as_list=False):
+    '''
+    Helper function to apply a function to a pandas object or to each object 
+    in a list/tuple of them.
+    '''
+    if isinstance(objects, (list, tuple)):
+        return [function(obj) for obj in objects]
+    return [function(objects)] if as_list else function(objects)
+#endregion
+
+#region: _to_read_only
+def _to_read_only(obj):
+    '''
+    Helper function to rebuild a pandas object on a read-only array.
+
+    Objects with mixed dtypes are returned unchanged.
+    '''
+    if isinstance(obj, pd.DataFrame):
+        if obj.dtypes.nunique() != 1:
+            return obj
+        values = obj.to_numpy(copy=True)
+        values.flags.writeable = False
+        return pd.DataFrame(
+            values, 
+            index=obj.index, 
+            columns=obj.columns, 
+            copy=False
+            )
+    else:
+        values = obj.to_numpy(copy=True)
+        values.flags.writeable = False
+        return pd.Series(values, index=obj.index, name=obj.name, copy=False)
+#endregion
+
+#region: _view
+def _view(obj):
+    '''
+    Helper function to get a view of a cached pandas object.
+
+    The view shares the underlying (read-only) data, but adding or replacing 
+    columns does not affect the cached object. Objects which are not backed 
+    by a read-only array are copied.
+    '''
+    if isinstance(obj, pd.DataFrame) and obj.dtypes.nunique() != 1:
+        return obj.copy()
+    return obj.copy(deep=False)
+#endregion
+
+#region: _memory_usage
+def _memory_usage(obj):
+    '''
+    Helper function to get the memory usage (bytes) of a pandas object.
+    '''
+    return int(np.sum(obj.memory_usage(deep=True)))
+#endregion
@@ -17,27 +17,44 @@ import pandas as pd
 import numpy as np 
 from sklearn.model_selection import RepeatedKFold
 from sklearn.inspection import permutation_importance
+from sklearn.metrics import get_scorer
+from sklearn.pipeline import Pipeline
+from sklearn.utils import Bunch, check_random_state
 from joblib import Parallel, delayed
 
+from data_handle import DataHandle
+from fit_cache import fit_estimator
+import adaptive_repeats
+import profiling
+
 #region: FeatureSelector.__init__
 class FeatureSelector:
     '''
     A class to select important features using permutation importances and 
     repeated k-fold cross-validation.
     '''
-    def __init__(self, feature_selection_settings, n_jobs=None):
+    def __init__(
+            self, feature_selection_settings, n_jobs=None, fit_cache=None):
         '''
         Initialize the FeatureSelector class with model settings.
 
         Parameters
         ----------
         feature_selection_settings : SimpleNamespace
-            Configuration settings for feature selection.
+            Configuration settings for feature selection. If 
+            'adaptive_repeats' is True, 'n_repeats_select' is the maximum 
+            number of repeats. Repeats are then added until the fraction of 
+            the top 'n_features' that changed is at most 'ranking_tolerance' 
+            (default 0.).
         n_jobs : int, optional
             See joblib.Parallel for reference.
+        fit_cache : FitCache, optional
+            If specified, identical fits are reused across folds and 
+            estimators.
         '''
         self.feature_selection_settings = feature_selection_settings
         self._n_jobs = n_jobs
+        self._fit_cache = fit_cache
 #endregion
 
     #region: nested_feature_selection
@@ -102,53 +119,206 @@ class FeatureSelector:
         importances_for_metric : pandas.DataFrame
             Dataframe containing feature importances, with metrics as columns 
             and features as rows.
+
+        Notes
+        -----
+        Recorded as the 'feature_selection' stage of the active profiler, if 
+        any (see profiling.py).
+        '''
+        with profiling.stage('feature_selection'):
+            return self._permutation_importances(estimator, X_train, y_train)
+    #endregion
+
+    #region: _permutation_importances
+    def _permutation_importances(self, estimator, X_train, y_train):
+        '''
+        Helper method for `permutation_importances()`.
         '''
-        # Initialize the inner cross-validation loop for feature selection.
+        splits_for_repeat = self.inner_splits(len(X_train))
+
+        # Workers receive only a handle to the shared data and fold indices.
+        dicts_of_bunch_objs = []  # initialize
+        top_features = None
+        with DataHandle(X_train, y_train) as data_handle:
+            for start, stop in self.iter_repeat_batches():
+                for result, task_stats in Parallel(n_jobs=self._n_jobs)(
+                        delayed(profiling.call_counted)(
+                            self.permutation_importance_wrapper, 
+                            estimator,
+                            data_handle, 
+                            train_ix, 
+                            test_ix
+                            ) for splits in splits_for_repeat[start:stop]
+                            for train_ix, test_ix in splits
+                        ):
+                    dicts_of_bunch_objs.append(result)
+                    profiling.add_task_stats(task_stats)
+                if not self.is_adaptive:
+                    continue
+                converged, top_features = self.has_converged(
+                    dicts_of_bunch_objs, list(X_train), top_features)
+                if converged:
+                    break
+
+        importances_for_metric = self.unpack_importances(
+            dicts_of_bunch_objs, list(X_train))
+
+        return estimator, importances_for_metric
+    #endregion
+
+    #region: inner_splits
+    def inner_splits(self, n_samples):
+        '''
+        Generate the train/test splits of the inner cross-validation for the 
+        feature selection, grouped by repeat.
+
+        Parameters
+        ----------
+        n_samples : int
+            Number of training samples.
+
+        Returns
+        -------
+        list of list of tuple
+            Train and test indices (positions within the training set) of 
+            each fold, for each repeat.
+        '''
+        settings = self.feature_selection_settings
         rkf_inner = RepeatedKFold(
-            n_splits=self.feature_selection_settings.n_splits_select, 
-            n_repeats=self.feature_selection_settings.n_repeats_select, 
-            random_state=self.feature_selection_settings.random_state_select
+            n_splits=settings.n_splits_select, 
+            n_repeats=settings.n_repeats_select, 
+            random_state=settings.random_state_select
             )
+        splits = rkf_inner.split(np.empty((n_samples, 0)))
+        return adaptive_repeats.split_by_repeat(
+            list(splits), settings.n_splits_select)
+    #endregion
+
+    #region: iter_repeat_batches
+    def iter_repeat_batches(self):
+        '''
+        Generate the ranges of repeats of the inner cross-validation to be 
+        evaluated at each step.
 
-        dicts_of_bunch_objs = Parallel(n_jobs=self._n_jobs)(
-            delayed(self.permutation_importance_wrapper)(
-                estimator,
-                X_train, 
-                y_train, 
-                train_ix, 
-                test_ix
-                ) for train_ix, test_ix in rkf_inner.split(X_train)
+        See Also
+        --------
+        adaptive_repeats.iter_repeat_batches()
+        '''
+        settings = self.feature_selection_settings
+        min_repeats = None
+        if self.is_adaptive:
+            min_repeats = getattr(settings, 'min_repeats_select', 2)
+        return adaptive_repeats.iter_repeat_batches(
+            settings.n_repeats_select, 
+            min_repeats=min_repeats, 
+            repeats_per_step=getattr(settings, 'repeats_per_step_select', 1)
             )
-        
-        # Initialize a container for the final results.
-        importances_for_metric = {}
-        # Unpack the raw importance scores from the Bunch objects.
-        for metric in self.feature_selection_settings.scoring:
-            importances = np.concatenate(
-                [d[metric].importances for d in dicts_of_bunch_objs], 
-                axis=1).T
-            importances_for_metric[metric] = pd.DataFrame(
-                importances, columns=list(X_train))
-        importances_for_metric = pd.concat(importances_for_metric, axis=1)
-        importances_for_metric.columns.names = ['scoring', 'feature']
+    #endregion
 
-        return estimator, importances_for_metric
+    #region: has_converged
+    def has_converged(
+            self, dicts_of_bunch_objs, feature_names, previous_top_features):
+        '''
+        Check whether the ranking of the top features is stable in the 
+        adaptive mode.
+
+        Parameters
+        ----------
+        dicts_of_bunch_objs : list of dict
+            Results of `permutation_importance_wrapper()` so far.
+        feature_names : list of str
+        previous_top_features : list of str or None
+            Top features before the last batch of repeats, if any.
+
+        Returns
+        -------
+        converged : bool
+            True if the fraction of top features that changed is at most 
+            'ranking_tolerance' (default 0.).
+        top_features : list of str
+        '''
+        settings = self.feature_selection_settings
+        top_features = FeatureSelector.select_features(
+            self.unpack_importances(dicts_of_bunch_objs, feature_names), 
+            settings.criterion_metric, 
+            settings.n_features
+            )
+        converged = (
+            previous_top_features is not None 
+            and adaptive_repeats.ranking_instability(
+                previous_top_features, top_features) 
+            <= getattr(settings, 'ranking_tolerance', 0.)
+        )
+        return converged, top_features
+    #endregion
+
+    #region: unpack_importances
+    def unpack_importances(self, dicts_of_bunch_objs, feature_names):
+        '''
+        Unpack the raw importance scores from the results of 
+        `permutation_importance_wrapper()`.
+
+        Returns
+        -------
+        pandas.DataFrame
+            Feature importances, with metrics and features as columns.
+        '''
+        return _unpack_importances(
+            dicts_of_bunch_objs, 
+            self.feature_selection_settings, 
+            feature_names
+            )
+    #endregion
+
+    #region: is_adaptive
+    @property
+    def is_adaptive(self):
+        '''
+        Whether the number of repeats is adaptive.
+        '''
+        return getattr(
+            self.feature_selection_settings, 'adaptive_repeats', False)
+    #endregion
+
+    #region: count_repeats
+    def count_repeats(self, importances):
+        '''
+        Get the number of repeats of the cross-validation used to compute the 
+        importances.
+
+        Parameters
+        ----------
+        importances : pandas.DataFrame
+            Output of `permutation_importances()`.
+
+        Returns
+        -------
+        int
+        '''
+        n_rows_per_repeat = (
+            self.feature_selection_settings.n_splits_select 
+            * self.feature_selection_settings.n_repeats_perm
+        )
+        return len(importances) // n_rows_per_repeat
     #endregion
 
     #region: permutation_importance_wrapper
     def permutation_importance_wrapper(
-            self, estimator, X_train, y_train, train_ix, test_ix):
+            self, estimator, data_handle, train_ix, test_ix):
         '''
         Execute the permutation_importance algorithm for one fold.
 
+        The algorithm is set by 'importance_backend' in the feature selection 
+        settings: 'sklearn' (default) for 
+        sklearn.inspection.permutation_importance(), or 'stacked' for 
+        `stacked_permutation_importance()`.
+
         Parameters
         ----------
         estimator : object
             A scikit-learn estimator object with fit and predict methods.
-        X_train : pandas.DataFrame
-            Training feature data.
-        y_train : pandas.Series
-            Training target data.
+        data_handle : DataHandle
+            Shared (memory-mapped) training features and target data.
         train_ix : array-like
             Indices for the training set in the current fold.
         test_ix : array-like
@@ -159,13 +329,28 @@ class FeatureSelector:
         result : object
             A Bunch object containing the permutation importances.
         '''
-        X_train_inner = X_train.iloc[train_ix, :]
-        X_test_inner = X_train.iloc[test_ix, :]
-        y_train_inner = y_train.iloc[train_ix]
-        y_test_inner = y_train.iloc[test_ix]
+        X_train_inner, y_train_inner = data_handle.take(train_ix)
+        X_test_inner, y_test_inner = data_handle.take(test_ix)
 
-        estimator.fit(X_train_inner, y_train_inner)
+        fit_estimator(
+            estimator, X_train_inner, y_train_inner, self._fit_cache)
 
+        backend = getattr(
+            self.feature_selection_settings, 'importance_backend', 'sklearn')
+        if backend == 'stacked':
+            return stacked_permutation_importance(
+                estimator, 
+                X_test_inner, 
+                y_test_inner, 
+                scoring=self.feature_selection_settings.scoring, 
+                n_repeats=self.feature_selection_settings.n_repeats_perm, 
+                random_state=self.feature_selection_settings.random_state_perm
+                )
+        elif backend != 'sklearn':
+            raise ValueError(f'Invalid importance_backend: {backend}')
+
+        _count_permuted_predicts(
+            X_test_inner, self.feature_selection_settings.n_repeats_perm)
         return permutation_importance(
             estimator, 
             X_test_inner, 
@@ -205,4 +390,224 @@ class FeatureSelector:
             .index
         )
         return list(features_greatest_to_least)[:n_features]
-    #endregion
\ No newline at end of file
+    #endregion
+
+#region: _unpack_importances
+def _unpack_importances(dicts_of_bunch_objs, settings, feature_names):
+    '''
+    Helper function to unpack the raw importance scores from the Bunch 
+    objects.
+
+    Returns
+    -------
+    pandas.DataFrame
+        Feature importances, with metrics and features as columns.
+    '''
+    # Initialize a container for the final results.
+    importances_for_metric = {}
+    for metric in settings.scoring:
+        importances = np.concatenate(
+            [d[metric].importances for d in dicts_of_bunch_objs], 
+            axis=1).T
+        importances_for_metric[metric] = pd.DataFrame(
+            importances, columns=list(feature_names))
+    importances_for_metric = pd.concat(importances_for_metric, axis=1)
+    importances_for_metric.columns.names = ['scoring', 'feature']
+    return importances_for_metric
+#endregion
+
+#region: stacked_permutation_importance
+def stacked_permutation_importance(
+        estimator, 
+        X, 
+        y, 
+        scoring, 
+        n_repeats=5, 
+        random_state=None
+        ):
+    '''
+    Compute permutation importances with a single prediction call.
+
+    Equivalent to sklearn.inspection.permutation_importance(), but X is 
+    transformed through the preprocessing steps of the Pipeline only once. 
+    All permuted copies of the transformed X are then stacked and predicted 
+    by the final estimator in a single call, and each metric is scored for 
+    all copies at once.
+
+    The permutations are identical to those of scikit-learn for the same 
+    'random_state'. Importances are identical up to floating-point rounding.
+
+    Parameters
+    ----------
+    estimator : object
+        A fitted scikit-learn estimator or Pipeline.
+    X : pandas.DataFrame
+        Data on which permutation importance will be computed.
+    y : pandas.Series
+        Target data.
+    scoring : list of str
+        Names of scikit-learn scorers, e.g., 'r2'.
+    n_repeats : int, optional
+        Number of times to permute each feature.
+    random_state : int, RandomState instance, or None, optional
+
+    Returns
+    -------
+    dict
+        Mapping of each scorer name to a Bunch object with the attributes 
+        importances_mean, importances_std, and importances, as returned by 
+        sklearn.inspection.permutation_importance().
+
+    Notes
+    -----
+    The preprocessing steps must transform each feature independently of the 
+    others and return a pandas.DataFrame with the original feature names, as 
+    do the preprocessors of the PipelineBuilder. Features may be dropped 
+    (e.g., by MissingValuesSelector), in which case their importances are 
+    zero. Otherwise, or if a scorer is not based on predict(), this function 
+    falls back to sklearn.inspection.permutation_importance().
+
+    The stacked copies require memory proportional to the number of features 
+    times 'n_repeats' times the size of X.
+    '''
+    scorer_for_name = {name : get_scorer(name) for name in scoring}
+
+    if isinstance(estimator, Pipeline):
+        preprocessor, final_estimator = estimator[:-1], estimator[-1]
+        X_transformed = preprocessor.transform(X)
+    else:
+        final_estimator, X_transformed = estimator, X
+
+    if not _is_stackable(X, X_transformed, scorer_for_name.values()):
+        _count_permuted_predicts(X, n_repeats)
+        return permutation_importance(
+            estimator, 
+            X, 
+            y, 
+            scoring=scoring, 
+            n_repeats=n_repeats, 
+            n_jobs=1, 
+            random_state=random_state
+            )
+
+    # Same random seed as in scikit-learn
+    random_state = check_random_state(random_state)
+    random_seed = random_state.randint(np.iinfo(np.int32).max + 1)
+    permutations = _get_permutations(len(X), n_repeats, random_seed)
+
+    # Build the stacked copies: the original, then each (feature, repeat)
+    columns = list(X_transformed.columns)
+    permuted_features = [f for f in X.columns if f in columns]
+    values = X_transformed.to_numpy()
+    n_samples = len(values)
+    n_copies = 1 + len(permuted_features) * n_repeats
+    X_stacked = np.tile(values, (n_copies, 1))
+    copy = 1
+    for feature in permuted_features:
+        j = columns.index(feature)
+        for permutation in permutations:
+            start = copy * n_samples
+            X_stacked[start:start+n_samples, j] = values[permutation, j]
+            copy += 1
+    X_stacked = pd.DataFrame(X_stacked, columns=X_transformed.columns)
+
+    y_pred = final_estimator.predict(X_stacked)
+    profiling.count('n_predicts')
+    # One column per copy. Column-major for consistency with scikit-learn's 
+    # per-output reductions
+    y_pred = np.asfortranarray(y_pred.reshape(n_copies, n_samples).T)
+    y_true = np.broadcast_to(
+        np.asarray(y).reshape(-1, 1), 
+        (n_samples, n_copies)
+        )
+
+    importances_for_scorer = {}  # initialize
+    for name, scorer in scorer_for_name.items():
+        scores = _score_columns(scorer, y_true, y_pred)
+        baseline_score, permuted_scores = scores[0], scores[1:]
+        importances = np.zeros((X.shape[1], n_repeats))
+        where_permuted = [f in columns for f in X.columns]
+        importances[where_permuted] = (
+            baseline_score - permuted_scores.reshape(-1, n_repeats))
+        importances_for_scorer[name] = Bunch(
+            importances_mean=np.mean(importances, axis=1),
+            importances_std=np.std(importances, axis=1),
+            importances=importances
+            )
+
+    return importances_for_scorer
+#endregion
+
+#region: _count_permuted_predicts
+def _count_permuted_predicts(X, n_repeats):
+    '''
+    Helper function to count the calls to predict() by 
+    sklearn.inspection.permutation_importance(), i.e., one for the original X 
+    and one for each permuted copy.
+    '''
+    profiling.count('n_predicts', 1 + X.shape[1]*n_repeats)
+#endregion
+
+#region: _is_stackable
+def _is_stackable(X, X_transformed, scorers):
+    '''
+    Helper function to check the requirements of 
+    `stacked_permutation_importance()`.
+    '''
+    return (
+        isinstance(X_transformed, pd.DataFrame)
+        and X_transformed.columns.isin(X.columns).all()
+        and not X_transformed.columns.duplicated().any()
+        and all(hasattr(scorer, '_score_func') for scorer in scorers)
+        and all(type(scorer).__name__ == '_PredictScorer' for scorer in scorers)
+    )
+#endregion
+
+#region: _get_permutations
+def _get_permutations(n_samples, n_repeats, random_seed):
+    '''
+    Helper function to get the row indices of a feature after each repeat.
+
+    Follows scikit-learn, where the shuffled indices of each repeat are 
+    applied to the feature as permuted in the previous repeat.
+
+    Returns
+    -------
+    list of numpy.ndarray
+        Indices into the original rows, one array per repeat.
+    '''
+    random_state = check_random_state(random_seed)
+    shuffling_ix = np.arange(n_samples)
+    current_ix = np.arange(n_samples)
+    permutations = []  # initialize
+    for _ in range(n_repeats):
+        random_state.shuffle(shuffling_ix)
+        current_ix = current_ix[shuffling_ix]
+        permutations.append(current_ix)
+    return permutations
+#endregion
+
+#region: _score_columns
+def _score_columns(scorer, y_true, y_pred):
+    '''
+    Helper function to score each column of the predictions.
+
+    The metric is evaluated for all columns at once if it supports 
+    multioutput='raw_values'. Otherwise, columns are scored one by one.
+
+    Returns
+    -------
+    numpy.ndarray
+        One score per column.
+    '''
+    score_func, sign, kwargs = scorer._score_func, scorer._sign, scorer._kwargs
+    try:
+        scores = score_func(
+            y_true, y_pred, multioutput='raw_values', **kwargs)
+    except TypeError:
+        scores = [
+            score_func(y_true[:, k], y_pred[:, k], **kwargs) 
+            for k in range(y_pred.shape[1])
+            ]
+    return sign * np.asarray(scores, dtype='float64')
+#endregion
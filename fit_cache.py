@@ -0,0 +1,327 @@
+'''
+This module contains the `FitCache` class, which avoids repeating identical
+fits across cross-validation folds, replicates, and estimators.
+
+Two types of fits are reused:
+    1. Preprocessing steps of a Pipeline (e.g., PowerTransformer,
+    MedianScaler). Each step is memoized on disk, keyed by its parameters and
+    the training data (rows and columns), as with the 'memory' parameter of
+    sklearn.pipeline.Pipeline.
+    2. Random forests (optional). A forest is keyed by its parameters except
+    'n_estimators', the training data, and the state of its random number
+    generator. A cached forest with more trees is truncated, and one with
+    fewer trees is grown incrementally with 'warm_start'. The results are
+    identical to those of a new fit.
+
+The cache is on disk, so that it is shared by the parallel workers.
+
+Example
+-------
+fit_cache = FitCache('Cache', warm_start_forests=True)
+estimator = fit_estimator(estimator, X_train, y_train, fit_cache)
+'''
+
+import os
+import tempfile
+import numpy as np
+import joblib
+from sklearn.base import clone
+from sklearn.pipeline import Pipeline
+from sklearn.ensemble import (
+    RandomForestRegressor,
+    RandomForestClassifier,
+    ExtraTreesRegressor,
+    ExtraTreesClassifier
+)
+
+import profiling
+
+# Forests for which 'warm_start' gives the same trees as a new fit
+FOREST_CLASSES = (
+    RandomForestRegressor,
+    RandomForestClassifier,
+    ExtraTreesRegressor,
+    ExtraTreesClassifier
+)
+
+# Upper bound of the random seeds drawn by the forests for their trees
+MAX_INT = np.iinfo(np.int32).max
+
+# Parameters that do not affect the fitted trees
+PARAMS_TO_IGNORE = ('n_estimators', 'random_state', 'warm_start', 'n_jobs',
+                    'verbose')
+
+#region: fit_estimator
+def fit_estimator(estimator, X, y, fit_cache=None):
+    '''
+    Fit the estimator, reusing any identical fits if a cache is specified.
+
+    Parameters
+    ----------
+    estimator : object
+        A scikit-learn estimator or Pipeline.
+    X : pandas.DataFrame
+        Training features data.
+    y : pandas.Series
+        Training target data.
+    fit_cache : FitCache, optional
+        If None, the estimator is simply fitted.
+
+    Returns
+    -------
+    object
+        The fitted estimator.
+    '''
+    profiling.count('n_fits')
+    if fit_cache is None:
+        return estimator.fit(X, y)
+    return fit_cache.fit(estimator, X, y)
+#endregion
+
+#region: FitCache.__init__
+class FitCache:
+    '''
+    Disk-backed memoization of fitted preprocessing steps and forests.
+
+    Attributes
+    ----------
+    location : str
+        Path to the cache directory.
+    warm_start_forests : bool
+        Whether random forests are cached and grown incrementally.
+    '''
+    def __init__(self, location, warm_start_forests=False):
+        '''
+        Initialize the FitCache.
+
+        Parameters
+        ----------
+        location : str
+            Path to the cache directory. Created if it does not exist.
+        warm_start_forests : bool, optional
+            Whether random forests are cached and grown incrementally. Default
+            False. Forests can be large on disk.
+
+        Notes
+        -----
+        The cache does not detect changes to the source code of the
+        transformers (e.g., transform.py). The directory should be cleared
+        after any such change.
+        '''
+        self.location = location
+        self.warm_start_forests = warm_start_forests
+        self._memory = joblib.Memory(location, verbose=0)
+        self._fit_transform_cached = self._memory.cache(_fit_transform)
+#endregion
+
+    #region: fit
+    def fit(self, estimator, X, y):
+        '''
+        Fit the estimator, reusing any identical fits.
+
+        Each preprocessing step of a Pipeline is replaced by its fitted
+        (possibly cached) clone, as in sklearn.pipeline.Pipeline.fit() with
+        the 'memory' parameter.
+
+        Parameters
+        ----------
+        estimator : object
+            A scikit-learn estimator or Pipeline.
+        X : pandas.DataFrame
+        y : pandas.Series
+
+        Returns
+        -------
+        object
+            The fitted estimator.
+        '''
+        X_transformed = X
+        if isinstance(estimator, Pipeline):
+            for i, (name, transformer) in enumerate(estimator.steps[:-1]):
+                if transformer is None or transformer == 'passthrough':
+                    continue
+                X_transformed, fitted_transformer = self._fit_transform_cached(
+                    clone(transformer), X_transformed, y)
+                estimator.steps[i] = (name, fitted_transformer)
+            final_estimator = estimator.steps[-1][1]
+        else:
+            final_estimator = estimator
+
+        if (self.warm_start_forests
+                and isinstance(final_estimator, FOREST_CLASSES)):
+            self._fit_forest(final_estimator, X_transformed, y)
+        elif final_estimator is not None and final_estimator != 'passthrough':
+            final_estimator.fit(X_transformed, y)
+
+        return estimator
+    #endregion
+
+    #region: _fit_forest
+    def _fit_forest(self, forest, X, y):
+        '''
+        Fit a forest, reusing a cached forest fitted on the same data.
+
+        The random number generator of the forest is left in the same state
+        as after a new fit, so that subsequent fits are unaffected.
+        '''
+        key = _get_forest_key(forest, X, y)
+        if key is None:
+            # Not reproducible
+            return forest.fit(X, y)
+
+        forest_path = os.path.join(self.location, 'forests', f'{key}.joblib')
+        cached_forest = _load_if_exists(forest_path)
+        n_estimators = forest.n_estimators
+
+        if cached_forest is None:
+            forest.fit(X, y)
+            _dump_atomic(forest, forest_path)
+            return forest
+
+        n_cached = len(cached_forest.estimators_)
+        if n_cached > n_estimators and forest.oob_score:
+            # The out-of-bag scores would differ
+            return forest.fit(X, y)
+
+        _set_fitted_attributes(forest, cached_forest)
+
+        if n_cached >= n_estimators:
+            forest.estimators_ = forest.estimators_[:n_estimators]
+            if isinstance(forest.random_state, np.random.RandomState):
+                # Draw the seeds that a new fit would have drawn
+                forest.random_state.randint(MAX_INT, size=n_estimators)
+        else:
+            # The skipped seeds are drawn by scikit-learn
+            warm_start = forest.warm_start
+            forest.warm_start = True
+            try:
+                forest.fit(X, y)
+            finally:
+                forest.warm_start = warm_start
+            _dump_atomic(forest, forest_path)
+
+        return forest
+    #endregion
+
+    #region: clear
+    def clear(self):
+        '''
+        Delete all cached fits.
+        '''
+        self._memory.clear(warn=False)
+        forest_dir = os.path.join(self.location, 'forests')
+        if os.path.isdir(forest_dir):
+            for file_name in os.listdir(forest_dir):
+                os.remove(os.path.join(forest_dir, file_name))
+    #endregion
+
+#region: advance_random_state
+def advance_random_state(estimator):
+    '''
+    Draw the random numbers that a new fit of the estimator would draw from 
+    its random number generator, without fitting it.
+
+    This gives the state of the generator after a fit, e.g., to start the 
+    next of a sequence of fits in another process.
+
+    Parameters
+    ----------
+    estimator : object
+        A scikit-learn estimator or Pipeline. Only the final estimator is 
+        considered.
+
+    Returns
+    -------
+    bool
+        False if the draws are unknown, i.e., the estimator has a 
+        RandomState instance but is not a forest. The generator is then left 
+        unchanged.
+    '''
+    if isinstance(estimator, Pipeline):
+        estimator = estimator.steps[-1][1]
+    random_state = getattr(estimator, 'random_state', None)
+    if not isinstance(random_state, np.random.RandomState):
+        return True  # a fit does not change the random state
+    if isinstance(estimator, FOREST_CLASSES) and not estimator.warm_start:
+        random_state.randint(MAX_INT, size=estimator.n_estimators)
+        return True
+    return False
+#endregion
+
+#region: _fit_transform
+def _fit_transform(transformer, X, y):
+    '''
+    Fit a transformer and transform the training data.
+
+    Memoized by `FitCache`.
+
+    Returns
+    -------
+    X_transformed : pandas.DataFrame
+    transformer : object
+        The fitted transformer.
+    '''
+    X_transformed = transformer.fit_transform(X, y)
+    return X_transformed, transformer
+#endregion
+
+#region: _get_forest_key
+def _get_forest_key(forest, X, y):
+    '''
+    Helper function to get a key identifying the trees of a forest.
+
+    Returns
+    -------
+    str or None
+        None if the forest is not reproducible, i.e., 'random_state' is None.
+    '''
+    random_state = forest.random_state
+    if random_state is None:
+        return None
+    if isinstance(random_state, np.random.RandomState):
+        random_state = random_state.get_state()
+
+    params = {
+        k : v for k, v in forest.get_params(deep=False).items()
+        if k not in PARAMS_TO_IGNORE
+        }
+    return joblib.hash((type(forest).__name__, params, random_state, X, y))
+#endregion
+
+#region: _set_fitted_attributes
+def _set_fitted_attributes(estimator, fitted_estimator):
+    '''
+    Helper function to copy the fitted attributes (ending with an underscore)
+    from one estimator to another.
+    '''
+    for name, value in vars(fitted_estimator).items():
+        if name.endswith('_') and not name.startswith('__'):
+            setattr(estimator, name, value)
+#endregion
+
+#region: _load_if_exists
+def _load_if_exists(path):
+    '''
+    Helper function to load an object with joblib, or None if not found.
+    '''
+    try:
+        return joblib.load(path)
+    except FileNotFoundError:
+        return None
+#endregion
+
+#region: _dump_atomic
+def _dump_atomic(obj, path):
+    '''
+    Helper function to write an object with joblib such that concurrent
+    readers never see an incomplete file.
+    '''
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+
+    with tempfile.NamedTemporaryFile(
+            dir=directory, suffix='.tmp', delete=False) as file:
+        temp_path = file.name
+    joblib.dump(obj, temp_path)
+    os.replace(temp_path, path)
+#endregion
@@ -0,0 +1,310 @@
+'''
+This module contains the `MetadataLog` class, which stores a JSON document
+(e.g., the results metadata or the run manifest) such that it can be updated
+cheaply and concurrently, e.g., from a pool of processes.
+
+The document consists of:
+    1. A base JSON file, e.g., 'metadata.json'. It is only replaced
+    atomically, so that readers never see an incomplete file.
+    2. An append-only log in the JSON Lines format, e.g., 'metadata.jsonl'.
+    Each update appends a single record, which sets the value at a path of
+    keys. The records are applied to the base in order, and the last record
+    for a path wins.
+
+Appending a record is O(1) and needs no lock. On POSIX systems, each record
+is written by a single `write` to a file opened in append mode, so that
+concurrent records are never interleaved. Compaction merges the log into the
+base.
+
+Example
+-------
+metadata = MetadataLog('Results/metadata.json')
+metadata.set(['level_names_for_result', 'performances'], ['metric'])
+metadata.read()['level_names_for_result']
+'''
+
+import os
+import glob
+import json
+import time
+import copy
+import tempfile
+
+#region: MetadataLog.__init__
+class MetadataLog:
+    '''
+    A JSON document with append-only updates.
+
+    Attributes
+    ----------
+    path : str
+        Path to the base JSON file. The log is at the same path with the
+        extension '.jsonl'.
+    '''
+    def __init__(self, path):
+        '''
+        Initialize the MetadataLog.
+
+        Parameters
+        ----------
+        path : str
+            Path to the base JSON file. The files are created upon the first
+            update.
+        '''
+        self.path = path
+        self.log_path = os.path.splitext(path)[0] + '.jsonl'
+
+        # The replayed document, to read only new records on the next read
+        self._cached = None  # (base_stats, log_stats, offset, data)
+#endregion
+
+    #region: __getstate__
+    def __getstate__(self):
+        '''
+        Exclude the replayed document when pickling, e.g., for parallel
+        workers.
+        '''
+        state = self.__dict__.copy()
+        state['_cached'] = None
+        return state
+    #endregion
+
+    #region: set
+    def set(self, keys, value):
+        '''
+        Set the value at a path of keys by appending a record to the log.
+
+        Parameters
+        ----------
+        keys : list of str
+            Path of keys within the document, e.g., ['model_key_names'].
+            Intermediate dictionaries are created as needed.
+        value : object
+            Any JSON-serializable value.
+        '''
+        record = json.dumps({'keys' : list(keys), 'value' : value}) + '\n'
+        _append(self.log_path, record.encode('utf-8'))
+    #endregion
+
+    #region: read
+    def read(self):
+        '''
+        Read the document, i.e., the base with all records applied.
+
+        Only the records appended since the last read are parsed, unless the
+        base was replaced.
+
+        Returns
+        -------
+        dict
+            Empty if no files exist.
+        '''
+        for _ in range(3):
+            base_stats = _get_file_stats(self.path)
+            rotated_paths = self._get_rotated_paths()
+
+            if (self._cached is not None
+                    and self._cached[0] == base_stats
+                    and not rotated_paths):
+                data, offset = self._cached[3], self._cached[2]
+                if _get_file_stats(self.log_path, inode_only=True) != (
+                        self._cached[1]):
+                    offset = 0  # new log
+            else:
+                data = _read_json(self.path)
+                for rotated_path in rotated_paths:
+                    _apply_records(data, rotated_path, 0)
+                offset = 0
+            offset = _apply_records(data, self.log_path, offset)
+
+            if _get_file_stats(self.path) == base_stats:
+                break
+            # The base was replaced while reading. Try again
+            self._cached = None
+
+        if not rotated_paths:
+            log_stats = _get_file_stats(self.log_path, inode_only=True)
+            self._cached = (base_stats, log_stats, offset, data)
+        return copy.deepcopy(data)
+    #endregion
+
+    #region: replace
+    def replace(self, data):
+        '''
+        Replace the whole document.
+
+        Parameters
+        ----------
+        data : dict
+            JSON-serializable document.
+
+        Notes
+        -----
+        Records appended concurrently may be lost. Use `set()` for updates.
+        '''
+        rotated_path = self._rotate_log()
+        write_json_atomic(data, self.path)
+        if rotated_path is not None:
+            os.remove(rotated_path)
+    #endregion
+
+    #region: compact
+    def compact(self):
+        '''
+        Merge the log into the base file.
+
+        The log is first renamed, such that subsequent records go to a new
+        log. The merged base then atomically replaces the old base, and the
+        renamed log is deleted. Readers apply the base, any renamed logs, and
+        the current log in this order, so that they see all records at any
+        time. Applying a record twice has no effect.
+
+        Notes
+        -----
+        Records are appended by a single write to a file which is opened just
+        before. A record written exactly while the log is renamed could be
+        lost, so compaction is best done while no process is writing, e.g.,
+        at the end of a run.
+        '''
+        self._rotate_log()
+
+        data = _read_json(self.path)
+        rotated_paths = self._get_rotated_paths()
+        for rotated_path in rotated_paths:
+            _apply_records(data, rotated_path, 0)
+        write_json_atomic(data, self.path)
+
+        for rotated_path in rotated_paths:
+            os.remove(rotated_path)
+        self._cached = None
+    #endregion
+
+    #region: _rotate_log
+    def _rotate_log(self):
+        '''
+        Rename the current log, if any, with a sortable suffix.
+
+        Returns
+        -------
+        str or None
+            Path to the renamed log.
+        '''
+        rotated_path = f'{self.log_path}.{time.time_ns():020d}.compacting'
+        try:
+            os.replace(self.log_path, rotated_path)
+        except FileNotFoundError:
+            return None
+        return rotated_path
+    #endregion
+
+    #region: _get_rotated_paths
+    def _get_rotated_paths(self):
+        '''
+        Get the paths to any renamed logs not yet merged, oldest first.
+        '''
+        return sorted(glob.glob(glob.escape(self.log_path) + '.*.compacting'))
+    #endregion
+
+#region: _append
+def _append(path, data):
+    '''
+    Helper function to append bytes to a file with a single write.
+    '''
+    directory = os.path.dirname(path) or '.'
+    os.makedirs(directory, exist_ok=True)
+
+    fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+    try:
+        os.write(fd, data)
+    finally:
+        os.close(fd)
+#endregion
+
+#region: _apply_records
+def _apply_records(data, path, offset):
+    '''
+    Helper function to apply the records of a log to a document in place.
+
+    Parameters
+    ----------
+    data : dict
+    path : str
+        Path to the log. May not exist.
+    offset : int
+        Byte offset at which to start reading.
+
+    Returns
+    -------
+    int
+        Byte offset after the last complete record. Any incomplete record
+        (e.g., being written) is left for the next read.
+    '''
+    try:
+        with open(path, 'rb') as file:
+            file.seek(offset)
+            content = file.read()
+    except FileNotFoundError:
+        return offset
+
+    end = content.rfind(b'\n') + 1
+    for line in content[:end].splitlines():
+        if not line.strip():
+            continue
+        record = json.loads(line)
+        *parent_keys, last_key = record['keys']
+        node = data
+        for key in parent_keys:
+            node = node.setdefault(key, {})
+        node[last_key] = record['value']
+    return offset + end
+#endregion
+
+#region: _get_file_stats
+def _get_file_stats(path, inode_only=False):
+    '''
+    Helper function to identify the version of a file, or None if it does
+    not exist.
+    '''
+    try:
+        stat_result = os.stat(path)
+    except FileNotFoundError:
+        return None
+    if inode_only:
+        return stat_result.st_dev, stat_result.st_ino
+    return (
+        stat_result.st_dev,
+        stat_result.st_ino,
+        stat_result.st_mtime_ns,
+        stat_result.st_size
+    )
+#endregion
+
+#region: _read_json
+def _read_json(path):
+    '''
+    Helper function to read a JSON file, or an empty dictionary if it does
+    not exist.
+    '''
+    try:
+        with open(path, 'r') as file:
+            return json.load(file)
+    except FileNotFoundError:
+        return {}
+#endregion
+
+#region: write_json_atomic
+def write_json_atomic(data, path, indent=None):
+    '''
+    Write data to a JSON file such that the file is never left incomplete.
+
+    The data are written to a temporary file, which then replaces the
+    original file. 'indent' is passed to json.dump().
+    '''
+    directory = os.path.dirname(path) or '.'
+    os.makedirs(directory, exist_ok=True)
+
+    with tempfile.NamedTemporaryFile(
+            'w', dir=directory, suffix='.tmp', delete=False) as file:
+        json.dump(data, file, indent=indent)
+    os.replace(file.name, path)
+#endregion
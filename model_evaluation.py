@@ -6,9 +6,19 @@ selection, using a set of predefined metrics. It leverages parallel processing
 to efficiently handle large datasets.
 '''
 
+import copy
+from concurrent.futures import Future, wait, FIRST_COMPLETED
+import numpy as np
 import pandas as pd
 from sklearn.model_selection import RepeatedKFold
-from joblib import Parallel, delayed
+from sklearn.pipeline import Pipeline
+from joblib import Parallel, delayed, effective_n_jobs
+from joblib.executor import get_memmapping_executor
+
+from data_handle import DataHandle
+from fit_cache import fit_estimator, advance_random_state
+import adaptive_repeats
+import profiling
 
 #region: ModelEvaluator.__init__
 class ModelEvaluator:
@@ -18,14 +28,18 @@ class ModelEvaluator:
     '''
     def __init__(
             self, evaluation_settings, metrics_manager, feature_selector=None, 
-            n_jobs=None):
+            n_jobs=None, fit_cache=None):
         '''
         Initialize the ModelEvaluator.
 
         Parameters
         ----------
         evaluation_settings : SimpleNamespace
-            The configuration settings for the model evaluation.
+            The configuration settings for the model evaluation. If 
+            'adaptive_repeats' is True, 'n_repeats_cv' is the maximum number 
+            of repeats. Repeats are then added until the half-width of the 
+            confidence interval of 'ci_metric' (default, the first metric) is 
+            at most 'ci_tolerance'. See `_has_converged()` for other settings.
         metrics_manager : MetricsManager
             The manager that handles different evaluation metrics.
         feature_selector : FeatureSelector, optional
@@ -33,11 +47,15 @@ class ModelEvaluator:
             (default is None).
         n_jobs : int, optional
             See joblib.Parallel for reference.
+        fit_cache : FitCache, optional
+            If specified, identical fits are reused across folds and 
+            estimators.
         '''
         self.evaluation_settings = evaluation_settings
         self.metrics_manager = metrics_manager
         self.feature_selector = feature_selector
         self._n_jobs = n_jobs
+        self._fit_cache = fit_cache
 #endregion
 
     #region: cross_validate_model
@@ -61,11 +79,17 @@ class ModelEvaluator:
         -------
         dict
             Evaluation results.
+
+        Notes
+        -----
+        Recorded as the 'cross_validate' stage of the active profiler, if any 
+        (see profiling.py).
         '''
-        if select_features:
-            return self._cross_validate_with_selection(estimator, X, y)
-        else:
-            return self._cross_validate_without_selection(estimator, X, y)
+        with profiling.stage('cross_validate'):
+            if select_features:
+                return self._cross_validate_with_selection(estimator, X, y)
+            else:
+                return self._cross_validate_without_selection(estimator, X, y)
     #endregion
 
     #region: _cross_validate_with_selection
@@ -99,6 +123,8 @@ class ModelEvaluator:
             'importances_replicates': importances_replicates,
             'predictions': predictions
         }
+        if self._is_adaptive or self.feature_selector.is_adaptive:
+            evaluation_results['repeats'] = self._repeats_with_selection
         return evaluation_results
     #endregion
 
@@ -131,33 +157,47 @@ class ModelEvaluator:
         Notes
         -----
         This method involves nested cross-validation where feature selection is 
-        performed within each fold of the cross-validation process.
+        performed within each fold of the cross-validation process. The folds 
+        of each batch of repeats are evaluated concurrently; see 
+        `_run_nested_selection()`.
         '''
-        performances, importances_replicates, predictions_data = [], [], []
-
         rkf_cv = RepeatedKFold(
             n_splits=self.evaluation_settings.n_splits_cv, 
             n_repeats=self.evaluation_settings.n_repeats_cv, 
             random_state=self.evaluation_settings.random_state_cv
         )
 
-        for replicate_num, (train_ix, test_ix) in enumerate(rkf_cv.split(X)):
-            X_train, X_test = X.iloc[train_ix, :], X.iloc[test_ix, :]
-            y_train, y_test = y.iloc[train_ix], y.iloc[test_ix]
-
-            estimator, important_features, importances = (
-                self.feature_selector.nested_feature_selection(
-                estimator, X_train, y_train)
-            )
-
+        n_splits = self.evaluation_settings.n_splits_cv
+        splits_for_repeat = adaptive_repeats.split_by_repeat(
+            list(rkf_cv.split(X)), n_splits)
+
+        # Workers receive only a handle to the shared data and fold indices.
+        results, splits = [], []  # initialize
+        with DataHandle(X, y) as data_handle:
+            for start, stop in self._iter_repeat_batches():
+                batch_splits = [
+                    split for splits_for_one_repeat in splits_for_repeat[start:stop]
+                    for split in splits_for_one_repeat
+                    ]
+                results.extend(
+                    self._run_nested_selection(
+                        estimator, data_handle, batch_splits)
+                    )
+                splits.extend(batch_splits)
+                scores = [score for score, *_ in results]
+                if self._has_converged(scores, n_splits):
+                    break
+
+        # Unpack the results
+        performances, importances_replicates, predictions_data = [], [], []
+        n_repeats_selection = []  # for each replicate
+        for replicate_num, ((score, y_pred, importances), (_, test_ix)) in (
+                enumerate(zip(results, splits))):
+            performances.append(score)
             importances_replicates.append(importances)
-
-            estimator.fit(X_train[important_features], y_train)
-
-            y_pred = estimator.predict(X_test[important_features])
-            performances.append(self.metrics_manager.score(y_test, y_pred))
-
-            for ix, pred in zip(X_test.index, y_pred):
+            n_repeats_selection.append(
+                self.feature_selector.count_repeats(importances))
+            for ix, pred in zip(X.index[test_ix], y_pred):
                 predictions_data.append((ix, replicate_num, pred))
 
         predictions = _create_predictions_dataframe(predictions_data, X)
@@ -166,9 +206,209 @@ class ModelEvaluator:
         performances.columns.names = ['metric']
         importances_replicates = pd.concat(importances_replicates)
 
+        self._repeats_with_selection = _create_repeats_dataframe(
+            len(performances) // n_splits, 
+            n_repeats_selection
+            )
+
         return estimator, performances, importances_replicates, predictions
     #endregion
 
+    #region: _run_nested_selection
+    def _run_nested_selection(self, estimator, data_handle, outer_splits):
+        '''
+        Run the nested feature selection and the evaluation for multiple 
+        outer folds as one graph of tasks in a single pool of workers.
+
+        The permutation-importance jobs of all (outer fold x inner fold) pairs 
+        are submitted at once. As soon as the inner jobs of an outer fold are 
+        completed, its important features are selected, and its final fit and 
+        score are submitted, such that no worker waits for the other outer 
+        folds. In the adaptive mode, further inner repeats of an outer fold 
+        are submitted until its ranking has converged.
+
+        Parameters
+        ----------
+        estimator : object
+            The machine learning estimator to be evaluated. Its random state 
+            is advanced as by the final fits of the outer folds in turn.
+        data_handle : DataHandle
+            Shared (memory-mapped) features and target data.
+        outer_splits : list of tuple
+            Train and test indices of each outer fold.
+
+        Returns
+        -------
+        list of tuple
+            (score, y_pred, importances) for each outer fold, in order.
+
+        Notes
+        -----
+        Each outer fold starts from the random state of the estimator after 
+        the final fits of the previous folds, so that the results are 
+        identical to those of a loop over the folds. For forests, this state 
+        is known in advance (see `fit_cache.advance_random_state()`). For 
+        other estimators with a RandomState instance, an outer fold is 
+        started only once the final fit of the previous fold is completed.
+        '''
+        feature_selector = self.feature_selector
+        settings = feature_selector.feature_selection_settings
+        feature_names = list(data_handle.columns)
+        n_folds = len(outer_splits)
+        splits_for_inner_size = {
+            n : feature_selector.inner_splits(n) 
+            for n in {len(train_ix) for train_ix, _ in outer_splits}
+            }
+
+        # State of each outer fold
+        estimators = [None] * n_folds  # at the start of the fold
+        batches = [iter(feature_selector.iter_repeat_batches()) 
+                   for _ in range(n_folds)]
+        bunches = [[] for _ in range(n_folds)]  # inner results, in order
+        top_features = [None] * n_folds
+        n_pending = [0] * n_folds
+        importances_for_fold = [None] * n_folds
+        results = [None] * n_folds
+
+        executor = self._get_executor()
+        task_for_future = {}  # initialize
+
+        def submit(function, *args, task):
+            future = _submit(executor, function, *args)
+            task_for_future[future] = task
+
+        def start_folds(fold_num, fold_estimator):
+            # Start this fold and any subsequent folds whose random state is 
+            # known in advance
+            while fold_num < n_folds:
+                estimators[fold_num] = fold_estimator
+                submit_next_batch(fold_num)
+                fold_estimator = copy.deepcopy(fold_estimator)
+                if not advance_random_state(fold_estimator):
+                    break
+                fold_num += 1
+
+        def submit_next_batch(fold_num):
+            train_ix, test_ix = outer_splits[fold_num]
+            batch = next(batches[fold_num], None)
+            if batch is not None:
+                start, stop = batch
+                splits_for_repeat = splits_for_inner_size[len(train_ix)]
+                for splits in splits_for_repeat[start:stop]:
+                    for inner_train_ix, inner_test_ix in splits:
+                        slot = len(bunches[fold_num])
+                        bunches[fold_num].append(None)
+                        n_pending[fold_num] += 1
+                        submit(
+                            feature_selector.permutation_importance_wrapper, 
+                            estimators[fold_num], 
+                            data_handle, 
+                            train_ix[inner_train_ix], 
+                            train_ix[inner_test_ix], 
+                            task=('inner', fold_num, slot)
+                            )
+                return
+            # All inner repeats are done. Submit the final fit and score
+            importances = feature_selector.unpack_importances(
+                bunches[fold_num], feature_names)
+            important_features = feature_selector.select_features(
+                importances, settings.criterion_metric, settings.n_features)
+            importances_for_fold[fold_num] = importances
+            submit(
+                self._fit_selected_and_score, 
+                estimators[fold_num], 
+                data_handle, 
+                train_ix, 
+                test_ix, 
+                important_features, 
+                task=('final', fold_num, None)
+                )
+
+        try:
+            start_folds(0, copy.deepcopy(estimator))
+
+            while task_for_future:
+                done, _ = wait(task_for_future, return_when=FIRST_COMPLETED)
+                # In the order of submission, for reproducibility when serial
+                for future in [f for f in task_for_future if f in done]:
+                    stage, fold_num, slot = task_for_future.pop(future)
+                    result, task_stats = future.result()
+                    profiling.add_task_stats(
+                        task_stats, 
+                        stage=(
+                            'fit_and_score' if stage == 'final' 
+                            else 'feature_selection')
+                        )
+                    if stage == 'final':
+                        score, y_pred, fitted_estimator = result
+                        results[fold_num] = (
+                            score, y_pred, importances_for_fold[fold_num])
+                        if fold_num == n_folds - 1:
+                            _set_random_state(
+                                estimator, _get_random_state(fitted_estimator))
+                        elif estimators[fold_num + 1] is None:
+                            start_folds(fold_num + 1, fitted_estimator)
+                        continue
+                    bunches[fold_num][slot] = result
+                    n_pending[fold_num] -= 1
+                    if n_pending[fold_num] > 0:
+                        continue
+                    if feature_selector.is_adaptive:
+                        converged, top_features[fold_num] = (
+                            feature_selector.has_converged(
+                                bunches[fold_num], 
+                                feature_names, 
+                                top_features[fold_num]
+                                )
+                        )
+                        if converged:
+                            batches[fold_num] = iter(())  # no more repeats
+                    submit_next_batch(fold_num)
+        finally:
+            for future in task_for_future:
+                future.cancel()
+
+        return results
+    #endregion
+
+    #region: _fit_selected_and_score
+    def _fit_selected_and_score(
+            self, estimator, data_handle, train_ix, test_ix, feature_names):
+        '''
+        Fit the estimator on the selected features of an outer fold, and 
+        score its predictions.
+
+        Returns
+        -------
+        score : dict
+        y_pred : array-like
+            Refer to `_split_fit_predict_and_score()`.
+        estimator : object
+            The fitted estimator, e.g., for its random state after the fit.
+        '''
+        score, y_pred = self._split_fit_predict_and_score(
+            estimator, data_handle, train_ix, test_ix, feature_names)
+        return score, y_pred, estimator
+    #endregion
+
+    #region: _get_executor
+    def _get_executor(self):
+        '''
+        Get the pool of workers for the tasks of the nested cross-validation.
+
+        Returns
+        -------
+        concurrent.futures.Executor or None
+            The reusable pool of joblib's loky backend, shared with
+            joblib.Parallel, or None if the tasks are to be run serially in
+            the current process.
+        '''
+        n_jobs = effective_n_jobs(self._n_jobs)
+        if n_jobs == 1:
+            return None
+        return get_memmapping_executor(n_jobs)
+    #endregion
+
     #region: _cross_validate_without_selection
     def _cross_validate_without_selection(self, estimator, X, y):
         '''
@@ -195,12 +435,15 @@ class ModelEvaluator:
         )
 
         # Fit the model to all data.
-        estimator.fit(X, y)
+        fit_estimator(estimator, X, y, self._fit_cache)
 
         evaluation_results = {
             'performances': performances,
             'predictions': predictions
         }
+        if self._is_adaptive:
+            evaluation_results['repeats'] = _create_repeats_dataframe(
+                len(performances) // self.evaluation_settings.n_splits_cv)
         return evaluation_results
     #endregion
 
@@ -231,7 +474,8 @@ class ModelEvaluator:
         Notes
         -----
         This method facilitates parallelized execution of cross-validation 
-        using joblib's Parallel and delayed functions.
+        using joblib's Parallel and delayed functions. In the adaptive mode, 
+        the folds of each batch of repeats are executed in parallel.
         '''
         rkf = RepeatedKFold(
             n_splits=self.evaluation_settings.n_splits_cv, 
@@ -239,17 +483,37 @@ class ModelEvaluator:
             random_state=self.evaluation_settings.random_state_cv
         )
 
-        results = Parallel(n_jobs=self._n_jobs)(
-            delayed(self._split_fit_predict_and_score)(
-                estimator, X, y, train_ix, test_ix
-            ) for train_ix, test_ix in rkf.split(X)
-        )
+        n_splits = self.evaluation_settings.n_splits_cv
+        splits_for_repeat = adaptive_repeats.split_by_repeat(
+            list(rkf.split(X)), n_splits)
+
+        # Workers receive only a handle to the shared data and fold indices.
+        results, splits = [], []  # initialize
+        with DataHandle(X, y) as data_handle:
+            for start, stop in self._iter_repeat_batches():
+                batch_splits = [
+                    split for splits_for_one_repeat in splits_for_repeat[start:stop]
+                    for split in splits_for_one_repeat
+                    ]
+                for result, task_stats in Parallel(n_jobs=self._n_jobs)(
+                        delayed(profiling.call_counted)(
+                            self._split_fit_predict_and_score, 
+                            estimator, data_handle, train_ix, test_ix
+                        ) for train_ix, test_ix in batch_splits
+                        ):
+                    results.append(result)
+                    profiling.add_task_stats(task_stats, stage='fit_and_score')
+                splits.extend(batch_splits)
+                scores = [score for score, _ in results]
+                if self._has_converged(scores, n_splits):
+                    break
 
         # Unpack the results from parallel executions
         performances, predictions_data = [], []
-        for replicate_num, (score, pred_data) in enumerate(results):
+        for replicate_num, ((score, y_pred), (_, test_ix)) in enumerate(
+                zip(results, splits)):
             performances.append(score)
-            for ix, pred in pred_data:
+            for ix, pred in zip(X.index[test_ix], y_pred):
                 predictions_data.append((ix, replicate_num, pred))
 
         predictions = _create_predictions_dataframe(predictions_data, X)
@@ -261,7 +525,9 @@ class ModelEvaluator:
     #endregion
 
     #region: _split_fit_predict_and_score
-    def _split_fit_predict_and_score(self, estimator, X, y, train_ix, test_ix):
+    def _split_fit_predict_and_score(
+            self, estimator, data_handle, train_ix, test_ix, 
+            feature_names=None):
         '''
         Perform a single split of the data, fit the estimator, predict on the 
         test set, and score the performance. 
@@ -272,23 +538,23 @@ class ModelEvaluator:
         ----------
         estimator : object
             The machine learning estimator to be trained and evaluated.
-        X : pandas.DataFrame
-            The complete set of features data.
-        y : pandas.Series
-            The complete set of target data.
+        data_handle : DataHandle
+            Shared (memory-mapped) features and target data.
         train_ix : array-like
             Indices for the training set in the current fold.
         test_ix : array-like
             Indices for the test set in the current fold.
+        feature_names : list of str, optional
+            If specified, only these features are used, e.g., the important 
+            features selected within the fold.
 
         Returns
         -------
         tuple
             A tuple containing the performance score of the estimator on the 
-            test data and a list of tuples. Each tuple in the list consists of 
-            a test index and the corresponding prediction, facilitating 
-            tracking of predictions across folds and replicates in 
-            cross-validation.
+            test data and the predictions for the test set, in the order of 
+            test_ix. This facilitates tracking of predictions across folds 
+            and replicates in cross-validation.
 
         Notes
         -----
@@ -296,16 +562,174 @@ class ModelEvaluator:
         cross-validation steps, used in conjunction with joblib's Parallel and 
         delayed functions.
         '''
-        X_train, X_test = X.iloc[train_ix, :], X.iloc[test_ix, :]
-        y_train, y_test = y.iloc[train_ix], y.iloc[test_ix]
+        X_train, y_train = data_handle.take(train_ix)
+        X_test, y_test = data_handle.take(test_ix)
+        if feature_names is not None:
+            X_train, X_test = X_train[feature_names], X_test[feature_names]
 
-        estimator.fit(X_train, y_train)
+        fit_estimator(estimator, X_train, y_train, self._fit_cache)
         y_pred = estimator.predict(X_test)
+        profiling.count('n_predicts')
         score = self.metrics_manager.score(y_test, y_pred)
 
-        return score, list(zip(X_test.index, y_pred))
+        return score, y_pred
     #endregion
 
+    #region: _is_adaptive
+    @property
+    def _is_adaptive(self):
+        '''
+        Whether the number of repeats is adaptive.
+        '''
+        return getattr(self.evaluation_settings, 'adaptive_repeats', False)
+    #endregion
+
+    #region: _iter_repeat_batches
+    def _iter_repeat_batches(self):
+        '''
+        Generate the ranges of repeats to be evaluated at each step.
+
+        See Also
+        --------
+        adaptive_repeats.iter_repeat_batches()
+        '''
+        settings = self.evaluation_settings
+        min_repeats = None
+        if self._is_adaptive:
+            min_repeats = getattr(settings, 'min_repeats_cv', 3)
+        return adaptive_repeats.iter_repeat_batches(
+            settings.n_repeats_cv, 
+            min_repeats=min_repeats, 
+            repeats_per_step=getattr(settings, 'repeats_per_step_cv', 1)
+            )
+    #endregion
+
+    #region: _has_converged
+    def _has_converged(self, scores, n_splits):
+        '''
+        Check whether enough repeats have been evaluated in the adaptive mode.
+
+        The performance metric is averaged across the folds of each repeat.
+        Converged if the half-width of the confidence interval of the mean 
+        across repeats is at most 'ci_tolerance' (in units of the metric), 
+        with at least 'min_repeats_cv' repeats (default 3).
+
+        Parameters
+        ----------
+        scores : list of dict
+            Score of each fold so far, mapping metric names to floats.
+        n_splits : int
+            Number of folds in each repeat.
+
+        Returns
+        -------
+        bool
+            Always False if not in the adaptive mode.
+        '''
+        if not self._is_adaptive:
+            return False
+        settings = self.evaluation_settings
+        n_repeats = len(scores) // n_splits
+        if n_repeats < getattr(settings, 'min_repeats_cv', 3):
+            return False
+
+        metric = getattr(
+            settings, 
+            'ci_metric', 
+            next(iter(self.metrics_manager.function_for_metric))
+            )
+        fold_scores = [score[metric] for score in scores[:n_repeats*n_splits]]
+        repeat_scores = [
+            sum(fold_scores[i:i+n_splits]) / n_splits 
+            for i in range(0, len(fold_scores), n_splits)
+            ]
+        half_width = adaptive_repeats.ci_half_width(
+            repeat_scores, 
+            getattr(settings, 'confidence_level', 0.95)
+            )
+        return half_width <= settings.ci_tolerance
+    #endregion
+
+#region: _submit
+def _submit(executor, function, *args):
+    '''
+    Helper function to submit a task to an executor, or to run it in the 
+    current process if the executor is None.
+
+    In the current process, the task receives copies of the arguments, as a 
+    worker would, so that e.g. the estimator is not fitted in place.
+
+    Returns
+    -------
+    concurrent.futures.Future
+        The result is that of `profiling.call_counted()`, i.e., the result 
+        of the task and its statistics.
+    '''
+    if executor is not None:
+        return executor.submit(profiling.call_counted, function, *args)
+    future = Future()
+    try:
+        future.set_result(
+            profiling.call_counted(function, *copy.deepcopy(args)))
+    except Exception as exception:
+        future.set_exception(exception)
+    return future
+#endregion
+
+#region: _get_random_state
+def _get_random_state(estimator):
+    '''
+    Helper function to get the random state of the final estimator of a 
+    Pipeline, or None if it has none.
+    '''
+    if isinstance(estimator, Pipeline):
+        estimator = estimator.steps[-1][1]
+    return getattr(estimator, 'random_state', None)
+#endregion
+
+#region: _set_random_state
+def _set_random_state(estimator, random_state):
+    '''
+    Helper function to set the state of the random number generator of the 
+    final estimator of a Pipeline, if it is a RandomState instance.
+    '''
+    current_state = _get_random_state(estimator)
+    if (isinstance(current_state, np.random.RandomState) 
+            and isinstance(random_state, np.random.RandomState)):
+        current_state.set_state(random_state.get_state())
+#endregion
+
+#region: _create_repeats_dataframe
+def _create_repeats_dataframe(n_repeats_evaluation, n_repeats_selection=None):
+    '''
+    Create a DataFrame recording the number of repeats used in the adaptive 
+    mode.
+
+    Parameters
+    ----------
+    n_repeats_evaluation : int
+        Number of repeats of the (outer) cross-validation.
+    n_repeats_selection : list of int, optional
+        Number of repeats of the feature selection, for each replicate (fold) 
+        of the outer cross-validation.
+
+    Returns
+    -------
+    pandas.DataFrame
+        Column 'n_repeats', indexed by 'stage' and 'replicate'. The replicate 
+        is -1 for the evaluation stage. The repeats of the selection for the 
+        final model ('final_selection') are added by the `WorkflowManager`.
+    '''
+    rows = [('evaluation', -1, n_repeats_evaluation)]
+    if n_repeats_selection is not None:
+        rows.extend(
+            ('selection', replicate_num, n_repeats) 
+            for replicate_num, n_repeats in enumerate(n_repeats_selection)
+        )
+    repeats = pd.DataFrame(rows, columns=['stage', 'replicate', 'n_repeats'])
+    return repeats.set_index(['stage', 'replicate'])
+#endregion
+
 #region: _create_predictions_dataframe
 def _create_predictions_dataframe(predictions_data, X):
     '''
@@ -5,6 +5,11 @@ used for out-of-sample prediction and generalization error evaluation through
 cross-validation.
 '''
 
+import time
+
+from fit_cache import fit_estimator
+import profiling
+
 #region: ModelBuilder.__init__
 class ModelBuilder:
     '''
@@ -17,7 +22,7 @@ class ModelBuilder:
         An instance of the FeatureSelector class to perform feature selection 
         during model building, default is None.
     '''
-    def __init__(self, feature_selector=None):
+    def __init__(self, feature_selector=None, fit_cache=None):
         '''
         Initialize the ModelBuilder.
 
@@ -26,8 +31,12 @@ class ModelBuilder:
         feature_selector : FeatureSelector, optional
             The feature selector to use if feature selection is required during 
             model building.
+        fit_cache : FitCache, optional
+            If specified, identical fits are reused, e.g., from the 
+            cross-validation.
         '''
         self.feature_selector = feature_selector
+        self._fit_cache = fit_cache
 #endregion
     
     #region: train_final_model
@@ -52,13 +61,19 @@ class ModelBuilder:
         dict
             A dictionary containing the built estimator and additional 
             results.
+
+        Notes
+        -----
+        Recorded as the 'train_final_model' stage of the active profiler, if 
+        any (see profiling.py), with the final fit as 'final_fit'.
         '''
-        if select_features:
-            return self._train_final_model_with_selection(
-                estimator, X, y)
-        else:
-            return self._train_final_model_without_selection(
-                estimator, X, y)
+        with profiling.stage('train_final_model'):
+            if select_features:
+                return self._train_final_model_with_selection(
+                    estimator, X, y)
+            else:
+                return self._train_final_model_without_selection(
+                    estimator, X, y)
     #endregion
 
     #region: _train_final_model_with_selection
@@ -79,18 +94,27 @@ class ModelBuilder:
         -------
         dict
             A dictionary containing the built estimator, important features, 
-            and importances.
+            importances, the number of repeats of the feature selection 
+            ('n_repeats_selection'), and the time (s) to fit the final 
+            estimator.
         '''
         estimator, important_features, importances = (
             self.feature_selector.nested_feature_selection(estimator, X, y)
         )
-        estimator.fit(X[important_features], y)
+        start_time = time.perf_counter()
+        with profiling.stage('final_fit'):
+            fit_estimator(
+                estimator, X[important_features], y, self._fit_cache)
+        fit_time = time.perf_counter() - start_time
 
         # TODO: Create a Results class?
         build_results = {
             'estimator' : estimator, 
             'important_features' : important_features,  # TODO: Write?
-            'importances' : importances
+            'importances' : importances,
+            'n_repeats_selection' : (
+                self.feature_selector.count_repeats(importances)),
+            'fit_time' : fit_time
         }
         return build_results
     #endregion
@@ -112,13 +136,18 @@ class ModelBuilder:
         Returns
         -------
         dict
-            A dictionary containing the built estimator.
+            A dictionary containing the built estimator and the time (s) to 
+            fit it.
         '''
-        estimator.fit(X, y)
+        start_time = time.perf_counter()
+        with profiling.stage('final_fit'):
+            fit_estimator(estimator, X, y, self._fit_cache)
+        fit_time = time.perf_counter() - start_time
 
         # TODO: Create a Results class?
         build_results = {
-            'estimator' : estimator
+            'estimator' : estimator,
+            'fit_time' : fit_time
         }
         return build_results
     #endregion
\ No newline at end of file
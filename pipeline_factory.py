@@ -36,7 +36,7 @@ from sklearn.pipeline import make_pipeline
 import numpy as np 
 
 # TODO: If this is the only use of transform.py, migrate it here.
-from transform import select_columns_without_pattern
+from transform import ColumnSchema
 
 #region: PipelineBuilder.__init__
 class PipelineBuilder:
@@ -65,6 +65,9 @@ class PipelineBuilder:
         Configuration settings for the preprocessors.
     _discrete_column_suffix : str
         Suffix pattern for discrete feature columns.
+    column_schema : ColumnSchema
+        Selects the continuous columns for the ColumnTransformers, resolving 
+        each set of columns only once.
     _default_seed : int
         Default random seed.
     '''
@@ -81,6 +84,7 @@ class PipelineBuilder:
         self.preprocessor_settings = preprocessor_settings
         # TODO: Pattern handling for feature names could be more flexible
         self._discrete_column_suffix = discrete_column_suffix
+        self.column_schema = ColumnSchema(discrete_column_suffix)
         self._default_seed = default_seed
 #endregion
 
@@ -107,7 +111,7 @@ class PipelineBuilder:
         for name, config in self.estimator_settings.items():
             module = importlib.import_module(config['module'])
             class_name = config.get('class', name)
-            kwargs = config.get('kwargs', {})
+            kwargs = dict(config.get('kwargs', {}))  # 'seed' is popped below
 
             pre_steps = self.instantiate_preprocessors(preprocessor_names)                
 
@@ -177,10 +181,8 @@ class PipelineBuilder:
             A ColumnTransformer object that applies the given transformer to
             continuous features and passes through discrete features.
         '''
-        select_continuous = select_columns_without_pattern(
-            self._discrete_column_suffix+'$')  # matches at the end
         return make_column_transformer(
-            (transformer, select_continuous),
+            (transformer, self.column_schema),
             remainder='passthrough',
             verbose_feature_names_out=False,
             )    
@@ -3,6 +3,16 @@ This module consolidates all figure-generating functions for visualizing the
 results generated by a WorkflowManager instance.
 '''
 
+import contextlib
+import functools
+import tempfile
+import traceback
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import joblib
+import matplotlib
+import matplotlib.pyplot as plt
+
 from plotting import (
     benchmarking,
     chemical_coverage,
@@ -21,6 +31,7 @@ from data_management import DataManager
 from metrics_management import MetricsManager
 from results_management import ResultsManager
 from results_analysis import ResultsAnalyzer
+from analysis_cache import AnalysisCache
 
 def plot_main():
     '''
@@ -29,7 +40,8 @@ def plot_main():
     This function acts as the main entry point for generating all plots defined. 
     It initializes necessary managers for data, metrics, results, and analysis,
     and sequentially calls plotting functions with appropriate parameters 
-    derived from the configuration settings.
+    derived from the configuration settings. If `n_jobs_plot` is set in the 
+    plot configuration, the figures are rendered in a pool of processes.
 
     Returns
     -------
@@ -42,7 +54,8 @@ def plot_main():
     data_manager = DataManager(config.data, config.path)
     metrics_manager = MetricsManager(config.category_to_dict('metric'))
     results_manager = ResultsManager(
-        results_file_type=config.data.file_type
+        results_file_type=config.data.file_type,
+        estimator_mmap_mode=getattr(config.model, 'estimator_mmap_mode', None)
         )
     results_analyzer = ResultsAnalyzer(
         results_manager, 
@@ -50,57 +63,199 @@ def plot_main():
         config.plot
         )
 
-    feature_distributions.feature_distributions(
-        config.path.file_for_features_source['opera']
+    tasks = create_plot_tasks(
+        config, 
+        results_analyzer, 
+        metrics_manager.function_for_metric
         )
 
-    chemical_coverage.pairwise_scatters_and_kde_subplots(
-        config.path.file_for_features_source['opera'], 
-        config.path.surrogate_pods_file,
-        config.plot
-        )
+    n_jobs_plot = joblib.effective_n_jobs(getattr(config.plot, 'n_jobs_plot', 1))
+    if n_jobs_plot == 1 or len(tasks) == 1:
+        for function, args in tasks:
+            function(*args)
+    else:
+        run_plot_tasks_in_parallel(tasks, results_analyzer, n_jobs_plot)
 
-    feature_completeness.proportions_incomplete_subplots(
-        config.path.file_for_features_source['opera'], 
-        config.path.opera_AD_file, 
-        config.path.surrogate_pods_file,
-        config.plot,
-        threshold=config.preprocessor.settings['MissingValuesSelector']['kwargs']['threshold']
-        )
+#region: create_plot_tasks
+def create_plot_tasks(config, results_analyzer, function_for_metric):
+    '''
+    Create the independent plotting tasks, in the order of plotting.
 
-    important_features.important_feature_counts(results_analyzer, config.plot)
+    Each figure family is a task, except for the families with one figure for 
+    each group of model keys, which are split into one task per figure.
 
-    importance_scores.importances_boxplots(results_analyzer, config.plot)
+    Parameters
+    ----------
+    config : UnifiedConfiguration
+    results_analyzer : ResultsAnalyzer
+    function_for_metric : dict
+        Mapping of performance metrics to their corresponding functions.
 
-    importance_scores.importances_replicates_boxplots(
-        results_analyzer, 
-        config.plot
-        )
+    Returns
+    -------
+    list of tuple
+        (function, args) for each task, such that `function(*args)` plots and 
+        saves the figure(s).
+    '''
+    features_file = config.path.file_for_features_source['opera']
+    threshold = (
+        config.preprocessor.settings['MissingValuesSelector']['kwargs']
+        ['threshold']
+    )
 
-    model_performance.in_and_out_sample_comparisons(
-        results_analyzer, 
-        config.plot, 
-        metrics_manager.function_for_metric
+    tasks = [
+        (
+            feature_distributions.feature_distributions, 
+            (features_file,)
+        ),
+        (
+            chemical_coverage.pairwise_scatters_and_kde_subplots, 
+            (features_file, config.path.surrogate_pods_file, config.plot)
+        ),
+        (
+            functools.partial(
+                feature_completeness.proportions_incomplete_subplots, 
+                threshold=threshold
+                ), 
+            (
+                features_file, 
+                config.path.opera_AD_file, 
+                config.path.surrogate_pods_file, 
+                config.plot
+            )
+        ),
+        (
+            important_features.important_feature_counts, 
+            (results_analyzer, config.plot)
+        ),
+        (
+            importance_scores.importances_boxplots, 
+            (results_analyzer, config.plot)
+        ),
+        (
+            importance_scores.importances_replicates_boxplots, 
+            (results_analyzer, config.plot)
+        ),
+        (
+            model_performance.in_and_out_sample_comparisons, 
+            (results_analyzer, config.plot, function_for_metric)
         )
-
-    benchmarking.benchmarking_scatterplots(
-        results_analyzer,
-        metrics_manager.function_for_metric,
-        config.plot
+    ]
+    tasks.extend(
+        benchmarking.benchmarking_scatterplots_tasks(
+            results_analyzer,
+            function_for_metric,
+            config.plot
+            )
         )
-
-    moe.margins_of_exposure_cumulative(
-        results_analyzer, 
-        config.plot
+    tasks.extend(
+        moe.margins_of_exposure_cumulative_tasks(
+            results_analyzer, 
+            config.plot
+            )
+        )
+    tasks.extend(
+        pod.cumulative_pod_distributions_tasks(results_analyzer, config.plot)
         )
+    tasks.append(
+        (
+            missing_features.predictions_by_missing_feature, 
+            (results_analyzer, config.plot)
+        )
+    )
+    return tasks
+#endregion
+
+#region: run_plot_tasks_in_parallel
+def run_plot_tasks_in_parallel(tasks, results_analyzer, n_jobs):
+    '''
+    Run the plotting tasks in a pool of processes with a non-interactive 
+    backend.
 
-    pod.cumulative_pod_distributions(results_analyzer, config.plot)
+    The analyses shared by multiple figure families (in-sample predictions) 
+    are prepared once, before the tasks are submitted, and shared with the 
+    workers through the `AnalysisCache` of the `ResultsAnalyzer`. If none is 
+    configured, a temporary cache is used.
+
+    Parameters
+    ----------
+    tasks : list of tuple
+        (function, args) for each task, as returned by `create_plot_tasks`.
+    results_analyzer : ResultsAnalyzer
+        Shared by the tasks.
+    n_jobs : int
+        Number of worker processes.
+
+    Returns
+    -------
+    None
+    '''
+    with contextlib.ExitStack() as stack:
+        if results_analyzer.analysis_cache is None:
+            temp_dir = stack.enter_context(tempfile.TemporaryDirectory())
+            results_analyzer.analysis_cache = AnalysisCache(temp_dir)
+            stack.callback(setattr, results_analyzer, 'analysis_cache', None)
+
+        for model_key in results_analyzer.read_model_keys():
+            try:
+                results_analyzer.get_in_sample_prediction(model_key)
+            except Exception:
+                pass  # raised again by the task
+
+        pool = stack.enter_context(
+            ProcessPoolExecutor(
+                max_workers=min(n_jobs, len(tasks)), 
+                mp_context=multiprocessing.get_context('spawn'), 
+                initializer=_initialize_plot_worker
+                )
+            )
+        # The arguments are sent to the workers with each task
+        task_for_future = {
+            pool.submit(_run_plot_task, function, args) : function 
+            for function, args in tasks
+            }
+
+        failed_tasks = []
+        for future in as_completed(task_for_future):
+            try:
+                future.result()
+            except Exception:
+                traceback.print_exc()
+                failed_tasks.append(_get_task_name(task_for_future[future]))
+
+    if failed_tasks:
+        raise RuntimeError(
+            f'{len(failed_tasks)} plotting task(s) failed: {failed_tasks}')
+#endregion
+
+#region: _initialize_plot_worker
+def _initialize_plot_worker():
+    '''
+    Use a non-interactive backend in the worker processes.
+    '''
+    matplotlib.use('Agg')
+#endregion
+
+#region: _run_plot_task
+def _run_plot_task(function, args):
+    '''
+    Run a plotting task within a worker process and close its figures.
+    '''
+    try:
+        function(*args)
+    finally:
+        plt.close('all')
+#endregion
+
+#region: _get_task_name
+def _get_task_name(function):
+    '''
+    Helper function to get the name of a plotting function for reporting.
+    '''
+    function = getattr(function, 'func', function)  # functools.partial
+    return f'{function.__module__}.{function.__name__}'
+#endregion
 
-    missing_features.predictions_by_missing_feature(
-        results_analyzer, 
-        config.plot
-        )
-    
 if __name__ == '__main__':
     print('Plotting results...')
     plot_main()
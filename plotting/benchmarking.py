@@ -42,73 +42,154 @@ def benchmarking_scatterplots(
         The figures are saved to a dedicated directory derived from the 
         function name.
     '''
+    for function, args in benchmarking_scatterplots_tasks(
+            results_analyzer, 
+            function_for_metric, 
+            plot_settings, 
+            figsize=figsize
+            ):
+        function(*args)
+#endregion
+
+#region: benchmarking_scatterplots_tasks
+def benchmarking_scatterplots_tasks(
+        results_analyzer,
+        function_for_metric,
+        plot_settings,
+        figsize=(6, 9)
+        ):
+    '''
+    Get the independent tasks of `benchmarking_scatterplots`, one for each 
+    figure.
+
+    The comparison data are loaded once and shared by all tasks.
+
+    Returns
+    -------
+    list of tuple
+        (function, args) for each figure, such that `function(*args)` plots 
+        and saves the figure.
+    '''
     y_auth_df = results_analyzer.load_authoritative_pods()
     y_toxcast = results_analyzer.load_oral_equivalent_doses()
 
-    model_key_names = results_analyzer.read_model_key_names()
     grouped_keys = results_analyzer.group_model_keys('target_effect')
+    return [
+        (
+            benchmarking_scatterplots_group, 
+            (
+                results_analyzer, 
+                function_for_metric, 
+                plot_settings, 
+                grouping_key, 
+                model_keys, 
+                y_auth_df, 
+                y_toxcast, 
+                figsize
+            )
+        )
+        for grouping_key, model_keys in grouped_keys
+        ]
+#endregion
 
-    for grouping_key, model_keys in grouped_keys:
-        num_subplots = len(model_keys)
+#region: benchmarking_scatterplots_group
+def benchmarking_scatterplots_group(
+        results_analyzer,
+        function_for_metric,
+        plot_settings,
+        grouping_key,
+        model_keys,
+        y_auth_df,
+        y_toxcast,
+        figsize=(6, 9)
+        ):
+    '''
+    Generate the scatterplots for one group of model keys, i.e., one figure 
+    of `benchmarking_scatterplots`.
 
-        fig, ax_objs = plt.subplots(3, num_subplots, figsize=figsize)
+    Parameters
+    ----------
+    results_analyzer : instance of results_analysis.ResultsAnalyzer
+    function_for_metric : dict
+    plot_settings : SimpleNamespace
+        Refer to `benchmarking_scatterplots` for documentation.
+    grouping_key : tuple of str
+        Key identifying the group, used to name the figure.
+    model_keys : list of tuple
+        Model keys of the group, one for each column of the figure.
+    y_auth_df : pandas.DataFrame
+        Authoritative PODs, one column for each target effect.
+    y_toxcast : pandas.Series
+        Oral equivalent doses.
+    figsize : tuple, optional
+        Figure size.
 
-        # Initialize the limits.
-        xmin, xmax = np.inf, -np.inf
+    Returns
+    -------
+    None
+    '''
+    model_key_names = results_analyzer.read_model_key_names()
 
-        for i, model_key in enumerate(model_keys):
-            
-            y_pred, _, y_true = results_analyzer.get_in_sample_prediction(model_key)
-
-            key_for = dict(zip(model_key_names, model_key))
-            y_comparison = y_auth_df[key_for['target_effect']].dropna()
-            y_evaluation_dict = {
-                plot_settings.surrogate_label : y_true, 
-                plot_settings.qsar_label : y_pred,
-                plot_settings.toxcast_label : y_toxcast,
-            }
-
-            for j, (label, y_evaluation) in enumerate(
-                    y_evaluation_dict.items()):
-
-                ax = ax_objs[j, i]
-
-                color = plot_settings.color_for_effect[key_for['target_effect']]
-
-                ## Set labels depending on the Axes.
-                title, xlabel, ylabel = '', '', ''
-                if j == 0:  # first row
-                    title = plot_settings.label_for_effect[key_for['target_effect']]
-                if j == len(y_evaluation_dict)-1:  # last row
-                    xlabel = f'Authoritative {plot_settings.prediction_label}'
-                if i == 0:  # first column
-                    ylabel = f'{label} {plot_settings.prediction_label}'
-                
-                utilities.generate_scatterplot(
-                    ax, 
-                    y_comparison, 
-                    y_evaluation, 
-                    function_for_metric, 
-                    plot_settings.label_for_metric,
-                    color=color, 
-                    title=title, 
-                    xlabel=xlabel, 
-                    ylabel=ylabel
-                    )
-
-                # Update the limits for the one-one line.
-                xmin = min(xmin, *ax.get_xlim())
-                xmax = max(xmax, *ax.get_xlim())
-
-            # Use the same scale.
-            for ax in ax_objs.flatten():
-                utilities.plot_one_one_line(ax, xmin, xmax, color='#808080')
-
-        fig.tight_layout()
+    num_subplots = len(model_keys)
+
+    fig, ax_objs = plt.subplots(3, num_subplots, figsize=figsize)
+
+    # Initialize the limits.
+    xmin, xmax = np.inf, -np.inf
+
+    for i, model_key in enumerate(model_keys):
         
-        utilities.save_figure(
-            fig, 
-            benchmarking_scatterplots, 
-            grouping_key
-            )
+        y_pred, _, y_true = results_analyzer.get_in_sample_prediction(model_key)
+
+        key_for = dict(zip(model_key_names, model_key))
+        y_comparison = y_auth_df[key_for['target_effect']].dropna()
+        y_evaluation_dict = {
+            plot_settings.surrogate_label : y_true, 
+            plot_settings.qsar_label : y_pred,
+            plot_settings.toxcast_label : y_toxcast,
+        }
+
+        for j, (label, y_evaluation) in enumerate(
+                y_evaluation_dict.items()):
+
+            ax = ax_objs[j, i]
+
+            color = plot_settings.color_for_effect[key_for['target_effect']]
+
+            ## Set labels depending on the Axes.
+            title, xlabel, ylabel = '', '', ''
+            if j == 0:  # first row
+                title = plot_settings.label_for_effect[key_for['target_effect']]
+            if j == len(y_evaluation_dict)-1:  # last row
+                xlabel = f'Authoritative {plot_settings.prediction_label}'
+            if i == 0:  # first column
+                ylabel = f'{label} {plot_settings.prediction_label}'
+            
+            utilities.generate_scatterplot(
+                ax, 
+                y_comparison, 
+                y_evaluation, 
+                function_for_metric, 
+                plot_settings.label_for_metric,
+                color=color, 
+                title=title, 
+                xlabel=xlabel, 
+                ylabel=ylabel
+                )
+
+            # Update the limits for the one-one line.
+            xmin = min(xmin, *ax.get_xlim())
+            xmax = max(xmax, *ax.get_xlim())
+
+        # Use the same scale.
+        for ax in ax_objs.flatten():
+            utilities.plot_one_one_line(ax, xmin, xmax, color='#808080')
+
+    fig.tight_layout()
+    
+    utilities.save_figure(
+        fig, 
+        benchmarking_scatterplots, 
+        grouping_key
+        )
 #endregion
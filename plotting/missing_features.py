@@ -47,15 +47,15 @@ def predictions_by_missing_feature(
         
         for grouping_key, model_keys in grouped_keys:
 
+            predictions_out_for_key = results_analyzer.predict_many(
+                model_keys, 
+                exclude_training=True
+                )
+
             ## Define the global x-limits based on the interquartile ranges
             series_list = []
             for model_key in model_keys:
-                series_list.append(
-                    results_analyzer.predict(
-                        model_key, 
-                        exclude_training=True
-                        )[0]
-                    )
+                series_list.append(predictions_out_for_key[model_key][0])
                 series_list.append(
                     results_analyzer.get_in_sample_prediction(model_key)[0]
                     )
@@ -70,12 +70,7 @@ def predictions_by_missing_feature(
 
             for i, model_key in enumerate(model_keys):
                 key_for = dict(zip(model_key_names, model_key))
-                y_pred_out, X_out, *_ = (
-                    results_analyzer.predict(
-                        model_key, 
-                        exclude_training=True
-                        )
-                )
+                y_pred_out, X_out = predictions_out_for_key[model_key]
                 y_pred_in, X_in, *_ = (
                     results_analyzer.get_in_sample_prediction(model_key)
                 )
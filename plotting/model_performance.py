@@ -391,8 +391,10 @@ def scatter_with_vs_without_selection(
         key_without_selection = next(k for k in model_keys if 'false' in k)
         key_with_selection = next(k for k in model_keys if 'true' in k)
 
-        y_pred_without, *_ = results_analyzer.predict(key_without_selection)
-        y_pred_with, *_ = results_analyzer.predict(key_with_selection)
+        y_pred_for_key = results_analyzer.predict_many(
+            [key_without_selection, key_with_selection])
+        y_pred_without, _ = y_pred_for_key[key_without_selection]
+        y_pred_with, _ = y_pred_for_key[key_with_selection]
 
         ## Define figure labels.
         
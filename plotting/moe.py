@@ -59,81 +59,137 @@ def margins_of_exposure_cumulative(results_analyzer, plot_settings):
         The figures are saved to a dedicated directory derived from the 
         function name.
     '''
-    # Get x-axis truncation limit if present
-    right_truncation = plot_settings.__dict__.get('moe_right_truncation', None)
+    for function, args in margins_of_exposure_cumulative_tasks(
+            results_analyzer, plot_settings):
+        function(*args)
+#endregion
 
+#region: margins_of_exposure_cumulative_tasks
+def margins_of_exposure_cumulative_tasks(results_analyzer, plot_settings):
+    '''
+    Get the independent tasks of `margins_of_exposure_cumulative`, one for 
+    each figure.
+
+    Returns
+    -------
+    list of tuple
+        (function, args) for each figure, such that `function(*args)` plots 
+        and saves the figure.
+    '''
     # TODO: Create a method of ResultsAnalyzer and reuse?
-    model_key_names, grouped_keys = group_model_keys(results_analyzer)
+    _, grouped_keys = group_model_keys(results_analyzer)
+    return [
+        (
+            margins_of_exposure_cumulative_group, 
+            (results_analyzer, plot_settings, grouping_key, model_keys)
+        )
+        for grouping_key, model_keys in grouped_keys
+        ]
+#endregion
 
-    for grouping_key, model_keys in grouped_keys:
+#region: margins_of_exposure_cumulative_group
+def margins_of_exposure_cumulative_group(
+        results_analyzer, 
+        plot_settings, 
+        grouping_key, 
+        model_keys
+        ):
+    '''
+    Plot the MOE distributions for one group of model keys, i.e., one figure 
+    of `margins_of_exposure_cumulative`.
 
-        nrows = 2  # POD & MOE
-        ncols = len(model_keys)  # N effect categories
-        fig, axs = plt.subplots(
-            nrows,
-            ncols,
-            figsize=(5*ncols, 5*nrows),
-        )
+    Parameters
+    ----------
+    results_analyzer : ResultsAnalyzer
+    plot_settings : SimpleNamespace
+        Refer to `margins_of_exposure_cumulative` for documentation.
+    grouping_key : tuple of str
+        Key identifying the group, used to name the figure.
+    model_keys : list of tuple
+        Model keys of the group, one for each column of the figure.
+
+    Returns
+    -------
+    None
+    '''
+    # Get x-axis truncation limit if present
+    right_truncation = plot_settings.__dict__.get('moe_right_truncation', None)
 
-        global_pod_xlim = utilities.initialize_global_limits()
-        global_moe_xlim = utilities.initialize_global_limits()
+    model_key_names = results_analyzer.read_model_key_names()
 
-        for i, model_key in enumerate(model_keys):
+    # Compute the MOE data for all models of the figure at once
+    moe_df = results_analyzer.moe_cdf_data(model_keys)
+    moe_data_for_key = dict(
+        iter(moe_df.groupby(model_key_names, sort=False)))
+
+    nrows = 2  # POD & MOE
+    ncols = len(model_keys)  # N effect categories
+    fig, axs = plt.subplots(
+        nrows,
+        ncols,
+        figsize=(5*ncols, 5*nrows),
+    )
 
-            ylabel = 'Cumulative Count of Chemicals' if i == 0 else None 
+    global_pod_xlim = utilities.initialize_global_limits()
+    global_moe_xlim = utilities.initialize_global_limits()
 
-            # TODO: Create a method and reuse in other modules?
-            title = get_effect_label(
-                model_key, 
-                model_key_names, 
-                plot_settings.label_for_effect
-            )
+    for i, model_key in enumerate(model_keys):
 
-            plot_model_pod_data(  # first row, column i
-                axs[0, i],
-                model_key, 
-                results_analyzer,
-                global_xlim=global_pod_xlim
-            )
-            format_axes(
-                axs[0, i], 
-                POD_XLABEL,
-                title=title,
-                ylabel=ylabel,
-                global_xlim=global_pod_xlim
-            )
+        ylabel = 'Cumulative Count of Chemicals' if i == 0 else None 
 
-            plot_model_moe_data(  # second row, column i
-                axs[1, i], 
-                model_key, 
-                results_analyzer, 
-                plot_settings,
-                global_xlim=global_moe_xlim
-            )
-            format_axes(
-                axs[1, i], 
-                MOE_XLABEL,
-                ylabel=ylabel,
-                global_xlim=global_moe_xlim,
-                right_truncation=right_truncation
-            )
-            annotate_vertical_spans(
-                axs[1, i], 
-                MOE_CATEGORIES, 
-                MOE_CATEGORY_KWARGS
-                )
-        utilities.set_centralized_legend(
-            fig, 
-            axs[1, -1],
-            bottom=0.08,
-            bbox_to_anchor=(0.5, -0.01)        
+        # TODO: Create a method and reuse in other modules?
+        title = get_effect_label(
+            model_key, 
+            model_key_names, 
+            plot_settings.label_for_effect
         )
 
-        utilities.save_figure(
-            fig,
-            margins_of_exposure_cumulative,
-            grouping_key
+        plot_model_pod_data(  # first row, column i
+            axs[0, i],
+            model_key, 
+            results_analyzer,
+            global_xlim=global_pod_xlim
+        )
+        format_axes(
+            axs[0, i], 
+            POD_XLABEL,
+            title=title,
+            ylabel=ylabel,
+            global_xlim=global_pod_xlim
         )
+
+        plot_model_moe_data(  # second row, column i
+            axs[1, i], 
+            model_key, 
+            results_analyzer, 
+            plot_settings,
+            global_xlim=global_moe_xlim,
+            moe_data=moe_data_for_key.get(tuple(model_key), moe_df.iloc[:0])
+        )
+        format_axes(
+            axs[1, i], 
+            MOE_XLABEL,
+            ylabel=ylabel,
+            global_xlim=global_moe_xlim,
+            right_truncation=right_truncation
+        )
+        annotate_vertical_spans(
+            axs[1, i], 
+            MOE_CATEGORIES, 
+            MOE_CATEGORY_KWARGS
+            )
+    utilities.set_centralized_legend(
+        fig, 
+        axs[1, -1],
+        bottom=0.08,
+        bbox_to_anchor=(0.5, -0.01)        
+    )
+
+    utilities.save_figure(
+        fig,
+        margins_of_exposure_cumulative,
+        grouping_key
+    )
 #endregion
 
 #region: single_model_moes
@@ -244,7 +300,8 @@ def plot_model_moe_data(
         model_key, 
         results_analyzer, 
         plot_settings,
-        global_xlim=None
+        global_xlim=None,
+        moe_data=None
         ):
     '''
     Plot Margin of Exposure (MOE) data for a single model.
@@ -261,15 +318,20 @@ def plot_model_moe_data(
         Configuration settings for plotting.
     global_xlim : list, optional
         The current global limits as a list [min, max].
+    moe_data : pandas.DataFrame, optional
+        MOE data for the model, as returned by 
+        `ResultsAnalyzer.moe_cdf_data()`. If None, the data are computed.
 
     Returns
     -------
     None
     '''
-    results_for_percentile = results_analyzer.moe_and_prediction_intervals(model_key)
-    percentile_colors = sns.color_palette('Set2', len(results_for_percentile))
+    if moe_data is None:
+        moe_data = results_analyzer.moe_cdf_data([model_key])
+    results_for_percentile = moe_data.groupby('percentile', observed=False)
+    percentile_colors = sns.color_palette('Set2', results_for_percentile.ngroups)
 
-    for j, (percentile, results) in enumerate(results_for_percentile.items()):
+    for j, (percentile, results) in enumerate(results_for_percentile):
         plot_with_prediction_interval(
             ax,
             results['moe'],
@@ -42,66 +42,114 @@ def cumulative_pod_distributions(results_analyzer, plot_settings):
         The figures are saved to a dedicated directory derived from the 
         function name.
     '''
-    colors, linestyles = get_plot_styles()
+    for function, args in cumulative_pod_distributions_tasks(
+            results_analyzer, plot_settings):
+        function(*args)
+#endregion
+
+#region: cumulative_pod_distributions_tasks
+def cumulative_pod_distributions_tasks(results_analyzer, plot_settings):
+    '''
+    Get the independent tasks of `cumulative_pod_distributions`, one for 
+    each figure.
 
+    Returns
+    -------
+    list of tuple
+        (function, args) for each figure, such that `function(*args)` plots 
+        and saves the figure.
+    '''
     grouped_keys = results_analyzer.group_model_keys('target_effect')
+    return [
+        (
+            cumulative_pod_distributions_group, 
+            (results_analyzer, plot_settings, grouping_key, model_keys)
+        )
+        for grouping_key, model_keys in grouped_keys
+        ]
+#endregion
 
-    for grouping_key, model_keys in grouped_keys:
+#region: cumulative_pod_distributions_group
+def cumulative_pod_distributions_group(
+        results_analyzer, 
+        plot_settings, 
+        grouping_key, 
+        model_keys
+        ):
+    '''
+    Plot the CDFs for one group of model keys, i.e., one figure of 
+    `cumulative_pod_distributions`.
 
-        fig, axs = plt.subplots(
-            2, 
-            len(model_keys), 
-            figsize=(len(model_keys)*4, 8)
-            )
-        
-        global_xlim = utilities.initialize_global_limits()
+    Parameters
+    ----------
+    results_analyzer : ResultsAnalyzer
+    plot_settings : SimpleNamespace
+        Refer to `cumulative_pod_distributions` for documentation.
+    grouping_key : tuple of str
+        Key identifying the group, used to name the figure.
+    model_keys : list of tuple
+        Model keys of the group, one for each column of the figure.
 
-        for i, model_key in enumerate(model_keys):
+    Returns
+    -------
+    None
+    '''
+    colors, linestyles = get_plot_styles()
 
-            y_for_label = results_analyzer.get_pod_comparison_data(model_key)
-            
-            # Plot CDFs for intersection of samples in the first row
-            plot_intersection_cdfs(
-                axs[0, i], 
-                y_for_label, 
-                results_analyzer, 
-                colors, 
-                linestyles, 
-                global_xlim
-            )
+    fig, axs = plt.subplots(
+        2, 
+        len(model_keys), 
+        figsize=(len(model_keys)*4, 8)
+        )
+    
+    global_xlim = utilities.initialize_global_limits()
 
-            # Plot CDF for each distinct dataset in the second row
-            plot_distinct_cdfs(
-                axs[1, i], 
-                y_for_label, 
-                results_analyzer, 
-                plot_settings,
-                colors, 
-                linestyles, 
-                global_xlim
-            )
+    for i, model_key in enumerate(model_keys):
 
-            set_row_axs_properties(
-                axs[:, i],
-                global_xlim,
-                i, 
-                model_key, 
-                results_analyzer, 
-                plot_settings.label_for_effect
-            )
+        y_for_label = results_analyzer.get_pod_comparison_data(model_key)
+        
+        # Plot CDFs for intersection of samples in the first row
+        plot_intersection_cdfs(
+            axs[0, i], 
+            y_for_label, 
+            results_analyzer, 
+            colors, 
+            linestyles, 
+            global_xlim
+        )
 
-        utilities.set_centralized_legend(
-            fig, 
-            axs[-1][-1], 
-            bottom=0.1,
-            bbox_to_anchor=(0.5, -0.01)
+        # Plot CDF for each distinct dataset in the second row
+        plot_distinct_cdfs(
+            axs[1, i], 
+            y_for_label, 
+            results_analyzer, 
+            plot_settings,
+            colors, 
+            linestyles, 
+            global_xlim
         )
 
-        utilities.save_figure(
-            fig, 
-            cumulative_pod_distributions, 
-            grouping_key
+        set_row_axs_properties(
+            axs[:, i],
+            global_xlim,
+            i, 
+            model_key, 
+            results_analyzer, 
+            plot_settings.label_for_effect
         )
+
+    utilities.set_centralized_legend(
+        fig, 
+        axs[-1][-1], 
+        bottom=0.1,
+        bbox_to_anchor=(0.5, -0.01)
+    )
+
+    utilities.save_figure(
+        fig, 
+        cumulative_pod_distributions, 
+        grouping_key
+    )
 #endregion
 
 #region: single_model_cdfs
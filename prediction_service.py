@@ -0,0 +1,391 @@
+'''
+This module contains the `PredictionService` class, which makes predictions
+for many models from the stored estimators while avoiding repeated work.
+
+    1. Loaded estimators are kept in a bounded, least-recently-used (LRU)
+    cache, so that each estimator file is read once.
+    2. Requested model keys are grouped by their features data, which are
+    loaded once per group. The predictions are made in a pool of threads.
+    3. The predictions are memoized. An entry is invalidated if the estimator
+    file or any input data file changed (modification time and size).
+
+Example
+-------
+prediction_service = PredictionService(results_manager, data_manager)
+y_pred_for_key = prediction_service.predict_many(model_keys)
+y_pred, X = y_pred_for_key[model_key]
+'''
+
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import pandas as pd
+
+from data_management import DataCache
+
+#region: PredictionService.__init__
+class PredictionService:
+    '''
+    Batch predictions for multiple models from the stored estimators.
+    '''
+    def __init__(
+            self,
+            results_manager,
+            data_manager,
+            max_estimators=8,
+            n_jobs=None,
+            max_bytes=2**30
+            ):
+        '''
+        Initialize the PredictionService.
+
+        Parameters
+        ----------
+        results_manager : A `ResultsManager` instance
+        data_manager : A `DataManager` instance
+        max_estimators : int, optional
+            Maximum number of loaded estimators to keep in memory. Default 8.
+        n_jobs : int, optional
+            Number of threads for the predictions. Default is None, i.e., the
+            default of concurrent.futures.ThreadPoolExecutor.
+        max_bytes : int, optional
+            Memory cap for the memoized predictions and features. Default is
+            1 GiB. Use 0 to disable memoization.
+        '''
+        self.results_manager = results_manager
+        self.data_manager = data_manager
+        self.max_estimators = max_estimators
+        self.n_jobs = n_jobs
+
+        self._predictions = DataCache(max_bytes=max_bytes)
+        self._estimators = OrderedDict()
+        self._lock = threading.Lock()
+#endregion
+
+    #region: __getstate__
+    def __getstate__(self):
+        '''
+        Exclude the caches and the lock when pickling, e.g., for parallel
+        workers.
+        '''
+        state = self.__dict__.copy()
+        state['_predictions'] = DataCache(
+            max_bytes=self._predictions.max_bytes)
+        state['_estimators'] = OrderedDict()
+        del state['_lock']
+        return state
+    #endregion
+
+    #region: __setstate__
+    def __setstate__(self, state):
+        '''
+        Restore the instance with a new lock.
+        '''
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+    #endregion
+
+    #region: predict
+    def predict(self, model_key, inverse_transform=False, exclude_training=False):
+        '''
+        Make prediction for the given model key.
+
+        See `predict_many()` for the parameters.
+
+        Returns
+        -------
+        y_pred : pandas.Series
+            Predicted target values.
+        X : pandas.DataFrame
+            Features used for prediction.
+        '''
+        y_pred_for_key = self.predict_many(
+            [model_key],
+            inverse_transform=inverse_transform,
+            exclude_training=exclude_training
+            )
+        return y_pred_for_key[model_key]
+    #endregion
+
+    #region: predict_many
+    def predict_many(
+            self,
+            model_keys,
+            inverse_transform=False,
+            exclude_training=False
+            ):
+        '''
+        Make predictions for multiple model keys.
+
+        Parameters
+        ----------
+        model_keys : list of tuple
+            Keys identifying the models for which predictions are required.
+        inverse_transform : bool, optional
+            If True, applies the inverse transform to the predictions
+            (default is False).
+        exclude_training : bool, optional
+            If True, excludes chemicals used for model training. Default is
+            False; predictions are made for all chemicals with features.
+
+        Returns
+        -------
+        dict
+            Mapping of each model key to a tuple (y_pred, X), as returned by
+            `predict()`.
+
+        Notes
+        -----
+        The returned data may be shared with the cache and should not be
+        modified in place. Make a copy if needed.
+        '''
+        model_key_names = self.results_manager.read_model_key_names()
+
+        results_for_key = {}  # initialize
+        keys_to_predict = []
+        for model_key in dict.fromkeys(model_keys):  # unique, in order
+            key_for = dict(zip(model_key_names, model_key))
+            cache_key = (model_key, exclude_training, inverse_transform)
+            input_paths = self._get_input_paths(model_key, key_for)
+            results = self._predictions.get(cache_key, input_paths)
+            if results is not None:
+                results_for_key[model_key] = tuple(results)
+            else:
+                keys_to_predict.append(model_key)
+        model_keys_for_features = self.group_by_features(
+            keys_to_predict, exclude_training)
+
+        if not model_keys_for_features:
+            return results_for_key
+
+        with ThreadPoolExecutor(max_workers=self.n_jobs) as executor:
+            future_for_key = {}  # initialize
+            for group in model_keys_for_features.values():
+                # Load the features once for all models of the group
+                X = self.data_manager.load_features(
+                    **group[0][1],
+                    exclude_training=exclude_training
+                    )
+                for model_key, _ in group:
+                    future_for_key[model_key] = executor.submit(
+                        self.predict_features,
+                        model_key,
+                        X,
+                        inverse_transform
+                        )
+
+            for model_key, future in future_for_key.items():
+                key_for = dict(zip(model_key_names, model_key))
+                results = self._predictions.put(
+                    (model_key, exclude_training, inverse_transform),
+                    self._get_input_paths(model_key, key_for),
+                    list(future.result())
+                    )
+                results_for_key[model_key] = tuple(results)
+
+        return {model_key : results_for_key[model_key]
+                for model_key in model_keys}
+    #endregion
+
+    #region: predict_in_chunks
+    def predict_in_chunks(
+            self, 
+            model_keys, 
+            inverse_transform=False, 
+            exclude_training=False, 
+            batch_size=100_000
+            ):
+        '''
+        Make predictions for multiple model keys, streaming the features data 
+        in chunks of rows.
+
+        The memory use depends on the batch size, not on the number of 
+        chemicals. Each chunk is read once for all models with the same 
+        features data. The predictions are not memoized.
+
+        Parameters
+        ----------
+        model_keys : list of tuple
+        inverse_transform : bool, optional
+        exclude_training : bool, optional
+            Refer to `predict_many()` for documentation.
+        batch_size : int, optional
+            Maximum number of chemicals in each chunk. Default 100,000.
+
+        Yields
+        ------
+        chunk_num : int
+            Number of the chunk within its features data.
+        y_pred_for_key : dict
+            Mapping of each model key of the group to the predicted target 
+            values (pandas.Series) for the chunk.
+        '''
+        model_keys_for_features = self.group_by_features(
+            model_keys, exclude_training)
+
+        with ThreadPoolExecutor(max_workers=self.n_jobs) as executor:
+            for group in model_keys_for_features.values():
+                chunks = self.data_manager.iter_features(
+                    **group[0][1], 
+                    exclude_training=exclude_training, 
+                    batch_size=batch_size
+                    )
+                for chunk_num, X in enumerate(chunks):
+                    if X.empty:
+                        continue
+                    future_for_key = {
+                        model_key : executor.submit(
+                            self.predict_features, 
+                            model_key, 
+                            X, 
+                            inverse_transform
+                            ) 
+                        for model_key, _ in group
+                        }
+                    y_pred_for_key = {
+                        model_key : future.result()[0] 
+                        for model_key, future in future_for_key.items()
+                        }
+                    yield chunk_num, y_pred_for_key
+    #endregion
+
+    #region: group_by_features
+    def group_by_features(self, model_keys, exclude_training=False):
+        '''
+        Group model keys by their features data, as loaded by 
+        `DataManager.load_features`.
+
+        Parameters
+        ----------
+        model_keys : list of tuple
+        exclude_training : bool, optional
+
+        Returns
+        -------
+        dict
+            Mapping of a key identifying the features data to a list of 
+            (model_key, key_for) for the models which use these data, where 
+            'key_for' maps the model key names to values.
+        '''
+        model_key_names = self.results_manager.read_model_key_names()
+
+        model_keys_for_features = {}  # initialize
+        for model_key in dict.fromkeys(model_keys):  # unique, in order
+            key_for = dict(zip(model_key_names, model_key))
+            features_key = _get_features_key(key_for, exclude_training)
+            model_keys_for_features.setdefault(features_key, []).append(
+                (model_key, key_for))
+        return model_keys_for_features
+    #endregion
+
+    #region: predict_features
+    def predict_features(self, model_key, X, inverse_transform=False):
+        '''
+        Get predictions for the given input.
+
+        Parameters
+        ----------
+        model_key : Tuple
+            Key identifying the model for which predictions are required.
+        X : pandas.DataFrame
+            Features used for prediction.
+        inverse_transform : bool, optional
+            If True, applies the inverse transform to the predictions
+            (default is False).
+
+        Returns
+        -------
+        y_pred : pandas.Series
+            Predicted target values.
+        X : pandas.DataFrame
+            Features used for prediction with fitted columns.
+        '''
+        estimator = self.get_estimator(model_key)
+        X = X[estimator.feature_names_in_]
+        y_pred = pd.Series(estimator.predict(X), index=X.index)
+        if inverse_transform:
+            y_pred = 10**y_pred
+        return y_pred, X
+    #endregion
+
+    #region: get_estimator
+    def get_estimator(self, model_key):
+        '''
+        Get the fitted estimator, loading it only if not already in memory or
+        if the file changed.
+
+        Parameters
+        ----------
+        model_key : tuple of str
+            Model key identifying the estimator.
+
+        Returns
+        -------
+        object
+            Fitted estimator object.
+        '''
+        file_stats = _get_file_stats(
+            self.results_manager.get_estimator_path(model_key))
+
+        with self._lock:
+            entry = self._estimators.get(model_key)
+            if entry is not None and entry[0] == file_stats:
+                self._estimators.move_to_end(model_key)  # most recently used
+                return entry[1]
+
+        # Load outside the lock, so that other estimators can be used
+        estimator = self.results_manager.read_estimator(model_key)
+
+        with self._lock:
+            self._estimators[model_key] = (file_stats, estimator)
+            self._estimators.move_to_end(model_key)
+            while len(self._estimators) > max(self.max_estimators, 0):
+                self._estimators.popitem(last=False)
+        return estimator
+    #endregion
+
+    #region: clear
+    def clear(self):
+        '''
+        Remove all loaded estimators and memoized predictions.
+        '''
+        with self._lock:
+            self._estimators.clear()
+        self._predictions.clear()
+    #endregion
+
+    #region: _get_input_paths
+    def _get_input_paths(self, model_key, key_for):
+        '''
+        Helper function to get the paths to the files from which the
+        predictions are derived.
+        '''
+        return (
+            [self.results_manager.get_estimator_path(model_key)]
+            + self.data_manager.get_input_paths(**key_for)
+        )
+    #endregion
+
+#region: _get_features_key
+def _get_features_key(key_for, exclude_training):
+    '''
+    Helper function to get a key identifying the features data of a model,
+    as loaded by `DataManager.load_features`.
+    '''
+    return (
+        key_for['features_source'],
+        key_for['ld50_type'],
+        key_for['data_condition'],
+        key_for.get('target_effect') if exclude_training else None
+    )
+#endregion
+
+#region: _get_file_stats
+def _get_file_stats(path):
+    '''
+    Helper function to get the modification time and size of a file.
+    '''
+    stat_result = os.stat(path)
+    return stat_result.st_mtime_ns, stat_result.st_size
+#endregion
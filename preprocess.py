@@ -1,13 +1,30 @@
 '''
-This module orchestrates the preprocessing of all raw datasets, including 
-features, target variables, and datasets for plotting and analysis. The 
-configuration settings are used to identify and process each raw data source 
+This module orchestrates the preprocessing of all raw datasets, including
+features, target variables, and datasets for plotting and analysis. The
+configuration settings are used to identify and process each raw data source
 through the RawDataProcessor's specified methods.
+
+If `"incremental": true` is set in the raw data configuration, each target is
+processed only if the content of its inputs or its settings changed since the
+last successful build, or if any of its outputs is missing. The state of the
+build is recorded in a JSON file. Targets that do not depend on each other
+are processed concurrently if `n_jobs_outer` is greater than one.
 '''
 
+import os
+import glob
+import json
+import hashlib
+import tempfile
+import traceback
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from joblib.externals.loky import get_reusable_executor
+
 from config_management import UnifiedConfiguration
 from raw_processing.processor import RawDataProcessor
 
+#region: main
 def main():
     '''
     Execute the preprocessing steps for eacg raw data source defined in the
@@ -20,11 +37,280 @@ def main():
     '''
     config = UnifiedConfiguration()
 
+    if getattr(config.raw_data, 'incremental', False):
+        build_incremental(config)
+        return
+
     raw_processor = RawDataProcessor(config.raw_data, config.data, config.path)
 
     for k, process_from_raw in raw_processor.dispatcher.items():
         print(f'\t{k}...')
         process_from_raw()
+#endregion
+
+#region: build_incremental
+def build_incremental(config):
+    '''
+    Process only the targets whose inputs or settings changed.
+
+    A target becomes ready once all of its upstream targets are done. Its
+    fingerprint is computed at that time, so that a target downstream of a
+    re-processed target is skipped if the upstream outputs are unchanged.
+
+    Parameters
+    ----------
+    config : UnifiedConfiguration
+        The 'raw_data' settings may include 'n_jobs_outer' (number of targets
+        processed concurrently, default 1). The 'path' settings may include
+        'preprocess_state_file'.
+
+    Raises
+    ------
+    RuntimeError
+        If any target failed. Targets downstream of a failed target are
+        skipped.
+    '''
+    raw_processor = RawDataProcessor(config.raw_data, config.data, config.path)
+    targets = raw_processor.get_build_targets()
+    upstream_for_target = get_upstream_targets(targets)
+
+    state_file = getattr(
+        config.path,
+        'preprocess_state_file',
+        os.path.join('Input', 'preprocess-state.json')
+        )
+    state = _read_state(state_file)
+    n_jobs_outer = getattr(config.raw_data, 'n_jobs_outer', 1)
+
+    pool = None
+    if n_jobs_outer > 1:
+        # NOTE: Spawned workers avoid deadlocks with nested process pools
+        pool = ProcessPoolExecutor(
+            max_workers=n_jobs_outer,
+            mp_context=multiprocessing.get_context('spawn')
+            )
+
+    pending = list(targets)  # in the order of the dispatcher
+    done, failed = set(), set()
+    fingerprint_for_future = {}  # initialize
+    try:
+        while pending or fingerprint_for_future:
+            n_pending = len(pending)
+            for target in list(pending):
+                upstream = upstream_for_target[target]
+                if upstream & failed:
+                    print(f'\t{target}... skipped (upstream failed)')
+                    pending.remove(target)
+                    failed.add(target)
+                    continue
+                if not upstream <= done:
+                    continue
+                pending.remove(target)
+
+                fingerprint = _compute_fingerprint(targets[target], state)
+                if _is_up_to_date(targets[target], fingerprint, target, state):
+                    print(f'\t{target}... up to date')
+                    done.add(target)
+                    continue
+
+                print(f'\t{target}...')
+                if pool is None:
+                    try:
+                        raw_processor.process_from_raw(target)
+                    except Exception:
+                        traceback.print_exc()
+                        failed.add(target)
+                    else:
+                        done.add(target)
+                        state['targets'][target] = fingerprint
+                        _write_state(state, state_file)
+                else:
+                    future = pool.submit(
+                        _process_target_in_worker, config, target)
+                    fingerprint_for_future[future] = (target, fingerprint)
+
+            if not fingerprint_for_future:
+                if len(pending) == n_pending:
+                    raise ValueError(
+                        f'Circular dependencies between targets: {pending}')
+                continue
+            completed, _ = wait(
+                fingerprint_for_future, return_when=FIRST_COMPLETED)
+            for future in completed:
+                target, fingerprint = fingerprint_for_future.pop(future)
+                try:
+                    future.result()
+                except Exception:
+                    traceback.print_exc()
+                    failed.add(target)
+                else:
+                    done.add(target)
+                    state['targets'][target] = fingerprint
+                    _write_state(state, state_file)
+    finally:
+        if pool is not None:
+            pool.shutdown()
+
+    if failed:
+        raise RuntimeError(f'Preprocessing failed for targets: {sorted(failed)}')
+#endregion
+
+#region: get_upstream_targets
+def get_upstream_targets(targets):
+    '''
+    Derive the dependencies between targets from their inputs and outputs.
+
+    Parameters
+    ----------
+    targets : dict
+        See `RawDataProcessor.get_build_targets()`.
+
+    Returns
+    -------
+    dict
+        Mapping of each target to the set of targets whose outputs are among
+        its inputs.
+    '''
+    target_for_output = {
+        os.path.normpath(output) : target
+        for target, paths in targets.items()
+        for output in paths['outputs']
+        }
+    upstream_for_target = {}  # initialize
+    for target, paths in targets.items():
+        upstream = {
+            target_for_output[os.path.normpath(path)]
+            for path in paths['inputs']
+            if os.path.normpath(path) in target_for_output
+            }
+        upstream.discard(target)
+        upstream_for_target[target] = upstream
+    return upstream_for_target
+#endregion
+
+#region: _process_target_in_worker
+def _process_target_in_worker(config, target):
+    '''
+    Process a single target within a pool of processes.
+
+    Any nested joblib workers are released after the target. Otherwise, the
+    pool would not shut down until the idle timeout (300 s) of these workers
+    had elapsed.
+    '''
+    raw_processor = RawDataProcessor(config.raw_data, config.data, config.path)
+    try:
+        # The processed data are on disk. Avoid sending them back
+        raw_processor.process_from_raw(target)
+    finally:
+        get_reusable_executor().shutdown(wait=True)
+#endregion
+
+#region: _is_up_to_date
+def _is_up_to_date(paths, fingerprint, target, state):
+    '''
+    Check whether the target was built with the same fingerprint and its
+    outputs still exist.
+    '''
+    return (
+        state['targets'].get(target) == fingerprint
+        and all(os.path.exists(output) for output in paths['outputs'])
+    )
+#endregion
+
+#region: _compute_fingerprint
+def _compute_fingerprint(paths, state):
+    '''
+    Compute a SHA-256 digest of the target's settings and the content of its
+    inputs.
+
+    Missing inputs are recorded as such, so that the target is processed again
+    once they become available.
+    '''
+    digest_for_input = {}  # initialize
+    for pattern in paths['inputs']:
+        file_paths = _expand_input(pattern)
+        if not file_paths:
+            digest_for_input[pattern] = None
+            continue
+        digest_for_input[pattern] = {
+            file_path : _file_digest(file_path, state)
+            for file_path in file_paths
+            }
+    data = {
+        'inputs' : digest_for_input,
+        'settings' : paths['settings']
+        }
+    data = json.dumps(data, sort_keys=True, default=str)
+    return hashlib.sha256(data.encode('utf-8')).hexdigest()
+#endregion
+
+#region: _expand_input
+def _expand_input(pattern):
+    '''
+    Get the sorted paths of all files corresponding to an input.
+
+    The input can be a file, a directory (all files within), or a glob
+    pattern.
+    '''
+    if os.path.isdir(pattern):
+        return sorted(
+            os.path.join(dirpath, f)
+            for dirpath, _, filenames in os.walk(pattern)
+            for f in filenames
+            )
+    return sorted(
+        path for path in glob.glob(pattern, recursive=True)
+        if os.path.isfile(path)
+        )
+#endregion
+
+#region: _file_digest
+def _file_digest(path, state, chunk_size=2**20):
+    '''
+    Compute (or retrieve) the SHA-256 digest of a file.
+
+    Digests are recorded in the state along with the file's modification time
+    and size. A file is only read again if either of these changed.
+    '''
+    stat = os.stat(path)
+    file_stats = [stat.st_mtime_ns, stat.st_size]
+    recorded = state['files'].get(path)
+    if recorded is not None and recorded[:2] == file_stats:
+        return recorded[2]
+
+    file_hash = hashlib.sha256()
+    with open(path, 'rb') as file:
+        for chunk in iter(lambda: file.read(chunk_size), b''):
+            file_hash.update(chunk)
+    digest = file_hash.hexdigest()
+    state['files'][path] = file_stats + [digest]
+    return digest
+#endregion
+
+#region: _read_state
+def _read_state(state_file):
+    '''
+    Read the state of the last build, if any.
+    '''
+    if not os.path.exists(state_file):
+        return {'targets' : {}, 'files' : {}}
+    with open(state_file, 'r') as file:
+        return json.load(file)
+#endregion
+
+#region: _write_state
+def _write_state(state, state_file):
+    '''
+    Write the state of the build such that the file is never left incomplete.
+    '''
+    directory = os.path.dirname(state_file) or '.'
+    os.makedirs(directory, exist_ok=True)
+
+    with tempfile.NamedTemporaryFile(
+            'w', dir=directory, suffix='.tmp', delete=False) as file:
+        json.dump(state, file, indent=2)
+    os.replace(file.name, state_file)
+#endregion
 
 if __name__ == '__main__':
     print('Preprocessing from raw...')
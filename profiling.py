@@ -0,0 +1,426 @@
+'''
+This module contains the `Profiler` class, which records where the time and
+memory of a modeling task go, e.g., data loading, cross-validation,
+permutation importances, the final fit, and writing the results.
+
+For each stage of the task, the following are recorded:
+    1. 'wall_time' : Elapsed time (s) of the stage in the process that runs
+    the task. Undefined for stages which consist only of parallel tasks.
+    2. 'cpu_time' : CPU time (s) of that process during the stage, plus the
+    CPU time of the tasks run by other (worker) processes.
+    3. 'task_time' : Sum of the elapsed times (s) of the parallel tasks, e.g.,
+    the fits of the cross-validation folds, wherever they ran.
+    4. 'n_fits', 'n_predicts' : Numbers of calls to fit() and predict().
+    5. 'peak_memory' : Peak resident set size (bytes) of any process during
+    the stage. On Linux, the peak is reset at the start of each stage and
+    task. Elsewhere, it is the peak since the start of each process.
+
+Stages are nested, e.g., 'cross_validate/feature_selection', and the values of
+a stage include those of its sub-stages. The stages are defined by the
+modules which do the work, with `stage()`, and are recorded only if a
+`Profiler` is active in the process. Work done by parallel workers is
+measured by wrapping each task with `call_counted()`, and the returned
+statistics are added to the stage with `add_task_stats()`.
+
+Example
+-------
+with Profiler() as profiler:
+    with profiling.stage('cross_validate'):
+        ...
+profile = profiler.to_frame()
+'''
+
+import os
+import sys
+import time
+import contextlib
+import pandas as pd
+
+try:
+    import resource
+except ImportError:  # e.g., Windows
+    resource = None
+
+METRICS = [
+    'wall_time',
+    'cpu_time',
+    'task_time',
+    'n_fits',
+    'n_predicts',
+    'peak_memory'
+    ]
+
+# Separator of the names of nested stages
+SEPARATOR = '/'
+
+# Active profilers and collectors of inline tasks in this process
+_profilers = []
+_collectors = []
+
+#region: Profiler.__init__
+class Profiler:
+    '''
+    Records the statistics of the stages of a task in the current process.
+
+    Used as a context manager, the profiler is active within the block.
+    '''
+    def __init__(self):
+        '''
+        Initialize the Profiler.
+        '''
+        self._stats_for_stage = {}  # in order of start
+        self._stack = []  # names of the current stages
+        self._get_stats([])  # the whole task, recorded as 'total'
+#endregion
+
+    #region: __enter__
+    def __enter__(self):
+        '''
+        Activate the profiler and start recording the whole task.
+        '''
+        _profilers.append(self)
+        reset_peak_memory()
+        self._wall_start = time.perf_counter()
+        self._cpu_start = time.process_time()
+        return self
+    #endregion
+
+    #region: __exit__
+    def __exit__(self, *exc_info):
+        '''
+        Stop recording the whole task and deactivate the profiler.
+        '''
+        stats = self._get_stats([])
+        stats['wall_time'] = time.perf_counter() - self._wall_start
+        stats['cpu_time'] += time.process_time() - self._cpu_start
+        self._update_peaks()
+        _profilers.remove(self)
+    #endregion
+
+    #region: stage
+    @contextlib.contextmanager
+    def stage(self, name):
+        '''
+        Context manager to record a stage, nested within the current stage.
+
+        Parameters
+        ----------
+        name : str
+            Name of the stage, e.g., 'cross_validate'.
+        '''
+        self._update_peaks()  # before resetting the peak for the stage
+        self._stack.append(name)
+        stats = self._get_stats(self._stack)
+        reset_peak_memory()
+        wall_start = time.perf_counter()
+        cpu_start = time.process_time()
+        try:
+            yield
+        finally:
+            stats['wall_time'] = (
+                _nan_to_zero(stats['wall_time'])
+                + time.perf_counter() - wall_start
+            )
+            stats['cpu_time'] += time.process_time() - cpu_start
+            self._update_peaks()
+            self._stack.pop()
+    #endregion
+
+    #region: count
+    def count(self, name, n=1):
+        '''
+        Add to a count (e.g., 'n_fits') of the current stages.
+        '''
+        for path in self._get_current_paths():
+            self._get_stats(path)[name] += n
+    #endregion
+
+    #region: add_task_stats
+    def add_task_stats(self, task_stats, stage=None):
+        '''
+        Add the statistics of a task to the current stages.
+
+        Parameters
+        ----------
+        task_stats : dict
+            As returned by `call_counted()`.
+        stage : str, optional
+            Name of a sub-stage of the current stage to which the task also
+            belongs, e.g., 'feature_selection'.
+        '''
+        paths = self._get_current_paths()
+        if stage is not None:
+            paths.append(self._stack + [stage])
+        is_other_process = task_stats['pid'] != os.getpid()
+
+        for i, path in enumerate(paths):
+            stats = self._get_stats(path)
+            stats['task_time'] += task_stats['task_time']
+            stats['n_fits'] += task_stats['n_fits']
+            stats['n_predicts'] += task_stats['n_predicts']
+            stats['peak_memory'] = max(
+                stats['peak_memory'], task_stats['peak_memory'])
+            is_sub_stage = stage is not None and i == len(paths) - 1
+            if is_other_process or is_sub_stage:
+                # Otherwise, the CPU time is included in that of the stage
+                stats['cpu_time'] += task_stats['cpu_time']
+    #endregion
+
+    #region: to_frame
+    def to_frame(self):
+        '''
+        Get the statistics of all stages.
+
+        Returns
+        -------
+        pandas.DataFrame
+            One row per stage, in order of start, starting with the whole 
+            task ('total'), and one column per metric. All values are float.
+        '''
+        profile = pd.DataFrame.from_dict(
+            self._stats_for_stage, orient='index', columns=METRICS,
+            dtype='float64')
+        profile.index.name = 'stage'
+        profile.columns.name = 'metric'
+        return profile
+    #endregion
+
+    #region: _get_stats
+    def _get_stats(self, path):
+        '''
+        Get the statistics of a stage, given the names of the stage and its
+        parents, initializing them if needed.
+        '''
+        key = SEPARATOR.join(path) or 'total'
+        if key not in self._stats_for_stage:
+            self._stats_for_stage[key] = {
+                'wall_time' : float('nan'),
+                'cpu_time' : 0.,
+                'task_time' : 0.,
+                'n_fits' : 0,
+                'n_predicts' : 0,
+                'peak_memory' : 0
+            }
+        return self._stats_for_stage[key]
+    #endregion
+
+    #region: _update_peaks
+    def _update_peaks(self):
+        '''
+        Update the peak memory of the current stages with the peak of this
+        process.
+        '''
+        peak_memory = get_peak_memory() or 0
+        for path in self._get_current_paths():
+            stats = self._get_stats(path)
+            stats['peak_memory'] = max(stats['peak_memory'], peak_memory)
+    #endregion
+
+    #region: _get_current_paths
+    def _get_current_paths(self):
+        '''
+        Get the paths of the whole task and of each current stage.
+        '''
+        return [self._stack[:i] for i in range(len(self._stack)+1)]
+    #endregion
+
+#region: stage
+def stage(name):
+    '''
+    Context manager to record a stage in the active profiler, if any.
+
+    Parameters
+    ----------
+    name : str
+        Name of the stage, e.g., 'cross_validate'.
+    '''
+    if not _profilers or _collectors:
+        return contextlib.nullcontext()
+    return _profilers[-1].stage(name)
+#endregion
+
+#region: count
+def count(name, n=1):
+    '''
+    Add to a count of the current task or stages, if any.
+
+    Parameters
+    ----------
+    name : str
+        'n_fits' or 'n_predicts'.
+    n : int, optional
+        Number of calls. Default 1.
+    '''
+    if _collectors:
+        _collectors[-1][name] += n
+    elif _profilers:
+        _profilers[-1].count(name, n)
+#endregion
+
+#region: call_counted
+def call_counted(function, *args, **kwargs):
+    '''
+    Call a function and measure it as a task, e.g., in a parallel worker.
+
+    Returns
+    -------
+    result : object
+        The result of the function.
+    task_stats : dict
+        Elapsed time ('task_time'), 'cpu_time', 'n_fits', 'n_predicts', and
+        'peak_memory' of the call, and the 'pid' of the process. To be passed
+        to `add_task_stats()`.
+    '''
+    if _profilers:
+        _profilers[-1]._update_peaks()  # before resetting the peak
+    task_stats = {'n_fits' : 0, 'n_predicts' : 0, 'pid' : os.getpid()}
+    _collectors.append(task_stats)
+    reset_peak_memory()
+    wall_start = time.perf_counter()
+    cpu_start = time.process_time()
+    try:
+        result = function(*args, **kwargs)
+    finally:
+        _collectors.pop()
+    task_stats['task_time'] = time.perf_counter() - wall_start
+    task_stats['cpu_time'] = time.process_time() - cpu_start
+    task_stats['peak_memory'] = get_peak_memory() or 0
+    return result, task_stats
+#endregion
+
+#region: add_task_stats
+def add_task_stats(task_stats, stage=None):
+    '''
+    Add the statistics of a task to the current stages of the active
+    profiler, if any. Refer to `Profiler.add_task_stats()`.
+    '''
+    if _collectors:
+        # Nested task run inline, e.g., with n_jobs=1
+        for name in ('n_fits', 'n_predicts'):
+            _collectors[-1][name] += task_stats[name]
+    elif _profilers:
+        _profilers[-1].add_task_stats(task_stats, stage=stage)
+#endregion
+
+#region: summarize
+def summarize(profile, n=10):
+    '''
+    Get the top time sinks across model keys.
+
+    Parameters
+    ----------
+    profile : pandas.DataFrame
+        Combined profiles, with the model key and stage as index levels and
+        the metrics as columns.
+    n : int, optional
+        Number of rows. Default 10.
+
+    Returns
+    -------
+    pandas.DataFrame
+        The innermost stages with a wall time, i.e., whose sub-stages (if 
+        any) consist only of parallel tasks, sorted by wall time. These 
+        stages do not overlap within a model key, so that the 'share' of the 
+        total wall time of all model keys sums to at most 1. The summed time 
+        of the parallel tasks ('task_time') is reported separately, because 
+        it is not comparable to the wall time.
+    '''
+    stage_level = profile.index.names.index('stage')
+    stages = profile.index.get_level_values('stage')
+    timed = profile[profile['wall_time'].notna() & (stages != 'total')]
+
+    # Stages with a timed sub-stage, as (model key, stage) index tuples
+    parent_indices = set()
+    for index in timed.index:
+        index = _as_tuple(index)
+        path = index[stage_level].split(SEPARATOR)
+        for i in range(1, len(path)):
+            parent_indices.add(
+                index[:stage_level] 
+                + (SEPARATOR.join(path[:i]),) 
+                + index[stage_level+1:]
+            )
+    is_innermost = [
+        _as_tuple(index) not in parent_indices for index in timed.index]
+    summary = timed[is_innermost].copy()
+
+    total_wall_time = profile.loc[stages == 'total', 'wall_time'].sum()
+    summary.insert(
+        1, 'share', summary['wall_time'] / total_wall_time)
+    return summary.sort_values('wall_time', ascending=False).head(n)
+#endregion
+
+#region: get_peak_memory
+def get_peak_memory():
+    '''
+    Get the peak resident set size (bytes) of the current process since the
+    last reset (Linux), or since the start of the process.
+
+    Returns
+    -------
+    int or None
+        None if not available.
+    '''
+    peak_memory = _read_proc_status('VmHWM')
+    if peak_memory is not None or resource is None:
+        return peak_memory
+    peak_memory = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak_memory if sys.platform == 'darwin' else peak_memory * 1024
+#endregion
+
+#region: get_memory
+def get_memory():
+    '''
+    Get the current resident set size (bytes) of the current process, or the
+    peak if not available.
+    '''
+    memory = _read_proc_status('VmRSS')
+    return memory if memory is not None else get_peak_memory()
+#endregion
+
+#region: reset_peak_memory
+def reset_peak_memory():
+    '''
+    Reset the peak resident set size of the current process, if supported
+    (Linux).
+    '''
+    try:
+        with open('/proc/self/clear_refs', 'w') as file:
+            file.write('5')
+    except OSError:
+        pass
+#endregion
+
+#region: _read_proc_status
+def _read_proc_status(field):
+    '''
+    Helper function to read a memory field (bytes) from /proc/self/status,
+    or None if not available.
+    '''
+    try:
+        with open('/proc/self/status', 'r') as file:
+            for line in file:
+                if line.startswith(field + ':'):
+                    return int(line.split()[1]) * 1024  # from kB
+    except OSError:
+        pass
+    return None
+#endregion
+
+#region: _as_tuple
+def _as_tuple(index):
+    '''
+    Helper function to get an index value as a tuple, e.g., for a single 
+    index level.
+    '''
+    return index if isinstance(index, tuple) else (index,)
+#endregion
+
+#region: _nan_to_zero
+def _nan_to_zero(value):
+    '''
+    Helper function to replace NaN with zero, e.g., for a stage entered
+    for the first time.
+    '''
+    return 0. if value != value else value
+#endregion
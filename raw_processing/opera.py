@@ -14,6 +14,7 @@ import pandas as pd
 import numpy as np
 import os
 import logging
+from joblib import Parallel, delayed
 
 from . import utilities
 
@@ -36,7 +37,8 @@ def process_all_batches(
         discrete_suffix=None, 
         log10_pat='Log', 
         data_write_path=None, 
-        flags_write_path=None
+        flags_write_path=None,
+        n_jobs=None
         ):
     '''
     Process all directories in the given main directory, where each directory 
@@ -44,6 +46,12 @@ def process_all_batches(
 
     The results are concatenated across batches.
 
+    Parameters
+    ----------
+    n_jobs : int, optional
+        Number of batches to process in parallel. See joblib.Parallel for 
+        reference. Default is None, i.e., batches are processed serially.
+
     Returns
     -------
     - Applicability domain flags (pandas.DataFrame)
@@ -56,32 +64,37 @@ def process_all_batches(
         filemode='w'  # overwrite any existing log file
         )
 
+    batch_kwargs = dict(
+        index_name=index_name, 
+        discrete_columns=discrete_columns, 
+        discrete_suffix=discrete_suffix, 
+        log10_pat=log10_pat
+    )
+
     # Initialize the containers for all batches.
     predictions, AD_flags = [], []
 
     ## Extract the data for each batch/subdirectory of chemicals
-    for entry in os.listdir(main_dir):
-        logging.info(f"Processing directory: {entry}")
-        data_dir = os.path.join(main_dir, entry)
-
-        if os.path.isdir(data_dir):
-            try:
-                batch_predictions, batch_AD_flags = (
-                    extract_predictions_and_app_domains(
-                        data_dir, 
-                        columns_for_model, 
-                        index_name=index_name, 
-                        discrete_columns=discrete_columns, 
-                        discrete_suffix=discrete_suffix, 
-                        log10_pat=log10_pat
-                    )
-                )
-                predictions.append(batch_predictions)
-                AD_flags.append(batch_AD_flags)
-            except Exception as e:
-                logging.error(
-                    f"Skipping directory {entry} due to error: {str(e)}")
-                continue
+    if n_jobs is None or n_jobs == 1:
+        for entry in os.listdir(main_dir):
+            logging.info(f"Processing directory: {entry}")
+            batch_results, error = _process_batch(
+                main_dir, entry, columns_for_model, **batch_kwargs)
+            _collect_batch_results(
+                entry, batch_results, error, predictions, AD_flags)
+    else:
+        # The workers return any errors to be logged by this process.
+        entries = os.listdir(main_dir)
+        all_batch_results = Parallel(n_jobs=n_jobs)(
+            delayed(_process_batch)(
+                main_dir, entry, columns_for_model, **batch_kwargs)
+            for entry in entries
+        )
+        for entry, (batch_results, error) in zip(entries, all_batch_results):
+            logging.info(f"Processing directory: {entry}")
+            _collect_batch_results(
+                entry, batch_results, error, predictions, AD_flags)
+
     predictions = pd.concat(predictions)
     AD_flags = pd.concat(AD_flags)
 
@@ -92,6 +105,50 @@ def process_all_batches(
 
     return predictions, AD_flags
 #endregion
+
+#region: _process_batch
+def _process_batch(main_dir, entry, columns_for_model, **kwargs):
+    '''
+    Helper function to process a single batch/subdirectory of chemicals.
+
+    Any error is returned rather than raised, so that the batch can be 
+    skipped and logged.
+
+    Returns
+    -------
+    batch_results : tuple of pandas.DataFrame, or None
+        Predictions and applicability domain flags. None if the entry is not 
+        a directory or an error occurred.
+    error : str or None
+        The error message, if any.
+    '''
+    data_dir = os.path.join(main_dir, entry)
+    if not os.path.isdir(data_dir):
+        return None, None
+    try:
+        batch_results = extract_predictions_and_app_domains(
+            data_dir, 
+            columns_for_model, 
+            **kwargs
+        )
+        return batch_results, None
+    except Exception as e:
+        return None, str(e)
+#endregion
+
+#region: _collect_batch_results
+def _collect_batch_results(entry, batch_results, error, predictions, AD_flags):
+    '''
+    Helper function to append the results of a batch to the containers or to 
+    log the error.
+    '''
+    if error is not None:
+        logging.error(f"Skipping directory {entry} due to error: {error}")
+    elif batch_results is not None:
+        batch_predictions, batch_AD_flags = batch_results
+        predictions.append(batch_predictions)
+        AD_flags.append(batch_AD_flags)
+#endregion
     
 #region: extract_predictions_and_app_domains
 def extract_predictions_and_app_domains(
@@ -107,13 +164,21 @@ def extract_predictions_and_app_domains(
     '''
     Process a single batch of chemicals/samples.
 
+    Each model CSV file is read only once to extract both the predictions and 
+    the applicability domain flags.
+
     Returns
     -------
     - Applicability domain flags (pandas.DataFrame)
     - Predictions (pandas.DataFrame)
     '''
-    AD_flags = extract_app_domains_from_csv_files(
+    data_for_model = _load_model_data_from_csv_files(
         data_dir, 
+        columns_for_model
+        )
+
+    AD_flags = _app_domains_from_model_data(
+        data_for_model, 
         columns_for_model, 
         index_name=index_name,
         discrete_columns=discrete_columns, 
@@ -122,8 +187,8 @@ def extract_predictions_and_app_domains(
         write_path=flags_write_path
     )
 
-    predictions = extract_predictions_from_csv_files(
-        data_dir, 
+    predictions = _predictions_from_model_data(
+        data_for_model, 
         columns_for_model, 
         index_name=index_name, 
         discrete_columns=discrete_columns, 
@@ -139,6 +204,35 @@ def extract_predictions_and_app_domains(
     return predictions, AD_flags
 #endregion
 
+#region: _load_model_data_from_csv_files
+def _load_model_data_from_csv_files(data_dir, columns_for_model):
+    '''
+    Helper function to load the OPERA output for each model of interest.
+
+    Parameters
+    ----------
+    data_dir : str
+        Path to the data directory. 
+    columns_for_model : dict 
+        Mapping of OPERA2.9 model names (str) to the desired column names 
+        (str) in the data CSV file.
+
+    Returns
+    -------
+    dict
+        Mapping of model names to the data (pandas.DataFrame) in the order of 
+        the files in the directory.
+    '''
+    data_for_model = {}  # initialize
+    for entry in os.listdir(data_dir):
+        if entry.endswith('.csv'):
+            model_name = _extract_model_name_from_file_name(entry)
+            if model_name in list(columns_for_model):
+                data_for_model[model_name] = _model_data_from_csv(
+                    data_dir, entry)
+    return data_for_model
+#endregion
+
 #region: extract_predictions_from_csv_files
 def extract_predictions_from_csv_files(
         data_dir, 
@@ -180,13 +274,43 @@ def extract_predictions_from_csv_files(
     pandas.DataFrame
         Axis 0 = chemical ID; Axis 1 = feature.
     '''
-    predictions = []  # initialize
-    for entry in os.listdir(data_dir):
-        if entry.endswith('.csv'):
-            model_name = _extract_model_name_from_file_name(entry)
-            if model_name in list(columns_for_model):
-                model_data = _model_data_from_csv(data_dir, entry)
-                predictions.append(model_data[columns_for_model[model_name]])
+    data_for_model = _load_model_data_from_csv_files(
+        data_dir, 
+        columns_for_model
+        )
+
+    return _predictions_from_model_data(
+        data_for_model, 
+        columns_for_model, 
+        index_name=index_name, 
+        discrete_columns=discrete_columns, 
+        discrete_suffix=discrete_suffix, 
+        log10_pat=log10_pat, 
+        flags=flags, 
+        write_path=write_path
+        )
+#endregion
+
+#region: _predictions_from_model_data
+def _predictions_from_model_data(
+        data_for_model, 
+        columns_for_model, 
+        index_name=None, 
+        discrete_columns=None, 
+        discrete_suffix=None, 
+        log10_pat='Log', 
+        flags=None, 
+        write_path=None
+        ):
+    '''
+    Helper function to extract the predictions from the loaded OPERA data.
+
+    Refer to `extract_predictions_from_csv_files` for documentation.
+    '''
+    predictions = [
+        model_data[columns_for_model[model_name]]
+        for model_name, model_data in data_for_model.items()
+    ]
 
     ## Assemble the final DataFrame.
 
@@ -268,17 +392,34 @@ def set_unreliable_values(predictions, AD_flags):
     ValueError
         If the columns of 'AD_flags' are not in 'predictions'.
     '''
-    predictions = predictions.copy()
-
     shared_features = AD_flags.columns.intersection(predictions.columns)
     if len(shared_features) != len(AD_flags.columns):
         raise ValueError('The columns of "AD_flags" must be in "predictions"')
-        
-    for feature in shared_features:
-        where_unreliable = AD_flags[feature]
-        predictions.loc[where_unreliable, feature] = np.NaN    
 
-    return predictions
+    # Align the flags once. Chemicals without flags are considered reliable
+    where_unreliable = (
+        AD_flags[shared_features]
+        .reindex(predictions.index)
+        .fillna(False)
+        .to_numpy(dtype=bool)
+    )
+
+    # NOTE: As with pandas' `.loc` assignment, all flagged columns become 
+    # float, even if no value is unreliable
+    values = predictions[shared_features].to_numpy(dtype='float64')
+    values[where_unreliable] = np.NaN
+    masked = pd.DataFrame(
+        values, 
+        index=predictions.index, 
+        columns=shared_features
+        )
+    # Reassemble in a single step rather than column by column
+    other_features = predictions.columns.difference(
+        shared_features, sort=False)
+    return (
+        pd.concat([predictions[other_features], masked], axis=1)
+        [predictions.columns]
+    )
 #endregion
 
 #region: extract_app_domains_from_csv_files
@@ -302,38 +443,67 @@ def extract_app_domains_from_csv_files(
     ----------
     https://doi.org/10.1186/s13321-018-0263-1
     '''
-    AD_flags = {}   # initialize
+    data_for_model = _load_model_data_from_csv_files(
+        data_dir, 
+        columns_for_model
+        )
 
-    for entry in os.listdir(data_dir):
-        if entry.endswith('.csv'):
-            model_name = _extract_model_name_from_file_name(entry)
-            if model_name in list(columns_for_model):
-                model_data = _model_data_from_csv(data_dir, entry)
+    return _app_domains_from_model_data(
+        data_for_model, 
+        columns_for_model, 
+        index_name=index_name, 
+        discrete_columns=discrete_columns, 
+        discrete_suffix=discrete_suffix, 
+        log10_pat=log10_pat, 
+        write_path=write_path
+        )
+#endregion
+
+#region: _app_domains_from_model_data
+def _app_domains_from_model_data(
+        data_for_model, 
+        columns_for_model, 
+        index_name=None, 
+        discrete_columns=None, 
+        discrete_suffix=None, 
+        log10_pat=None, 
+        write_path=None
+        ):
+    '''
+    Helper function to extract the applicability domain flags from the loaded 
+    OPERA data.
+
+    Refer to `extract_app_domains_from_csv_files` for documentation.
+    '''
+    AD_flags = []   # initialize
+
+    for model_name, model_data in data_for_model.items():
+        where_ADs = model_data.columns.str.contains('^AD_')
+        AD_columns = model_data.columns[where_ADs]
         
-                where_ADs = model_data.columns.str.contains('^AD_')
-                ADs = model_data.loc[:, where_ADs]
-                
-                feature_columns = columns_for_model[model_name]
-                if list(ADs):
-                    N_ADs = len(ADs.columns)
-                    if N_ADs == 2: 
-                        # All features share a pair of ADs: 'global' and 'local'.
-                        for feature in feature_columns:
-                            AD_flags[feature] = (
-                                is_outside_applicability_domain(ADs)
-                                )
-                    elif N_ADs//2 == len(feature_columns):
-                        # Each feature has its own pair of ADs.
-                        for feature in feature_columns:
-                            where_feature_ADs = ADs.columns.str.contains(
-                                feature.strip('_pred'))
-                            feature_specific_ADs = ADs.loc[:, where_feature_ADs]
-                            AD_flags[feature] = (
-                                is_outside_applicability_domain(feature_specific_ADs)
-                                )
+        feature_columns = columns_for_model[model_name]
+        if list(AD_columns):
+            N_ADs = len(AD_columns)
+            if N_ADs == 2: 
+                # All features share a pair of ADs: 'global' and 'local'.
+                AD_columns_for_feature = {
+                    feature : list(AD_columns) for feature in feature_columns}
+            elif N_ADs//2 == len(feature_columns):
+                # Each feature has its own pair of ADs.
+                AD_columns_for_feature = {
+                    feature : list(AD_columns[
+                        AD_columns.str.contains(feature.strip('_pred'))])
+                    for feature in feature_columns
+                }
+            else:
+                continue
+            AD_flags.append(
+                flag_outside_applicability_domains(
+                    model_data, AD_columns_for_feature)
+            )
 
     ## Assemble the final DataFrame.
-    AD_flags = pd.DataFrame(AD_flags)
+    AD_flags = _concatenate_flags(AD_flags)
 
     original_columns = [c for c in get_original_columns(columns_for_model) if c in AD_flags]
     AD_flags = AD_flags[original_columns]
@@ -359,6 +529,77 @@ def extract_app_domains_from_csv_files(
     return AD_flags
 #endregion
 
+#region: flag_outside_applicability_domains
+def flag_outside_applicability_domains(ADs, AD_columns_for_feature):
+    '''
+    Find chemicals that may be unreliable, for several features at once.
+
+    Vectorized equivalent of `is_outside_applicability_domain()` applied to 
+    each feature. The global and local applicability domains of all features 
+    are compared in a single operation.
+
+    Parameters
+    ----------
+    ADs : pandas.DataFrame
+        Data of an OPERA model, including the applicability domain columns.
+    AD_columns_for_feature : dict
+        Mapping of each feature (str) to its pair of applicability domain 
+        columns in 'ADs'. Several features may share the same pair.
+
+    Returns
+    -------
+    pandas.DataFrame
+        Boolean mask with one column per feature.
+
+    See Also
+    --------
+    is_outside_applicability_domain()
+    '''
+    # Each distinct pair of ADs is evaluated only once
+    where_outside_for_pair = {}  # initialize
+    pairs = []
+    for AD_columns in AD_columns_for_feature.values():
+        pair = _split_applicability_domain_column_names(AD_columns)
+        if pair not in where_outside_for_pair:
+            global_AD_column, local_AD_column = pair
+            where_outside_for_pair[pair] = (
+                (ADs[global_AD_column].to_numpy() == 0.) 
+                & (ADs[local_AD_column].to_numpy() < 0.4)
+            )
+        pairs.append(pair)
+
+    where_outside = np.column_stack(
+        [where_outside_for_pair[pair] for pair in pairs])
+
+    return pd.DataFrame(
+        where_outside, 
+        index=ADs.index, 
+        columns=list(AD_columns_for_feature)
+        )
+#endregion
+
+#region: _concatenate_flags
+def _concatenate_flags(AD_flags):
+    '''
+    Helper function to concatenate the AD flags of several models.
+
+    If all models share the same chemicals (the typical case), the flags are 
+    stacked into a single boolean array. Otherwise, the index is the sorted 
+    union, consistent with the pandas.DataFrame constructor.
+    '''
+    if not AD_flags:
+        return pd.DataFrame()
+
+    index = AD_flags[0].index
+    if all(flags.index.equals(index) for flags in AD_flags[1:]):
+        return pd.DataFrame(
+            np.hstack([flags.to_numpy() for flags in AD_flags]),
+            index=index,
+            columns=[column for flags in AD_flags for column in flags]
+            )
+    return pd.concat(AD_flags, axis=1, sort=True)
+#endregion
+
 #region: is_outside_applicability_domain
 def is_outside_applicability_domain(global_local_ADs):
     '''
@@ -413,19 +654,58 @@ def split_applicability_domain_columns(global_local_ADs):
             '"global_local_ADs" must have exactly two columns: '
             'one global, one local')
 
-    ## Identify the relevant column names.
+    global_AD_column, local_AD_column = _identify_global_and_local_columns(
+        global_local_ADs.columns)
+
+    global_ADs = global_local_ADs[global_AD_column].squeeze()
+    local_AD_indexes = global_local_ADs[local_AD_column].squeeze()
+
+    return global_ADs, local_AD_indexes
+#endregion
+
+#region: _split_applicability_domain_column_names
+def _split_applicability_domain_column_names(AD_columns):
+    '''
+    Helper function to get the names of the global and local applicability 
+    domain columns in a pair.
+
+    Raises
+    ------
+    ValueError
+        If the pair does not contain exactly one global and one local column.
+
+    See Also
+    --------
+    split_applicability_domain_columns()
+    '''
+    global_AD_column, local_AD_column = _identify_global_and_local_columns(
+        AD_columns)
+    if len(global_AD_column) != 1 or len(local_AD_column) != 1:
+        raise ValueError(
+            'Expected exactly two applicability domain columns: '
+            f'one global, one local. Got {list(AD_columns)}')
+    return global_AD_column[0], local_AD_column[0]
+#endregion
+
+#region: _identify_global_and_local_columns
+def _identify_global_and_local_columns(AD_columns):
+    '''
+    Helper function to identify the global and local applicability domain 
+    columns, following the naming convention of OPERA 2.9.
+
+    Returns
+    -------
+    global_AD_column : list of str
+    local_AD_column : list of str
+    '''
     global_AD_column = []
     local_AD_column = []
-    for col in global_local_ADs:
+    for col in AD_columns:
         if col.startswith('AD_') and 'index' not in col:
             global_AD_column.append(col)
         elif col.startswith('AD_index'):
             local_AD_column.append(col)
-
-    global_ADs = global_local_ADs[global_AD_column].squeeze()
-    local_AD_indexes = global_local_ADs[local_AD_column].squeeze()
-
-    return global_ADs, local_AD_indexes
+    return global_AD_column, local_AD_column
 #endregion
 
 #region: chemicals_to_exclude_from_qsar
@@ -51,6 +51,8 @@ class RawDataProcessor:
         self._path_settings = path_settings 
         # NOTE: Only DTXSID identifier has been tested
         self._index_col = 'DTXSID'
+        # Number of parallel jobs for the most expensive steps, if specified
+        self._n_jobs = getattr(raw_data_settings, 'n_jobs', None)
 
         # Map data types to their respective processing function
         self.dispatcher = {
@@ -77,6 +79,142 @@ class RawDataProcessor:
         return self.dispatcher[data_type]()
     #endregion
 
+    #region: get_build_targets
+    def get_build_targets(self):
+        '''
+        Declare the inputs, outputs, and settings of each target in the
+        dispatcher.
+
+        This enables incremental builds, where a target is processed only if
+        any of its inputs or settings changed (see preprocess.py). A target
+        implicitly depends on any other target whose outputs are among its
+        inputs.
+
+        Returns
+        -------
+        dict
+            Mapping of each data type (str) to a dict with the keys:
+            - 'inputs' : list of str. Paths to files or directories, or glob
+            patterns.
+            - 'outputs' : list of str. Paths to files or directories.
+            - 'settings' : list. Configuration values used by the target.
+        '''
+        raw_data_settings = self._raw_data_settings
+        data_settings = self._data_settings
+        path_settings = self._path_settings
+        file_for_features_source = path_settings.file_for_features_source
+        dsstox_compiled = self._build_path_dsstox_compiled()
+
+        return {
+            'dsstox_sdf_data' : {
+                'inputs' : [
+                    os.path.join(path_settings.dsstox_sdf_dir, '**', '*.sdf')
+                    ],
+                'outputs' : [
+                    dsstox_compiled,
+                    self._build_path_dsstox_identifiers()
+                    ],
+                'settings' : [
+                    raw_data_settings.dsstox_sdf_dtxsid_column,
+                    raw_data_settings.dsstox_sdf_casrn_column,
+                    getattr(raw_data_settings, 'dsstox_sdf_fields', None)
+                    ]
+            },
+            'opera_features' : {
+                'inputs' : [
+                    os.path.join(
+                        path_settings.raw_opera_features_dir, '*', '*.csv')
+                    ],
+                'outputs' : [
+                    file_for_features_source['opera'],
+                    path_settings.opera_AD_file
+                    ],
+                'settings' : [
+                    self._index_col,
+                    raw_data_settings.opera_features_for_model,
+                    raw_data_settings.opera_log10_pat,
+                    data_settings.discrete_columns_for_source['opera'],
+                    data_settings.discrete_column_suffix
+                    ]
+            },
+            'comptox_features' : {
+                'inputs' : [
+                    path_settings.raw_comptox_features_file,
+                    path_settings.chemical_identifiers_file,
+                    path_settings.opera_structures_file
+                    ],
+                'outputs' : [file_for_features_source['comptox']],
+                'settings' : [
+                    self._index_col,
+                    raw_data_settings.comptox_columns_to_exclude,
+                    raw_data_settings.comptox_log10_pat
+                    ]
+            },
+            'rdkit_features' : {
+                'inputs' : [path_settings.opera_structures_file],
+                'outputs' : [file_for_features_source['rdkit']],
+                'settings' : [
+                    self._index_col,
+                    data_settings.discrete_column_suffix
+                    ]
+            },
+            'surrogate_pods' : {
+                'inputs' : [path_settings.raw_surrogate_pods_file],
+                'outputs' : [path_settings.surrogate_pods_file],
+                'settings' : [
+                    self._index_col,
+                    raw_data_settings.tox_metric,
+                    raw_data_settings.surrogate_tox_data_kwargs,
+                    raw_data_settings.do_log10_target,
+                    raw_data_settings.effect_mapper
+                    ]
+            },
+            'authoritative_pods' : {
+                'inputs' : [
+                    path_settings.raw_authoritative_pods_file,
+                    dsstox_compiled
+                    ],
+                'outputs' : [path_settings.authoritative_pods_file],
+                'settings' : [
+                    self._index_col,
+                    raw_data_settings.auth_data_kwargs,
+                    raw_data_settings.auth_file_ilocs_for_effect,
+                    raw_data_settings.dsstox_sdf_dtxsid_column,
+                    raw_data_settings.dsstox_sdf_casrn_column
+                    ]
+            },
+            'experimental_ld50s' : {
+                'inputs' : [
+                    path_settings.raw_ld50_experimental_file,
+                    dsstox_compiled
+                    ],
+                'outputs' : [path_settings.ld50_experimental_file],
+                'settings' : [
+                    self._index_col,
+                    raw_data_settings.ld50_exp_column,
+                    raw_data_settings.dsstox_sdf_dtxsid_column,
+                    raw_data_settings.dsstox_sdf_casrn_column
+                    ]
+            },
+            'seem3_exposure_data' : {
+                'inputs' : [path_settings.raw_seem3_exposure_file],
+                'outputs' : [path_settings.seem3_exposure_file],
+                'settings' : [
+                    self._index_col,
+                    raw_data_settings.seem3_data_kwargs
+                    ]
+            },
+            'toxcast_oeds' : {
+                'inputs' : [path_settings.raw_toxcast_oeds_file],
+                'outputs' : [path_settings.toxcast_oeds_file],
+                'settings' : [
+                    self._index_col,
+                    raw_data_settings.oed_data_kwargs
+                    ]
+            }
+        }
+    #endregion
+
     #region: _dsstox_sdf_data_from_raw
     def _dsstox_sdf_data_from_raw(self):
         '''
@@ -85,38 +223,56 @@ class RawDataProcessor:
         This method reads SDF files containing chemical identifiers and other
         data from the DSSTox database. The data are distributed across 
         multiple SDF files where each file contains several thousand unique 
-        chemicals. The resulting DataFrame is written to a Parquet file.
+        chemicals. The records are streamed to a Parquet dataset (directory),
+        one part file per SDF file, so the whole database is never held in 
+        memory.
+
+        Only the fields in 'dsstox_sdf_fields' are extracted, if specified in
+        the raw data configuration. The DTXSID and CASRN columns are always 
+        included.
 
         Returns
         -------
-        pandas.DataFrame
-            SDF data for all batches of chemicals.
+        pandas.Series
+            DTXSID for all batches of chemicals.
 
         References
         ----------
         https://www.epa.gov/comptox-tools/comptox-chemicals-dashboard-release-notes#latest%20version
         '''
-        sdf_data = rdkit_utilities.sdf_to_dataframe(
+        dtxsid_column = self._raw_data_settings.dsstox_sdf_dtxsid_column
+        casrn_column = self._raw_data_settings.dsstox_sdf_casrn_column
+
+        fields = getattr(self._raw_data_settings, 'dsstox_sdf_fields', None)
+        if fields is not None:
+            required = [dtxsid_column, casrn_column]
+            fields = required + [f for f in fields if f not in required]
+
+        write_path = self._build_path_dsstox_compiled()
+        rdkit_utilities.sdf_to_parquet_dataset(
             self._path_settings.dsstox_sdf_dir,
-            write_path=self._build_path_dsstox_compiled()
+            write_path,
+            fields=fields,
+            n_jobs=self._n_jobs
             )
 
         # Write the DTXSID column to a text file for OPERA 2.9
-        dtxsid_column = self._raw_data_settings.dsstox_sdf_dtxsid_column
+        dtxsids = pd.read_parquet(write_path, columns=[dtxsid_column])
+        dtxsids = dtxsids[dtxsid_column]
         dtxsid_file = self._build_path_dsstox_identifiers()
         utilities.ensure_directory_exists(dtxsid_file)
-        sdf_data[dtxsid_column].to_csv(dtxsid_file, header=False, index=False)
+        dtxsids.to_csv(dtxsid_file, header=False, index=False)
 
-        return sdf_data
+        return dtxsids
     #endregion
 
     #region: _build_path_dsstox_compiled
     def _build_path_dsstox_compiled(self):
         '''
-        Helper function to build a path to the output file containing all 
-        DSSTox data.
+        Helper function to build a path to the output Parquet dataset 
+        containing all DSSTox data.
 
-        The file name is derived from the directory name and extension.
+        The dataset name is derived from the directory name and extension.
         '''
         sdf_directory = self._path_settings.dsstox_sdf_dir
         directory_name = os.path.split(sdf_directory)[-1]
@@ -177,6 +333,9 @@ class RawDataProcessor:
 
         Additionally, applicability domain (AD) flags are extracted and saved.
 
+        If 'n_jobs' is specified in the raw data configuration, the batches 
+        are processed in parallel.
+
         Returns
         -------
         tuple of pandas.DataFrame
@@ -191,7 +350,8 @@ class RawDataProcessor:
             index_name=self._index_col, 
             discrete_columns=self._data_settings.discrete_columns_for_source['opera'],
             discrete_suffix=self._data_settings.discrete_column_suffix,
-            log10_pat=self._raw_data_settings.opera_log10_pat
+            log10_pat=self._raw_data_settings.opera_log10_pat,
+            n_jobs=self._n_jobs
         )
         # Drop any chemicals missing all features (e.g., inorganics)
         X_opera = X_opera.dropna(how='all')
@@ -244,12 +404,14 @@ class RawDataProcessor:
         # Extract and process two-dimensional molecular descriptors from the
         RDKit library.
 
-        The processed data are saved to a parquet file on disk.
+        The processed data are saved to a parquet file on disk. If 
+        'rdkit_chunk_size' is specified in the raw data configuration, the 
+        descriptors are computed in chunks and streamed to disk.
 
         Returns
         -------
         pandas.DataFrame
-            The processed RDKit features.
+            The processed RDKit features. None if computed in chunks.
         '''
         # Get the QSAR-ready SMILES from OPERA
         smi_file = self._path_settings.opera_structures_file
@@ -261,7 +423,10 @@ class RawDataProcessor:
             smiles_for_chem,
             self._index_col,
             discrete_suffix=self._data_settings.discrete_column_suffix,
-            write_path=self._path_settings.file_for_features_source['rdkit']
+            write_path=self._path_settings.file_for_features_source['rdkit'],
+            chunk_size=getattr(
+                self._raw_data_settings, 'rdkit_chunk_size', None),
+            n_jobs=self._n_jobs
         )
     #endregion
 
@@ -3,9 +3,18 @@ This module contains utility functions that leverage the RDKit package.
 '''
 
 from rdkit.Chem import PandasTools
-from rdkit.Chem import MolFromSmiles, Descriptors
+from rdkit.Chem import MolFromSmiles, MolToSmiles, Descriptors
+from rdkit.Chem import ForwardSDMolSupplier
 from rdkit.ML.Descriptors import MoleculeDescriptors
 import pandas as pd
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+from concurrent.futures import ProcessPoolExecutor
+import itertools
+import collections
+import shutil
+import tempfile
 import os
 
 from . import utilities
@@ -57,13 +66,328 @@ def sdf_to_dataframe(sdf_directory, write_path=None):
     return sdf_data
 #endregion
 
+#region: sdf_to_parquet_dataset
+def sdf_to_parquet_dataset(
+        sdf_directory, 
+        write_path, 
+        fields=None,
+        smiles_name='Canonical_SMILES',
+        batch_size=50000,
+        n_jobs=None
+        ):
+    '''
+    Stream one or more SDF V2000 files into a parquet dataset.
+
+    Unlike `sdf_to_dataframe()`, the records are never held in memory all at 
+    once. Each SDF file is parsed incrementally and written to its own part 
+    file in the dataset directory, in row groups of 'batch_size' records. 
+    Files are processed in parallel if 'n_jobs' is specified.
+
+    The dataset can be read as a whole with `pandas.read_parquet(write_path)`,
+    in the same order and with the same records as `sdf_to_dataframe()`. All 
+    part files have the same schema.
+
+    Parameters
+    ----------
+    sdf_directory : str
+        Path to the directory containing the SDF files.
+    write_path : str
+        Path to the output directory. Any existing file or directory at this 
+        path is replaced.
+    fields : list of str, optional
+        SDF data fields to extract. The SMILES are computed only if 
+        'smiles_name' is included. Fields missing from a record are null. 
+        Default is None, i.e., all fields of any record, the ID, and the 
+        SMILES, as with `sdf_to_dataframe()`. In this case, the batches are 
+        first written to a temporary directory next to 'write_path', so that 
+        the part files can be written with the union of the fields of all 
+        files.
+    smiles_name : str, optional
+        Name of the column for the SMILES computed from the structures.
+    batch_size : int, optional
+        Number of records per row group. Default 50000.
+    n_jobs : int, optional
+        Number of processes. Default is None, i.e., files are processed 
+        serially.
+
+    Returns
+    -------
+    int
+        Number of records written.
+    '''
+    if not os.path.exists(sdf_directory):
+        raise ValueError(f'Directory {sdf_directory} does not exist.')
+
+    sdf_paths = []  # initialize
+    for dirpath, _, filenames in os.walk(sdf_directory):
+        sdf_paths.extend(
+            os.path.join(dirpath, f) for f in filenames if f.endswith('.sdf'))
+
+    if not sdf_paths:
+        raise ValueError('No SDF files found in the specified directory.')
+
+    if os.path.isdir(write_path):
+        shutil.rmtree(write_path)
+    elif os.path.exists(write_path):
+        os.remove(write_path)
+    os.makedirs(write_path)
+
+    # Zero-padded names preserve the order of the files in the dataset
+    n_digits = len(str(len(sdf_paths)))
+    part_paths = [
+        os.path.join(write_path, f'part-{i:0{n_digits}d}.parquet') 
+        for i in range(len(sdf_paths))
+        ]
+
+    if fields is not None:
+        n_records = _map_files(
+            _write_sdf_to_parquet, 
+            n_jobs,
+            sdf_paths, 
+            part_paths, 
+            itertools.repeat(fields), 
+            itertools.repeat(smiles_name), 
+            itertools.repeat(batch_size)
+            )
+        return sum(n_records)
+
+    parent_dir = os.path.dirname(os.path.abspath(write_path))
+    with tempfile.TemporaryDirectory(dir=parent_dir) as temp_dir:
+        batch_dirs = [
+            os.path.join(temp_dir, os.path.basename(part_path)) 
+            for part_path in part_paths
+            ]
+        batch_results = _map_files(
+            _write_sdf_batches, 
+            n_jobs,
+            sdf_paths, 
+            batch_dirs, 
+            itertools.repeat(smiles_name), 
+            itertools.repeat(batch_size)
+            )
+
+        # Union of the fields, in order of appearance as with pandas.concat()
+        columns = list(dict.fromkeys(
+            column for _, file_columns in batch_results 
+            for column in file_columns
+            ))
+
+        n_records = _map_files(
+            _combine_sdf_batches, 
+            n_jobs,
+            [batch_paths for batch_paths, _ in batch_results], 
+            part_paths, 
+            itertools.repeat(columns)
+            )
+
+    return sum(n_records)
+#endregion
+
+#region: _map_files
+def _map_files(function, n_jobs, *args):
+    '''
+    Helper function to apply a function to each file, serially or in a pool 
+    of processes.
+
+    Returns
+    -------
+    list
+        The results, in the order of the files.
+    '''
+    if n_jobs is None or n_jobs == 1:
+        return list(map(function, *args))
+    with ProcessPoolExecutor(max_workers=n_jobs) as pool:
+        return list(pool.map(function, *args))
+#endregion
+
+#region: _write_sdf_to_parquet
+def _write_sdf_to_parquet(
+        sdf_path, 
+        part_path, 
+        fields, 
+        smiles_name, 
+        batch_size
+        ):
+    '''
+    Helper function to stream the records of a single SDF file into a 
+    parquet file with the specified fields, one row group per batch.
+
+    All values are written as strings, consistent with 
+    `rdkit.Chem.PandasTools.LoadSDF()`. Records that cannot be parsed are 
+    skipped. An empty file is not written if no record can be parsed.
+
+    Returns
+    -------
+    int
+        Number of records written.
+
+    See Also
+    --------
+    sdf_to_parquet_dataset()
+    '''
+    compute_smiles = smiles_name in fields
+    writer, n_records = None, 0  # initialize
+    batch = []
+
+    try:
+        for row in _iter_sdf_records(sdf_path, smiles_name, compute_smiles):
+            batch.append(row)
+            n_records += 1
+            if len(batch) == batch_size:
+                writer = _write_sdf_batch(writer, part_path, batch, fields)
+                batch = []
+        if batch:
+            writer = _write_sdf_batch(writer, part_path, batch, fields)
+    finally:
+        if writer is not None:
+            writer.close()
+
+    return n_records
+#endregion
+
+#region: _write_sdf_batches
+def _write_sdf_batches(sdf_path, batch_dir, smiles_name, batch_size):
+    '''
+    Helper function to stream the records of a single SDF file into 
+    separate parquet files, one per batch, each with the fields of its 
+    records.
+
+    Returns
+    -------
+    batch_paths : list of str
+        Paths to the batch files, in order.
+    columns : list of str
+        Union of the fields of all records, in order of appearance.
+
+    See Also
+    --------
+    _combine_sdf_batches()
+    '''
+    os.makedirs(batch_dir)
+    batch_paths, columns = [], {}  # initialize
+    batch = []
+
+    def write_batch():
+        batch_columns = list(dict.fromkeys(k for row in batch for k in row))
+        columns.update(dict.fromkeys(batch_columns))
+        batch_path = os.path.join(
+            batch_dir, f'batch-{len(batch_paths)}.parquet')
+        _write_sdf_batch(None, batch_path, batch, batch_columns).close()
+        batch_paths.append(batch_path)
+
+    for row in _iter_sdf_records(sdf_path, smiles_name, True):
+        batch.append(row)
+        if len(batch) == batch_size:
+            write_batch()
+            batch = []
+    if batch:
+        write_batch()
+
+    return batch_paths, list(columns)
+#endregion
+
+#region: _combine_sdf_batches
+def _combine_sdf_batches(batch_paths, part_path, columns):
+    '''
+    Helper function to combine the batch files of a single SDF file into a 
+    parquet file with the specified fields, one row group per batch.
+
+    Fields missing from a batch are null. The batch files are deleted. An 
+    empty file is not written if there is no batch.
+
+    Returns
+    -------
+    int
+        Number of records written.
+    '''
+    schema = pa.schema([(column, pa.string()) for column in columns])
+    writer, n_records = None, 0  # initialize
+
+    try:
+        for batch_path in batch_paths:
+            table = pq.read_table(batch_path)
+            table = pa.table(
+                [
+                    table[column] if column in table.column_names 
+                    else pa.nulls(len(table), pa.string()) 
+                    for column in columns
+                ], 
+                schema=schema
+                )
+            if writer is None:
+                writer = pq.ParquetWriter(part_path, schema)
+            writer.write_table(table)
+            n_records += len(table)
+            os.remove(batch_path)
+    finally:
+        if writer is not None:
+            writer.close()
+
+    return n_records
+#endregion
+
+#region: _iter_sdf_records
+def _iter_sdf_records(sdf_path, smiles_name, compute_smiles):
+    '''
+    Helper function to generate the records of a single SDF file as 
+    dictionaries mapping the field names to their values.
+
+    As with `rdkit.Chem.PandasTools.LoadSDF()`, the structures are always 
+    sanitized, and records that cannot be parsed or sanitized are skipped. 
+    The name of each record is its 'ID'.
+    '''
+    with open(sdf_path, 'rb') as sdf_file:
+        for mol in ForwardSDMolSupplier(sdf_file):
+            if mol is None:
+                continue
+            row = {k: mol.GetProp(k) for k in mol.GetPropNames()}
+            if mol.HasProp('_Name'):
+                row['ID'] = mol.GetProp('_Name')
+            if compute_smiles:
+                try:
+                    row[smiles_name] = MolToSmiles(mol)
+                except Exception:
+                    row[smiles_name] = None
+            yield row
+#endregion
+
+#region: _write_sdf_batch
+def _write_sdf_batch(writer, part_path, batch, columns):
+    '''
+    Helper function to write a batch of SDF records as a row group.
+
+    Parameters
+    ----------
+    writer : pyarrow.parquet.ParquetWriter or None
+        If None, a new writer is opened at 'part_path'.
+    batch : list of dict
+        Records mapping field names to values.
+    columns : list of str
+
+    Returns
+    -------
+    pyarrow.parquet.ParquetWriter
+    '''
+    data = {
+        column: pa.array([row.get(column) for row in batch], pa.string()) 
+        for column in columns
+        }
+    table = pa.table(data)
+    if writer is None:
+        writer = pq.ParquetWriter(part_path, table.schema)
+    writer.write_table(table)
+    return writer
+#endregion
+
 # TODO: Inverse log-transform for consistency with other features sets?
 #region: get_2d_descriptors
 def get_2d_descriptors(
         smiles_for_chem, 
         index_name,
         discrete_suffix=None,
-        write_path=None
+        write_path=None,
+        chunk_size=None,
+        n_jobs=None
         ):
     '''
     Get all two-dimensional molecular descriptors from RDKit.
@@ -78,16 +402,39 @@ def get_2d_descriptors(
         Will be appended to the end of each string in discrete columns.
     write_path : str (optional)
         Path to write the return as a parquet file.
+    chunk_size : int (optional)
+        If specified, the descriptors are computed for chunks of this many 
+        chemicals and each chunk is appended to the parquet file as it is 
+        finished. Peak memory is then bounded by the chunk size. Requires 
+        'write_path'.
+    n_jobs : int (optional)
+        Number of processes for the chunks. Default is None, i.e., chunks are 
+        processed serially. Only used if 'chunk_size' is specified.
     
     Returns
     -------
     pandas.DataFrame
+        None if 'chunk_size' is specified, because the descriptors are 
+        written to disk instead.
 
     Notes
     -----
     RDKit also provides some more recent "2D-autocorrelation" descriptors, 
     but the functions may have not been fully debugged.
     '''
+    if chunk_size is not None:
+        if write_path is None:
+            raise ValueError('"write_path" is required if "chunk_size" is set')
+        write_2d_descriptors_in_chunks(
+            smiles_for_chem, 
+            index_name, 
+            write_path, 
+            discrete_suffix=discrete_suffix, 
+            chunk_size=chunk_size, 
+            n_jobs=n_jobs
+            )
+        return None
+
     mol_for_chem = {
         chem: MolFromSmiles(smiles) 
         for chem, smiles in smiles_for_chem.items()}
@@ -122,4 +469,237 @@ def get_2d_descriptors(
         descriptors.to_parquet(write_path)
 
     return descriptors
-#endregion
\ No newline at end of file
+#endregion
+
+#region: write_2d_descriptors_in_chunks
+def write_2d_descriptors_in_chunks(
+        smiles_for_chem, 
+        index_name,
+        write_path,
+        discrete_suffix=None,
+        chunk_size=10000,
+        n_jobs=None
+        ):
+    '''
+    Compute all two-dimensional molecular descriptors from RDKit in chunks 
+    and stream them to a parquet file.
+
+    The output is equivalent to that of `get_2d_descriptors()` without 
+    chunks. Each chunk is written as a row group in the order of 
+    'smiles_for_chem'.
+
+    Parameters
+    ----------
+    smiles_for_chem : dict
+        Mapping of DTXSID to SMILES string.
+    index_name : str
+        Used to name the index, e.g., 'DTXSID'.
+    write_path : str
+        Path to the output parquet file.
+    discrete_suffix : str (optional)
+        Will be appended to the end of each string in discrete columns.
+    chunk_size : int (optional)
+        Number of chemicals per chunk. Default 10000.
+    n_jobs : int (optional)
+        Number of processes. Default is None, i.e., chunks are processed 
+        serially.
+
+    Notes
+    -----
+    Integer-valued (discrete) descriptors are identified once, from the 
+    types returned by RDKit for reference molecules (see 
+    `_get_int_descriptors()`), independently of the data, and written as 
+    int64. Chunks without any parsable SMILES are skipped.
+
+    With 'n_jobs', at most 2*n_jobs chunks are in progress or waiting to be 
+    written at any time, so that peak memory is bounded by the chunk size.
+    '''
+    chunks = _chunk_items(smiles_for_chem.items(), chunk_size)
+    where_int = _get_int_descriptors()
+    
+    if n_jobs is None or n_jobs == 1:
+        chunk_results = map(_compute_descriptors_for_chunk, chunks)
+        _write_descriptor_chunks(
+            chunk_results, where_int, index_name, write_path, discrete_suffix)
+    else:
+        with ProcessPoolExecutor(max_workers=n_jobs) as pool:
+            chunk_results = _map_in_window(
+                pool, _compute_descriptors_for_chunk, chunks, 2*n_jobs)
+            _write_descriptor_chunks(
+                chunk_results, where_int, index_name, write_path, 
+                discrete_suffix)
+#endregion
+
+#region: _write_descriptor_chunks
+def _write_descriptor_chunks(
+        chunk_results, where_int, index_name, write_path, 
+        discrete_suffix=None):
+    '''
+    Helper function to write descriptors to a parquet file, chunk by chunk.
+
+    Parameters
+    ----------
+    chunk_results : iterable of tuple
+        Results of `_compute_descriptors_for_chunk()`, in order.
+    where_int : numpy.ndarray
+        Boolean mask of the integer-valued descriptors.
+
+    Raises
+    ------
+    ValueError
+        If an integer-valued descriptor has a non-integer value, rather than 
+        truncating it.
+
+    See Also
+    --------
+    write_2d_descriptors_in_chunks()
+    '''
+    descriptor_names = _get_descriptor_names()
+    utilities.ensure_directory_exists(write_path)
+
+    writer = None  # initialize
+    try:
+        for chems, values in chunk_results:
+            if not chems:
+                continue
+            int_values = values[:, where_int]
+            if not np.array_equal(int_values, np.round(int_values)):
+                raise ValueError(
+                    'Non-integer values for integer-valued descriptors: '
+                    f'{list(np.array(descriptor_names)[where_int])}')
+            descriptors = pd.DataFrame(
+                values, 
+                index=pd.Index(chems, name=index_name), 
+                columns=descriptor_names
+                )
+            int_columns = descriptors.columns[where_int]
+            descriptors[int_columns] = descriptors[int_columns].astype('int64')
+
+            if discrete_suffix:
+                descriptors = utilities.tag_discrete_columns(
+                    descriptors, 
+                    list(int_columns), 
+                    discrete_suffix
+                )
+
+            if writer is None:
+                schema = pa.Schema.from_pandas(descriptors, preserve_index=True)
+                writer = pq.ParquetWriter(write_path, schema)
+            table = pa.Table.from_pandas(
+                descriptors, 
+                schema=schema, 
+                preserve_index=True
+                )
+            writer.write_table(table)
+    finally:
+        if writer is not None:
+            writer.close()
+#endregion
+
+#region: _compute_descriptors_for_chunk
+def _compute_descriptors_for_chunk(items):
+    '''
+    Helper function to compute the descriptors for a chunk of chemicals.
+
+    Parameters
+    ----------
+    items : list of 2-tuple
+        Each tuple contains a chemical identifier and a SMILES string.
+
+    Returns
+    -------
+    chems : list
+        Identifiers of chemicals for which the SMILES could be parsed.
+    values : numpy.ndarray
+        Descriptor values (float64) with shape (len(chems), n_descriptors).
+    '''
+    calc = MoleculeDescriptors.MolecularDescriptorCalculator(
+        _get_descriptor_names())
+    n_descriptors = len(calc.GetDescriptorNames())
+
+    chems, rows = [], []  # initialize
+    for chem, smiles in items:
+        mol = MolFromSmiles(smiles)
+        if mol is None:
+            # Parsing error
+            continue
+        chems.append(chem)
+        rows.append(calc.CalcDescriptors(mol))
+
+    values = np.array(rows, dtype='float64').reshape(-1, n_descriptors)
+    return chems, values
+#endregion
+
+#region: _get_descriptor_names
+def _get_descriptor_names():
+    '''
+    Helper function to get the names of all 2D descriptors in RDKit.
+    '''
+    return [tup[0] for tup in Descriptors._descList]
+#endregion
+
+#region: _get_int_descriptors
+def _get_int_descriptors(reference_smiles=('CCO', 'c1ccccc1O', 'CC(=O)N')):
+    '''
+    Helper function to identify the integer-valued 2D descriptors in RDKit, 
+    from the types of their values for reference molecules.
+
+    A descriptor is integer-valued if RDKit returns an int for all reference 
+    molecules, e.g., counts of atoms or rings. This does not depend on the 
+    data, unlike `pandas.DataFrame.select_dtypes('int')`.
+
+    Returns
+    -------
+    numpy.ndarray
+        Boolean mask of the descriptors, in the order of 
+        `_get_descriptor_names()`.
+    '''
+    calc = MoleculeDescriptors.MolecularDescriptorCalculator(
+        _get_descriptor_names())
+    where_int = np.ones(len(calc.GetDescriptorNames()), dtype=bool)
+    for smiles in reference_smiles:
+        row = calc.CalcDescriptors(MolFromSmiles(smiles))
+        where_int &= [isinstance(value, int) for value in row]
+    return where_int
+#endregion
+
+#region: _map_in_window
+def _map_in_window(executor, function, items, n_in_flight):
+    '''
+    Helper function to map a function over items with an executor, with at 
+    most 'n_in_flight' items submitted but not yet consumed.
+
+    Unlike `Executor.map()`, which submits all items at once, the items are 
+    submitted as the results are consumed, so that finished results do not 
+    accumulate while the consumer (e.g., a writer) catches up.
+
+    Yields
+    ------
+    object
+        The results, in the order of the items.
+    '''
+    futures = collections.deque()
+    try:
+        for item in items:
+            if len(futures) == n_in_flight:
+                yield futures.popleft().result()
+            futures.append(executor.submit(function, item))
+        while futures:
+            yield futures.popleft().result()
+    finally:
+        for future in futures:
+            future.cancel()
+#endregion
+
+#region: _chunk_items
+def _chunk_items(items, chunk_size):
+    '''
+    Helper function to lazily split an iterable into lists of a given size.
+    '''
+    iterator = iter(items)
+    while True:
+        chunk = list(itertools.islice(iterator, chunk_size))
+        if not chunk:
+            return
+        yield chunk
+#endregion
@@ -5,10 +5,16 @@ for in-sample and out-of-sample predictions, feature importance analysis, and
 other result-related tasks.
 '''
 
+import os
+import shutil
 import pandas as pd 
 import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
 
 from feature_selection import FeatureSelector
+from prediction_service import PredictionService
+from analysis_cache import AnalysisCache, memoized
 
 # NOTE: For backwards compatibility
 from plotting import sensitivity_analysis  
@@ -31,15 +37,65 @@ class ResultsAnalyzer:
         results_manager : A `ResultsManager` instance
         data_manager : A `DataManager` instance
         plot_settings : SimpleNamespace
-            Configuration settings related to plotting.
+            Configuration settings related to plotting. May include 
+            'max_loaded_estimators' and 'n_jobs_predict' for the 
+            `PredictionService`, and 'analysis_cache_dir' for an 
+            `AnalysisCache` of the analysis results.
         '''
         self.results_manager = results_manager
         self.data_manager = data_manager
         self.plot_settings = plot_settings
+
+        self.prediction_service = PredictionService(
+            results_manager, 
+            data_manager, 
+            max_estimators=getattr(plot_settings, 'max_loaded_estimators', 8), 
+            n_jobs=getattr(plot_settings, 'n_jobs_predict', None)
+            )
+
+        self.analysis_cache = None
+        analysis_cache_dir = getattr(plot_settings, 'analysis_cache_dir', None)
+        if analysis_cache_dir is not None:
+            self.analysis_cache = AnalysisCache(analysis_cache_dir)
 #endregion
 
+    #region: get_input_paths
+    def get_input_paths(self, model_keys):
+        '''
+        Get the paths to the files from which the analyses of the model keys 
+        are derived.
+
+        Parameters
+        ----------
+        model_keys : list of tuple
+
+        Returns
+        -------
+        list of str
+            The results and estimators of the model keys, the metadata, and 
+            the input data files.
+        '''
+        path_settings = self.data_manager.path_settings
+        paths = [
+            getattr(path_settings, name) for name in (
+                'authoritative_pods_file', 
+                'toxcast_oeds_file', 
+                'seem3_exposure_file'
+                )
+            if hasattr(path_settings, name)
+        ]
+
+        model_key_names = self.read_model_key_names()
+        for model_key in model_keys:
+            key_for = dict(zip(model_key_names, model_key))
+            paths.extend(self.results_manager.get_result_paths(model_key))
+            paths.extend(self.data_manager.get_input_paths(**key_for))
+        return list(dict.fromkeys(paths))  # unique, in order
+    #endregion
+
     # FIXME: Appears that inverse_transform only applied to y_pred, not y_true?
     #region: get_in_sample_prediction
+    @memoized()
     def get_in_sample_prediction(self, model_key, inverse_transform=False):
         '''
         Get in-sample predictions for the given model key.
@@ -143,17 +199,30 @@ class ResultsAnalyzer:
         X : pandas.DataFrame
             Features used for prediction.
         '''
-        model_key_names = self.results_manager.read_model_key_names()
-        key_for = dict(zip(model_key_names, model_key))
-
-        X = self.data_manager.load_features(
-            **key_for, 
+        return self.prediction_service.predict(
+            model_key, 
+            inverse_transform=inverse_transform, 
             exclude_training=exclude_training
             )
+    #endregion
 
-        y_pred, X = self._get_prediction(model_key, X, inverse_transform)
+    #region: predict_many
+    def predict_many(
+            self, 
+            model_keys, 
+            inverse_transform=False, 
+            exclude_training=False
+            ):
+        '''
+        Make predictions for multiple model keys at once.
 
-        return y_pred, X
+        Refer to `PredictionService.predict_many` for documentation.
+        '''
+        return self.prediction_service.predict_many(
+            model_keys, 
+            inverse_transform=inverse_transform, 
+            exclude_training=exclude_training
+            )
     #endregion
 
     #region: _get_prediction
@@ -178,12 +247,88 @@ class ResultsAnalyzer:
         X : pandas.DataFrame
             Features used for prediction with fitted columns.
         '''
-        estimator = self.results_manager.read_estimator(model_key)
-        X = X[estimator.feature_names_in_]
-        y_pred = pd.Series(estimator.predict(X), index=X.index)
-        if inverse_transform:
-            y_pred = 10**y_pred
-        return y_pred, X
+        return self.prediction_service.predict_features(
+            model_key, 
+            X, 
+            inverse_transform=inverse_transform
+            )
+    #endregion
+
+    #region: write_predictions_in_chunks
+    def write_predictions_in_chunks(
+            self, 
+            model_keys, 
+            write_path, 
+            exclude_training=True, 
+            inverse_transform=False, 
+            batch_size=100_000
+            ):
+        '''
+        Predict for all chemicals with features and write the predictions 
+        with their 90% prediction intervals to a partitioned Parquet dataset.
+
+        The features are streamed in chunks of rows, such that the memory use 
+        does not depend on the number of chemicals, e.g., for screening the 
+        entire DSSTox database.
+
+        Parameters
+        ----------
+        model_keys : list of tuple
+            Keys identifying the models for which predictions are required.
+        write_path : str
+            Path to the output directory. Any existing directory is replaced. 
+            The dataset is partitioned by the model key names (Hive-style), 
+            e.g., 'target_effect=general/.../part-00000-0.parquet'.
+        exclude_training : bool, optional
+            If True (default), excludes chemicals used for model training.
+        inverse_transform : bool, optional
+            If True, applies the inverse transform to the predictions and 
+            bounds (default is False).
+        batch_size : int, optional
+            Maximum number of chemicals in each chunk. Default 100,000.
+
+        Returns
+        -------
+        None
+            Each file contains the columns 'pod', 'lb', and 'ub', the 
+            chemical identifiers, and the model key names.
+
+        See Also
+        --------
+        ResultsAnalyzer.get_typical_pod_error()
+        ResultsAnalyzer.prediction_interval()
+        '''
+        model_key_names = self.results_manager.read_model_key_names()
+        rmse_for_key = {
+            model_key : self.get_typical_pod_error(model_key)  # log10-units
+            for model_key in model_keys
+            }
+
+        if os.path.exists(write_path):
+            shutil.rmtree(write_path)
+        os.makedirs(write_path)
+
+        chunks = self.prediction_service.predict_in_chunks(
+            model_keys, 
+            exclude_training=exclude_training, 
+            batch_size=batch_size
+            )
+        for chunk_num, y_pred_for_key in chunks:
+            for model_key, y_pred in y_pred_for_key.items():
+                lb, ub = self.prediction_interval(
+                    y_pred, rmse_for_key[model_key])
+                if inverse_transform:
+                    y_pred, lb, ub = ResultsAnalyzer._inverse_log10(
+                        y_pred, lb, ub)
+                predictions = pd.DataFrame({'pod' : y_pred, 'lb' : lb, 'ub' : ub})
+                for name, value in zip(model_key_names, model_key):
+                    predictions[name] = value
+                pq.write_to_dataset(
+                    pa.Table.from_pandas(predictions), 
+                    write_path, 
+                    partition_cols=list(model_key_names), 
+                    basename_template=f'part-{chunk_num:05d}-{{i}}.parquet'
+                    )
     #endregion
 
     #region: prediction_interval
@@ -239,6 +384,7 @@ class ResultsAnalyzer:
     #endregion
 
     #region: pod_and_prediction_interval
+    @memoized()
     def pod_and_prediction_interval(
             self, 
             model_key, 
@@ -299,6 +445,127 @@ class ResultsAnalyzer:
         return pd.DataFrame(pod_data)
     #endregion
 
+    #region: moe_cdf_data
+    @memoized()
+    def moe_cdf_data(
+            self, 
+            model_keys,
+            inverse_transform=False, 
+            normalize=False,
+            exclude_training=True
+            ):
+        '''
+        Compute the cumulative distributions of Margins of Exposure (MOEs) 
+        with prediction intervals for all exposure percentiles and models.
+
+        The MOEs of all models and percentiles are computed as a single array 
+        (chemicals x models x percentiles), which is sorted once along the 
+        chemicals. The bounds of the prediction intervals are shifted from the 
+        sorted MOEs by the typical error of each model.
+
+        Parameters
+        ----------
+        model_keys : list of tuple
+            Keys identifying the models to be analyzed.
+        inverse_transform : bool, optional
+        normalize : bool, optional
+        exclude_training : bool, optional
+            Refer to `moe_and_prediction_intervals()` for documentation.
+
+        Returns
+        -------
+        pandas.DataFrame
+            Tidy data with one row per model, percentile, and chemical, 
+            indexed by chemical identifier. The columns are the model key 
+            names, `percentile` (categorical, ordered as the exposure 
+            columns), `moe` (sorted within each model and percentile), `lb`, 
+            `ub`, and `cum_count` (or `cum_freq` if normalized).
+        '''
+        model_keys = list(dict.fromkeys(model_keys))  # unique, in order
+        model_key_names = self.read_model_key_names()
+
+        y_pred_for_key = self.predict_many(
+            model_keys, 
+            exclude_training=exclude_training
+            )
+        exposure_df = self.data_manager.load_exposure_data()
+
+        # Chemicals without a prediction for a model have missing PODs
+        pods = pd.concat(
+            [y_pred_for_key[model_key][0] for model_key in model_keys], 
+            axis=1,
+            keys=range(len(model_keys))
+            )
+        pods, exposures = pods.align(exposure_df, join='inner', axis=0)
+
+        n_chemicals = len(exposures)
+        n_percentiles = len(exposure_df.columns)
+
+        # Shape (chemicals, models*percentiles), percentiles varying fastest
+        moes = (
+            pods.to_numpy(dtype='float64')[:, :, np.newaxis] 
+            - exposures.to_numpy(dtype='float64')[:, np.newaxis, :]
+        ).reshape(n_chemicals, -1)
+
+        # Missing values are sorted last
+        order = np.argsort(moes, axis=0, kind='stable')
+        sorted_moes = np.take_along_axis(moes, order, axis=0)
+        n_valid = np.count_nonzero(~np.isnan(moes), axis=0)
+
+        rmse = np.array(
+            [self.get_typical_pod_error(model_key) for model_key in model_keys],
+            dtype='float64'
+            )  # log10-units
+        lb, ub = self.prediction_interval(
+            sorted_moes, 
+            np.repeat(rmse, n_percentiles)
+            )
+
+        cumulative_data = np.arange(1, n_chemicals + 1)[:, np.newaxis]
+        if normalize:
+            cumulative_data = cumulative_data / np.maximum(n_valid, 1)
+        else:
+            cumulative_data = np.broadcast_to(cumulative_data, moes.shape)
+
+        if inverse_transform:
+            sorted_moes, lb, ub = ResultsAnalyzer._inverse_log10(
+                sorted_moes, lb, ub
+                )
+
+        # Flatten column by column, keeping only the valid MOEs
+        is_valid = np.arange(n_chemicals)[:, np.newaxis] < n_valid
+        flatten = ResultsAnalyzer._flatten_valid
+
+        key_codes = np.repeat(
+            np.arange(len(model_keys)).repeat(n_percentiles), n_valid)
+        percentile_codes = np.repeat(
+            np.tile(np.arange(n_percentiles), len(model_keys)), n_valid)
+
+        moe_data = {}  # initialize
+        for i, key_name in enumerate(model_key_names):
+            key_values = np.array(
+                [model_key[i] for model_key in model_keys], dtype=object)
+            moe_data[key_name] = key_values[key_codes]
+        moe_data['percentile'] = pd.Categorical.from_codes(
+            percentile_codes, 
+            categories=exposure_df.columns
+            )
+        moe_data['moe'] = flatten(sorted_moes, is_valid)
+        moe_data['lb'] = flatten(lb, is_valid)
+        moe_data['ub'] = flatten(ub, is_valid)
+        ResultsAnalyzer._insert_cumulative_data(
+            moe_data, 
+            flatten(cumulative_data, is_valid), 
+            normalize
+            )
+
+        index = pd.Index(
+            flatten(exposures.index.to_numpy()[order], is_valid), 
+            name=exposures.index.name
+            )
+        return pd.DataFrame(moe_data, index=index)
+    #endregion
+
     #region: moe_and_prediction_intervals
     def moe_and_prediction_intervals(
             self, 
@@ -340,41 +607,19 @@ class ResultsAnalyzer:
             - `lb`: Lower bound of the 90% prediction interval.
             - `ub`: Upper bound of the 90% prediction interval.
         '''
-        y_pred, *_ = self.predict(model_key, exclude_training=exclude_training)
-        
-        exposure_df = self.data_manager.load_exposure_data()
-        moes = self.margins_of_exposure(y_pred, exposure_df)
-
-        rmse = self.get_typical_pod_error(model_key)  # log10-units
-        
-        results_for_percentile = {}  # initialize
-        
-        for percentile in exposure_df.columns:
-            
-            sorted_moes, cumulative_data = self.generate_cdf_data(
-                moes[percentile],
-                normalize=normalize
-                )
-            
-            lb, ub = self.prediction_interval(sorted_moes, rmse)
-            
-            if inverse_transform:
-                sorted_moes, lb, ub = ResultsAnalyzer._inverse_log10(
-                    sorted_moes, lb, ub
-                    )
+        moe_df = self.moe_cdf_data(
+            [model_key], 
+            inverse_transform=inverse_transform, 
+            normalize=normalize, 
+            exclude_training=exclude_training
+            )
+        moe_df = moe_df.drop(columns=self.read_model_key_names())
 
-            moe_data = {
-                    'moe': sorted_moes,
-                    'lb': lb,
-                    'ub': ub
-                    }
-            ResultsAnalyzer._insert_cumulative_data(
-                moe_data, 
-                cumulative_data, 
-                normalize
-                )
-            results_for_percentile[percentile] = pd.DataFrame(moe_data)
-            
+        results_for_percentile = {
+            percentile : moe_data.drop(columns='percentile')
+            for percentile, moe_data in moe_df.groupby(
+                'percentile', observed=False)
+            }
         return results_for_percentile
     #endregion
 
@@ -448,9 +693,14 @@ class ResultsAnalyzer:
         operation = np.subtract if log10_units else np.divide
 
         if isinstance(exposures_aligned, pd.DataFrame):
-            moe = exposures_aligned.apply(
-                lambda col: operation(pods_aligned, col), 
-                axis=0
+            # Broadcast the PODs across all exposure columns at once
+            moe = pd.DataFrame(
+                operation(
+                    pods_aligned.to_numpy()[:, np.newaxis], 
+                    exposures_aligned.to_numpy()
+                    ),
+                index=exposures_aligned.index,
+                columns=exposures_aligned.columns
                 )
         else:
             moe = operation(pods_aligned, exposures_aligned)
@@ -459,6 +709,7 @@ class ResultsAnalyzer:
     #endregion
 
     #region: get_important_features
+    @memoized()
     def get_important_features(self, model_key):
         '''
         Get important features for the model identified by the given key.
@@ -490,6 +741,7 @@ class ResultsAnalyzer:
     #endregion
 
     #region: get_important_features_replicates
+    @memoized()
     def get_important_features_replicates(self, model_key):
         '''
         Get important features for each replicate of the model identified by 
@@ -535,6 +787,7 @@ class ResultsAnalyzer:
     #endregion
 
     #region: get_pod_comparison_data
+    @memoized('authoritative_label', 'surrogate_label', 'qsar_label')
     def get_pod_comparison_data(self, model_key):
         '''
         Retrieve Point of Departure (POD) comparison data.
@@ -839,4 +1092,14 @@ class ResultsAnalyzer:
             data_dict['cum_freq'] = cumulative_data
         else:
             data_dict['cum_count'] = cumulative_data
+    #endregion
+
+    #region: _flatten_valid
+    @staticmethod
+    def _flatten_valid(array, is_valid):
+        '''
+        Helper function to flatten a 2D array column by column, keeping only 
+        the elements where 'is_valid' is True.
+        '''
+        return array.T[is_valid.T]
     #endregion
\ No newline at end of file
@@ -5,13 +5,31 @@ and fitted estimators. It includes methods for saving and retrieving results
 in Parquet format, handling fitted estimator objects with Joblib, managing 
 metadata such as headers, and providing utility functions for listing and 
 accessing model keys.
+
+With the 'dataset' file type, the results are consolidated into one 
+partitioned Parquet dataset for each result type, e.g., 
+'Results/performances/target_effect=.../estimator=.../part-0.parquet'. The 
+model key names are the partition columns, so that results for multiple model 
+keys are read in a single, filtered scan of the dataset. Each result is stored 
+in a "long" format with one row for each value, so that all model keys share 
+the same schema, e.g., despite different features.
 '''
 
 import os
 import pandas as pd
+import numpy as np
 import json
+import pickle
 import joblib
 import itertools
+import urllib.parse
+import tempfile
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+from metadata_log import MetadataLog, write_json_atomic
+import profiling
 
 #region: ResultsManager
 class ResultsManager:
@@ -32,7 +50,9 @@ class ResultsManager:
             self, 
             output_dir='Results', 
             results_file_type='csv', 
-            model_key_creator=None
+            model_key_creator=None, 
+            estimator_compress=0, 
+            estimator_mmap_mode=None
             ):
         '''
         Initialize the ResultsManager with the specified output directory.
@@ -47,18 +67,32 @@ class ResultsManager:
             Path to the directory where results and estimators will be saved.
             Default is 'Results'.
         results_file_type : str, optional
-            Must be 'csv' or 'parquet'. Default 'csv'.
+            Must be 'csv', 'parquet', or 'dataset'. Default 'csv'. With 
+            'dataset', all results of a given type are consolidated into a 
+            partitioned Parquet dataset.
         model_key_creator : ModelKeyCreator, optional
             An instance of ModelKeyCreator to assist in creating model keys. 
             Primarily used during the initial writing stage of results. 
             If not provided, model key creation is assumed to have been 
             handled externally.
+        estimator_compress : int, str, or tuple, optional
+            Compression of the estimator files. See joblib.dump for reference. 
+            Default 0, i.e., no compression.
+        estimator_mmap_mode : str, optional
+            If specified (e.g., 'r'), the numpy arrays of uncompressed 
+            estimator files, such as the nodes of the trees of a random 
+            forest, are memory-mapped rather than read into memory. See 
+            joblib.load for reference. Ignored for compressed files.
         '''
         self.output_dir = output_dir
+        self.estimator_compress = estimator_compress
+        self.estimator_mmap_mode = estimator_mmap_mode
+        self._metadata = MetadataLog(self._metadata_path)
+        self._manifest = MetadataLog(self._manifest_path)
 
-        if results_file_type not in ('csv', 'parquet'):
+        if results_file_type not in ('csv', 'parquet', 'dataset'):
             raise ValueError(
-                "'results_file_type' must be either 'csv' or 'parquet'")
+                "'results_file_type' must be 'csv', 'parquet', or 'dataset'")
         self._results_file_type = results_file_type
         
         if model_key_creator:
@@ -71,7 +105,7 @@ class ResultsManager:
 #endregion
 
     #region: write_results
-    def write_results(self, model_key, results):
+    def write_results(self, model_key, results, digest=None):
         '''
         Write the results to the appropriate files.
 
@@ -81,18 +115,145 @@ class ResultsManager:
             Model key identifying the result.
         results : dict 
             Contains the results to be written.
+        digest : str, optional
+            Hash of the inputs that produced the results. If provided, the 
+            model key is marked as completed in the run manifest after all 
+            results have been written.
+
+        See Also
+        --------
+        ResultsManager.is_completed()
+
+        Notes
+        -----
+        Recorded as the 'write_results' stage of the active profiler, if any 
+        (see profiling.py).
+        '''
+        with profiling.stage('write_results'):
+            directory = os.path.join(
+                self.output_dir, self.model_key_to_identifier(model_key))
+            file_names = []  # initialize
+            for result_type, result_data in results.items():
+                if isinstance(result_data, pd.DataFrame):
+                    path = self.write_result(
+                        result_data, model_key, result_type)
+                    # Relative to the model key directory, e.g., for manifest
+                    file_names.append(os.path.relpath(path, directory))
+                elif hasattr(result_data, 'fit'):
+                    self.write_estimator(
+                        result_data, 
+                        model_key, 
+                        fit_time=results.get('fit_time')
+                        )
+                    file_names.extend(['estimator.joblib', 'estimator.json'])
+
+            if digest is not None:
+                self.write_manifest_entry(
+                    model_key, 
+                    'completed', 
+                    digest=digest, 
+                    file_names=file_names
+                    )
+    #endregion
+
+    #region: is_completed
+    def is_completed(self, model_key, digest):
+        '''
+        Check whether the results for a model key are complete and current.
+
+        Parameters
+        ----------
+        model_key : tuple of str
+            Model key identifying the results.
+        digest : str
+            Hash of the inputs for the current run.
+
+        Returns
+        -------
+        bool
+            True if the model key was marked as completed with the same 
+            digest and all of its result files and estimator still exist.
+        '''
+        identifier = self.model_key_to_identifier(model_key)
+        entry = self.read_manifest().get(identifier)
+
+        if (
+            not entry 
+            or entry['status'] != 'completed'
+            or tuple(entry['model_key']) != tuple(model_key)
+            or entry['digest'] != digest
+            ):
+            return False
+
+        directory = os.path.join(self.output_dir, identifier)
+        return all(
+            os.path.exists(os.path.join(directory, file_name))
+            for file_name in entry['file_names']
+        )
+    #endregion
+
+    #region: write_manifest_entry
+    def write_manifest_entry(
+            self, 
+            model_key, 
+            status, 
+            digest=None, 
+            file_names=None
+            ):
+        '''
+        Record the status of a model key in the run manifest.
+
+        Parameters
+        ----------
+        model_key : tuple of str
+            Model key identifying the results.
+        status : str
+            E.g., 'running', 'completed', 'failed'.
+        digest : str, optional
+            Hash of the inputs that produced the results.
+        file_names : list of str, optional
+            Names of the result files (and estimator) within the model key 
+            directory.
         '''
-        for result_type, result_data in results.items():
-            if isinstance(result_data, pd.DataFrame):
-                self.write_result(result_data, model_key, result_type)
-            elif hasattr(result_data, 'fit'):
-                self.write_estimator(result_data, model_key)
+        identifier = self.model_key_to_identifier(model_key)
+        entry = {
+            'model_key': list(model_key),
+            'status': status,
+            'digest': digest,
+            'file_names': file_names or []
+        }
+        self._manifest.set([identifier], entry)
+    #endregion
+
+    #region: read_manifest
+    def read_manifest(self):
+        '''
+        Read the run manifest.
+
+        Returns
+        -------
+        dict
+            Maps each identifier to a dictionary with keys 'model_key', 
+            'status', 'digest', and 'file_names'. Returns an empty dictionary 
+            if the file does not exist.
+        '''
+        return self._manifest.read()
+    #endregion
+
+    #region: _manifest_path
+    @property
+    def _manifest_path(self):
+        '''
+        Get the path to the run manifest within the output directory.
+        '''
+        return os.path.join(self.output_dir, 'manifest.json')
     #endregion
 
     #region: write_estimator
-    def write_estimator(self, estimator, model_key):
+    def write_estimator(self, estimator, model_key, fit_time=None):
         '''
-        Write the fitted estimator to a Joblib file.
+        Write the fitted estimator to a Joblib file, along with a JSON 
+        sidecar of metadata.
 
         Parameters
         ----------
@@ -100,18 +261,53 @@ class ResultsManager:
             Fitted estimator object to be saved.
         model_key : tuple of str
             Model key identifying the estimator.
+        fit_time : float, optional
+            Time (s) to fit the estimator, recorded in the metadata.
 
         Notes
         -----
         The Joblib file is saved in a subdirectory named after the model_key,
-        within the output directory.
+        within the output directory. The file is compressed according to 
+        'estimator_compress'.
+
+        See Also
+        --------
+        ResultsManager.read_estimator_metadata()
         '''
         path = self._build_estimator_path(model_key)
-        joblib.dump(estimator, path)
+        # Replace atomically. The old file may be memory-mapped by a reader
+        with tempfile.NamedTemporaryFile(
+                dir=os.path.dirname(path), suffix='.tmp', delete=False) as file:
+            temp_path = file.name
+        joblib.dump(estimator, temp_path, compress=self.estimator_compress)
+        os.replace(temp_path, path)
+
+        feature_names = getattr(estimator, 'feature_names_in_', None)
+        if feature_names is None and hasattr(estimator, 'steps'):
+            # E.g., the first step of the Pipeline does not record them
+            final_estimator = estimator.steps[-1][1]
+            feature_names = getattr(final_estimator, 'feature_names_in_', None)
+        metadata = {
+            'estimator_class' : type(estimator).__name__,
+            'feature_names_in' : (
+                None if feature_names is None else list(feature_names)),
+            'n_features_in' : getattr(estimator, 'n_features_in_', None),
+            'file_size' : os.path.getsize(path),
+            'compress' : self.estimator_compress,
+            'fit_time' : fit_time
+        }
+        if metadata['n_features_in'] is not None:
+            metadata['n_features_in'] = int(metadata['n_features_in'])
+        # Also atomically, so that it is never incomplete
+        write_json_atomic(
+            metadata, 
+            self._build_path(model_key, 'estimator', 'json'), 
+            indent=2
+            )
     #endregion
 
     #region: read_estimator
-    def read_estimator(self, model_key):
+    def read_estimator(self, model_key, mmap_mode=None):
         '''
         Read the fitted estimator from a Joblib file.
 
@@ -119,6 +315,8 @@ class ResultsManager:
         ----------
         model_key : tuple of str
             Model key identifying the estimator.
+        mmap_mode : str, optional
+            Overrides 'estimator_mmap_mode'. See joblib.load for reference.
 
         Returns
         -------
@@ -131,7 +329,91 @@ class ResultsManager:
         within the output directory.
         '''
         path = self._build_estimator_path(model_key)
-        return joblib.load(path)
+        if mmap_mode is None:
+            mmap_mode = self.estimator_mmap_mode
+        if mmap_mode is not None and _is_compressed(path):
+            # NOTE: joblib can corrupt the trees of a compressed forest if 
+            # mmap_mode is passed, despite warning that it is ignored
+            mmap_mode = None
+        return joblib.load(path, mmap_mode=mmap_mode)
+    #endregion
+
+    #region: read_estimator_metadata
+    def read_estimator_metadata(self, model_key):
+        '''
+        Read the metadata of the fitted estimator without loading it.
+
+        Parameters
+        ----------
+        model_key : tuple of str
+            Model key identifying the estimator.
+
+        Returns
+        -------
+        dict
+            Keys 'estimator_class', 'feature_names_in' (of the final 
+            estimator, if not recorded by the Pipeline), 'n_features_in', 
+            'file_size' (bytes), 'compress', and 'fit_time' (s). Values may be 
+            None if unknown.
+        '''
+        path = self._build_path(model_key, 'estimator', 'json')
+        with open(path, 'r') as file:
+            return json.load(file)
+    #endregion
+
+    #region: get_estimator_path
+    def get_estimator_path(self, model_key):
+        '''
+        Get the full path to the estimator file, e.g., to check whether it 
+        has changed.
+
+        Parameters
+        ----------
+        model_key : tuple of str
+            Model key identifying the estimator.
+
+        Returns
+        -------
+        str
+        '''
+        return self._build_estimator_path(model_key)
+    #endregion
+
+    #region: get_result_paths
+    def get_result_paths(self, model_key):
+        '''
+        Get the paths to all files of the results for the specified model key.
+
+        Parameters
+        ----------
+        model_key : tuple of str
+            Model key identifying the results.
+
+        Returns
+        -------
+        list of str
+            The directory of the model key (e.g., estimator and results), the 
+            partitions of the model key within any datasets, and the metadata 
+            files shared by all model keys. Some paths may not exist, e.g., 
+            if the metadata were compacted.
+        '''
+        directory_name = self.model_key_to_identifier(model_key)
+        paths = [
+            os.path.join(self.output_dir, directory_name),
+            self._metadata.path,
+            self._metadata.log_path
+        ]
+
+        if self._results_file_type == 'dataset':
+            partition = [
+                f'{name}={urllib.parse.quote(value, safe="")}'
+                for name, value in zip(self.read_model_key_names(), model_key)
+                ]
+            for file_name in sorted(os.listdir(self.output_dir)):
+                path = os.path.join(self.output_dir, file_name, *partition)
+                if os.path.isdir(path):
+                    paths.append(path)
+        return paths
     #endregion
 
     #region: _build_estimator_path
@@ -171,11 +453,22 @@ class ResultsManager:
         result_type : str
             Type of result (e.g., "performances", "importances").
 
+        Returns
+        -------
+        str
+            Path to the written file.
+
         Notes
         -----
         The result file is saved in a subdirectory named after the model_key,
-        within the output directory.
+        within the output directory. With the 'dataset' file type, it is 
+        saved in the partition of the model_key within the dataset for the 
+        result type.
         '''
+        if self._results_file_type == 'dataset':
+            return self._write_result_to_dataset(
+                result_df, model_key, result_type)
+
         # Create directory structure
         path = self._build_path(
             model_key, result_type, self._results_file_type)
@@ -186,6 +479,38 @@ class ResultsManager:
             self.write_level_names(result_df.columns.names, result_type)
         elif self._results_file_type == 'parquet':
             result_df.to_parquet(path)
+        return path
+    #endregion
+
+    #region: _write_result_to_dataset
+    def _write_result_to_dataset(self, result_df, model_key, result_type):
+        '''
+        Write a result DataFrame to the partition of the model key within the 
+        dataset for the result type, replacing any existing data.
+
+        Returns
+        -------
+        str
+            Path to the written file.
+        '''
+        table = _to_long_table(result_df)
+        model_key_names = self.read_model_key_names()
+        for name, value in zip(model_key_names, model_key):
+            table = table.append_column(
+                pa.field(name, pa.string()), 
+                pa.array([value]*len(table), type=pa.string())
+                )
+
+        paths = []
+        pq.write_to_dataset(
+            table, 
+            self._build_dataset_path(result_type), 
+            partitioning=self._get_partitioning(model_key_names), 
+            basename_template='part-{i}.parquet', 
+            existing_data_behavior='delete_matching', 
+            file_visitor=lambda written_file: paths.append(written_file.path)
+            )
+        return paths[0]
     #endregion
 
     #region: read_result
@@ -210,6 +535,11 @@ class ResultsManager:
         The result file is read from a subdirectory named after the model_key,
         within the output directory.
         '''
+        if self._results_file_type == 'dataset':
+            result_df_for_key, _ = self._read_results_from_dataset(
+                result_type, [model_key])
+            return result_df_for_key[model_key]
+
         path = self._build_path(
             model_key, result_type, self._results_file_type)
 
@@ -250,6 +580,14 @@ class ResultsManager:
         if not model_keys:
             model_keys = self.read_model_keys()  # all of them
 
+        if self._results_file_type == 'dataset':
+            combined_data, column_names = self._read_results_from_dataset(
+                result_type, model_keys)
+            combined_df = pd.concat(combined_data, axis=1)
+            combined_df.columns.names = (
+                self.read_model_key_names() + list(column_names))
+            return combined_df
+
         combined_data = {
             key: self.read_result(key, result_type) 
             for key in model_keys
@@ -266,6 +604,79 @@ class ResultsManager:
         return combined_df
     #endregion
 
+    #region: _read_results_from_dataset
+    def _read_results_from_dataset(self, result_type, model_keys):
+        '''
+        Read the results for multiple model keys in a single scan of the 
+        dataset for the result type.
+
+        Only the partitions of the model keys are read.
+
+        Returns
+        -------
+        result_df_for_key : dict of pandas.DataFrame
+            Mapping of each model key to its results, in the order given.
+        column_names : list
+            Names of the column levels of the results.
+        '''
+        model_key_names = self.read_model_key_names()
+        dataset = ds.dataset(
+            self._build_dataset_path(result_type), 
+            format='parquet', 
+            partitioning=self._get_partitioning(model_key_names)
+            )
+
+        # Build a filter expression for the partitions to read
+        key_filter = None
+        for model_key in dict.fromkeys(model_keys):
+            expression = None
+            for name, value in zip(model_key_names, model_key):
+                term = ds.field(name) == value
+                expression = term if expression is None else expression & term
+            key_filter = (
+                expression if key_filter is None else key_filter | expression)
+
+        table = dataset.to_table(filter=key_filter)
+        index_names, column_names = _get_level_names(dataset.schema)
+        long_df = table.to_pandas()
+
+        result_df_for_key = {}  # initialize
+        for model_key, group in long_df.groupby(
+                model_key_names, sort=False, observed=True):
+            model_key = model_key if isinstance(model_key, tuple) else (
+                (model_key,))
+            result_df_for_key[model_key] = _from_long_frame(
+                group, index_names, column_names)
+        missing_keys = set(model_keys) - set(result_df_for_key)
+        if missing_keys:
+            raise FileNotFoundError(
+                f'No {result_type} results for model keys: {missing_keys}')
+        result_df_for_key = {k : result_df_for_key[k] for k in model_keys}
+        return result_df_for_key, column_names
+    #endregion
+
+    #region: _build_dataset_path
+    def _build_dataset_path(self, result_type):
+        '''
+        Build the path to the dataset for the specified result type.
+        '''
+        return os.path.join(self.output_dir, result_type)
+    #endregion
+
+    #region: _get_partitioning
+    @staticmethod
+    def _get_partitioning(model_key_names):
+        '''
+        Get the Hive-style partitioning of a dataset by the model key names.
+
+        All partition values are strings, e.g., 'true' is not cast to bool.
+        '''
+        return ds.partitioning(
+            pa.schema([(name, pa.string()) for name in model_key_names]), 
+            flavor='hive'
+            )
+    #endregion
+
     #region: _build_path
     def _build_path(self, model_key, result_type, file_type):
         '''
@@ -376,13 +787,8 @@ class ResultsManager:
         if isinstance(level_names, pd.core.indexes.frozen.FrozenList):
             level_names = list(level_names)  # ensures compatibility with JSON
 
-        all_metadata = self.read_all_metadata()
-        k = 'level_names_for_result'
-        if k not in all_metadata:
-            all_metadata[k] = {}  # initialize
-        
-        all_metadata[k][result_type] = level_names 
-        self.write_all_metadata(all_metadata)
+        self._metadata.set(
+            ['level_names_for_result', result_type], level_names)
     #endregion
 
     #region: read_level_names
@@ -474,9 +880,7 @@ class ResultsManager:
         -----
         The model key names are stored as metadata within the output directory.
         '''
-        all_metadata = self.read_all_metadata()
-        all_metadata['model_key_names'] = model_key_names
-        self.write_all_metadata(all_metadata)
+        self._metadata.set(['model_key_names'], model_key_names)
     #endregion
 
     #region: read_model_key_names
@@ -530,9 +934,7 @@ class ResultsManager:
         This method updates the metadata with the provided mapping and 
         writes the updated metadata back to the file.
         '''
-        all_metadata = self.read_all_metadata()
-        all_metadata['model_key_for_id'] = model_key_for_id
-        self.write_all_metadata(all_metadata)
+        self._metadata.set(['model_key_for_id'], model_key_for_id)
     #endregion
 
     #region: read_identifier_key_mapping
@@ -570,9 +972,7 @@ class ResultsManager:
         configuration : UnifiedConfiguration
             Contains all configuration settings.
         '''
-        all_metadata = self.read_all_metadata()
-        all_metadata['configuration'] = configuration.to_dict()
-        self.write_all_metadata(all_metadata)
+        self._metadata.set(['configuration'], configuration.to_dict())
     #endregion
 
     #region: read_configuration
@@ -602,14 +1002,10 @@ class ResultsManager:
 
         Notes
         -----
-        If the directory does not exist, it will be created.
+        If the directory does not exist, it will be created. This replaces 
+        all existing metadata. The other write methods only append a record.
         '''
-        # Ensure the directory exists
-        directory = os.path.dirname(self._metadata_path)
-        os.makedirs(directory, exist_ok=True)
-
-        with open(self._metadata_path, 'w') as file:
-            json.dump(metadata, file)
+        self._metadata.replace(metadata)
     #endregion
 
     #region: read_all_metadata
@@ -623,11 +1019,21 @@ class ResultsManager:
             Dictionary containing the metadata read from the file. Returns an 
             empty dictionary if the file does not exist.
         '''
-        if not os.path.exists(self._metadata_path):
-            return {}
-        
-        with open(self._metadata_path, 'r') as file:
-            return json.load(file)
+        return self._metadata.read()
+    #endregion
+
+    #region: compact_metadata
+    def compact_metadata(self):
+        '''
+        Merge the append-only records of the metadata and run manifest into 
+        their JSON files.
+
+        See Also
+        --------
+        MetadataLog.compact()
+        '''
+        self._metadata.compact()
+        self._manifest.compact()
     #endregion
 
     #region: _metadata_path
@@ -724,4 +1130,103 @@ class ResultsManager:
             ]
 
         return grouped_model_keys
-    #endregion
\ No newline at end of file
+    #endregion
+
+#region: _is_compressed
+def _is_compressed(path):
+    '''
+    Helper function to check whether a Joblib file is compressed, from its 
+    header rather than from the metadata, which may be missing or stale.
+
+    Uncompressed Joblib files are pickles, which start with the PROTO opcode 
+    (protocol 2 or higher). Compressed files start with the magic number of 
+    their compressor instead.
+    '''
+    with open(path, 'rb') as file:
+        return file.read(1) != pickle.PROTO
+#endregion
+
+#region: _to_long_table
+def _to_long_table(result_df):
+    '''
+    Helper function to convert a result DataFrame to a "long" table with one 
+    row for each value.
+
+    The table has the columns '_row' (position of the row), 'index_level_i' 
+    for each level of the index, 'column_level_i' for each level of the 
+    columns (as strings), and 'value'. The original level names are stored 
+    in the schema metadata.
+
+    Raises
+    ------
+    ValueError
+        If the DataFrame has more than one dtype.
+    '''
+    if result_df.dtypes.nunique() > 1:
+        raise ValueError(
+            'Results with mixed dtypes are not supported by the dataset '
+            f'file type: {dict(result_df.dtypes)}')
+
+    n_rows, n_columns = result_df.shape
+    arrays = {'_row' : np.repeat(np.arange(n_rows), n_columns)}
+    for i in range(result_df.index.nlevels):
+        level_values = result_df.index.get_level_values(i)
+        arrays[f'index_level_{i}'] = np.repeat(level_values, n_columns)
+    for i in range(result_df.columns.nlevels):
+        level_values = result_df.columns.get_level_values(i).astype(str)
+        arrays[f'column_level_{i}'] = np.tile(level_values, n_rows)
+    arrays['value'] = result_df.to_numpy().ravel()
+
+    level_names = {
+        'index_names' : list(result_df.index.names),
+        'column_names' : list(result_df.columns.names)
+        }
+    table = pa.Table.from_pandas(pd.DataFrame(arrays), preserve_index=False)
+    return table.replace_schema_metadata(
+        {'level_names' : json.dumps(level_names)})
+#endregion
+
+#region: _get_level_names
+def _get_level_names(schema):
+    '''
+    Helper function to get the original level names of the index and columns 
+    from the schema metadata of a long table.
+    '''
+    level_names = json.loads(schema.metadata[b'level_names'])
+    return level_names['index_names'], level_names['column_names']
+#endregion
+
+#region: _from_long_frame
+def _from_long_frame(long_df, index_names, column_names):
+    '''
+    Helper function to convert a "long" DataFrame back to the original 
+    result DataFrame.
+
+    The inverse of `_to_long_table`.
+    '''
+    long_df = long_df.sort_values('_row', kind='stable')
+    n_rows = long_df['_row'].nunique()
+    n_columns = len(long_df) // n_rows if n_rows else 0
+
+    first_rows = long_df.iloc[::n_columns] if n_columns else long_df
+    index_levels = [
+        first_rows[f'index_level_{i}'].to_numpy() 
+        for i in range(len(index_names))
+        ]
+    column_levels = [
+        long_df[f'column_level_{i}'].to_numpy()[:n_columns] 
+        for i in range(len(column_names))
+        ]
+
+    if len(index_levels) == 1:
+        index = pd.Index(index_levels[0], name=index_names[0])
+    else:
+        index = pd.MultiIndex.from_arrays(index_levels, names=index_names)
+    if len(column_levels) == 1:
+        columns = pd.Index(column_levels[0], name=column_names[0])
+    else:
+        columns = pd.MultiIndex.from_arrays(column_levels, names=column_names)
+
+    values = long_df['value'].to_numpy().reshape(n_rows, n_columns)
+    return pd.DataFrame(values, index=index, columns=columns)
+#endregion
@@ -0,0 +1,45 @@
+'''
+Tests for the custom transformers in transform.py.
+'''
+
+import pickle
+import numpy as np
+import pandas as pd
+
+from transform import MedianScaler
+
+#region: _make_features
+def _make_features():
+    '''
+    Helper function to make a small features DataFrame with missing values.
+    '''
+    return pd.DataFrame({
+        'a' : [1., 2., np.nan, 4., 10.],
+        'b' : [0., 0., 0., 0., 0.],
+        'c' : [5., 3., 1., np.nan, 2.]
+    })
+#endregion
+
+#region: test_median_scaler_unpickles_estimator_without_copy
+def test_median_scaler_unpickles_estimator_without_copy():
+    '''
+    A MedianScaler pickled before the 'copy' parameter was added, with the
+    fitted attributes as pandas.Series, can still transform and be printed.
+    '''
+    X = _make_features()
+    old_scaler = MedianScaler().fit(X)
+    # As set by the previous fit()
+    old_scaler.center_ = X.quantile(0.5)
+    old_scaler.scale_ = (X - old_scaler.center_).abs().median()
+    old_scaler.where_scale_ = old_scaler.scale_ > 0.
+    del old_scaler.copy
+
+    scaler = pickle.loads(pickle.dumps(old_scaler))
+
+    assert scaler.copy is True
+    assert 'MedianScaler' in repr(scaler)
+    X_transformed = scaler.transform(X)
+    pd.testing.assert_frame_equal(
+        X_transformed, MedianScaler().fit(X).transform(X))
+    pd.testing.assert_frame_equal(X, _make_features())  # not altered
+#endregion
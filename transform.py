@@ -2,17 +2,22 @@
 
 Notes
 -----
-Currently, these custom transformers only work with pandas objects as the
-inputs. The pandas.DataFrame, in particular, facilitates the use of 
+Currently, most of these custom transformers only work with pandas objects as
+the inputs. The pandas.DataFrame, in particular, facilitates the use of 
 sklearn.compose.ColumnTransformer, e.g., to pass through discrete-valued 
 features for some transformations (e.g., center/scale) based on the columns.
+`MissingValuesSelector` and `MedianScaler` operate on the underlying arrays 
+and also accept numpy arrays, but return a pandas.DataFrame for a 
+pandas.DataFrame.
 
 Reference
 ---------
 https://scikit-learn.org/stable/developers/develop.html#apis-of-scikit-learn-objects
 '''
 
+import functools
 import numpy as np
+import pandas as pd
 from sklearn.base import (
     OneToOneFeatureMixin,
     TransformerMixin,
@@ -27,6 +32,8 @@ import features
 class MissingValuesSelector(TransformerMixin, BaseEstimator):
     '''Discard features with proportion of missing values (NaN) > threshold.
 
+    Accepts a pandas.DataFrame or a 2-D array, and returns the same type.
+
     See Also
     --------
     sklearn.feature_selection.SelectorMixin
@@ -38,11 +45,15 @@ class MissingValuesSelector(TransformerMixin, BaseEstimator):
         self.threshold = threshold
 
     def fit(self, X, y=None):
+        '''Set the proportions_missing_ attribute, in one pass over the data.
         '''
-        '''
-        self.proportions_missing_ = X.isna().mean() 
+        values = _as_float_array(X)
+        self.proportions_missing_ = (
+            np.count_nonzero(np.isnan(values), axis=0) / max(len(values), 1))
         
-        self.n_features_in_ = X.shape[1]
+        self.n_features_in_ = values.shape[1]
+        if hasattr(X, 'columns'):
+            self.feature_names_in_ = np.array(X.columns, dtype=object)
         
         return self 
 
@@ -54,10 +65,14 @@ class MissingValuesSelector(TransformerMixin, BaseEstimator):
         return self.proportions_missing_ <= self.threshold
     
     def transform(self, X):
+        '''Select the features with a single indexing operation.
         '''
-        '''
-        mask = self._get_support_mask()
-        return X.loc[:, mask]
+        assert self.n_features_in_ == X.shape[1]
+
+        support = np.flatnonzero(self._get_support_mask())
+        if hasattr(X, 'iloc'):
+            return X.iloc[:, support]
+        return np.asarray(X)[:, support]
 #endregion
 
 # FIXME: Use one-to-one mixin instead of FeatureNameSupport?
@@ -68,46 +83,78 @@ class MedianScaler(OneToOneFeatureMixin, TransformerMixin, BaseEstimator):
 
     Uses the median and median absolute deviation to center and scale.
 
+    Accepts a pandas.DataFrame or a 2-D array, and returns the same type.
+
+    Parameters
+    ----------
+    copy : bool (optional)
+        If False, try to center and scale in place, i.e., in the values of 
+        the input, as with sklearn.preprocessing.StandardScaler. This is not 
+        guaranteed, e.g., if the input is not of float64 dtype. Default True.
+
     See Also
     --------
     sklearn.preprocessing.StandardScaler
         Uses mean/SD instead of median/MAD.
     '''
-    def __init__(self):
-        pass
+    def __init__(self, copy=True):
+        self.copy = copy
+
+    def __setstate__(self, state):
+        '''Default the parameters of estimators pickled before they were 
+        added, e.g., in existing results.
+        '''
+        state.setdefault('copy', True)
+        super().__setstate__(state)
 
     def fit(self, X, y=None):
         '''Set the center_ and scale_ attributes.
+
+        The median of each feature is computed once, and the median absolute 
+        deviation from the median of the resulting deviations. NaN are 
+        ignored.
         '''
-        self.center_ = X.quantile(0.5)
-        self.scale_ = features.median_absolute_deviation(X)
+        values = _as_float_array(X)
+        self.center_ = _nanmedian(values)
+        with np.errstate(invalid='ignore'):
+            deviations = np.abs(values - self.center_)
+        self.scale_ = _nanmedian(deviations, overwrite_input=True)
 
-        self.where_scale_ = self.scale_ > 0.
+        with np.errstate(invalid='ignore'):
+            self.where_scale_ = self.scale_ > 0.
         
-        self.n_features_in_ = X.shape[1]
-        self.feature_names_in_ = np.array(X.columns, dtype=object)
+        self.n_features_in_ = values.shape[1]
+        if hasattr(X, 'columns'):
+            self.feature_names_in_ = np.array(X.columns, dtype=object)
                                       
         return self
 
     def transform(self, X):
-        '''Center and scale the continuous features and return a copy.
+        '''Center and scale the continuous features in a single broadcast 
+        operation.
+
+        Features with a zero or undefined scale are returned unchanged. The 
+        input is not altered unless copy=False.
         '''
         check_is_fitted(self)
 
         assert self.n_features_in_ == X.shape[1]
-        assert (self.center_.index == self.scale_.index).all()
 
-        X_transformed = X.copy()  # to avoid altering the original DataFrame
+        # Features not scaled are centered to 0 and scaled by 1, i.e., unchanged
+        center = np.where(self.where_scale_, self.center_, 0.)
+        scale = np.where(self.where_scale_, self.scale_, 1.)
 
-        # Scale only features identified during fitting
-        for feature in self.where_scale_[self.where_scale_].index:
-            X_transformed[feature] = features.center_scale(
-                X[feature],
-                self.center_[feature], 
-                self.scale_[feature]
-                )
-        
-        return X_transformed
+        values = _as_float_array(X)
+        if self.copy or not values.flags.writeable:
+            values_transformed = np.subtract(values, center)
+        else:
+            values_transformed = np.subtract(values, center, out=values)
+        values_transformed /= scale
+
+        if hasattr(X, 'columns'):
+            return pd.DataFrame(
+                values_transformed, index=X.index, columns=X.columns)
+        return values_transformed
 #endregion
 
 # TODO: May no longer be used.
@@ -173,4 +220,119 @@ class select_columns_without_pattern:
         if self.pattern is not None:
             cols = cols[~cols.str.contains(self.pattern, regex=True)]
         return list(cols)
-#endregion
\ No newline at end of file
+#endregion
+
+#region: ColumnSchema
+class ColumnSchema:
+    '''Create a callable to select the continuous columns, i.e., those 
+    without the discrete suffix, to be used with 
+    sklearn.compose.ColumnTransformer.
+
+    Unlike `select_columns_without_pattern`, the columns are resolved once 
+    per set of columns (e.g., per features source) and cached in each 
+    process, so that the pattern is not matched again on every fit. The 
+    callable returns a boolean mask, which the ColumnTransformer applies 
+    without looking up the column names.
+
+    Parameters
+    ----------
+    discrete_suffix : str
+        Suffix pattern of the discrete-valued columns, e.g., '_discrete'.
+    '''
+    def __init__(self, discrete_suffix):
+        self.discrete_suffix = discrete_suffix
+
+    def __call__(self, X):
+        '''Callable for column selection to be used by a ColumnTransformer.
+        '''
+        return self.continuous_mask(X.columns)
+
+    def continuous_mask(self, columns):
+        '''Return a read-only boolean mask of the continuous columns.
+        '''
+        return _get_continuous_mask(self.discrete_suffix, tuple(columns))
+
+    def continuous_columns(self, columns):
+        '''Return a list of the continuous columns.
+        '''
+        return list(pd.Index(columns)[self.continuous_mask(columns)])
+
+    def discrete_columns(self, columns):
+        '''Return a list of the discrete columns.
+        '''
+        return list(pd.Index(columns)[~self.continuous_mask(columns)])
+#endregion
+
+#region: _get_continuous_mask
+@functools.lru_cache(maxsize=256)
+def _get_continuous_mask(discrete_suffix, columns):
+    '''
+    Helper function to resolve the continuous columns of a set of columns, 
+    memoized by the tuple of column names.
+    '''
+    columns = pd.Index(columns, dtype=object)
+    mask = np.ones(len(columns), dtype=bool)
+    if discrete_suffix is not None and len(columns):
+        mask = ~np.asarray(
+            columns.str.contains(discrete_suffix+'$', regex=True), dtype=bool)
+    mask.setflags(write=False)  # shared by all callers
+    return mask
+#endregion
+
+#region: _as_float_array
+def _as_float_array(X):
+    '''
+    Helper function to get the values of a pandas.DataFrame or array-like as 
+    a float64 array, without a copy if they already are.
+    '''
+    if hasattr(X, 'to_numpy'):
+        return X.to_numpy(dtype='float64')
+    return np.asarray(X, dtype='float64')
+#endregion
+
+#region: _nanmedian
+def _nanmedian(values, overwrite_input=False):
+    '''
+    Helper function to compute the median of each column, ignoring NaN.
+
+    Vectorized across columns, unlike numpy.nanmedian with missing values. 
+    NaN are sorted last, so that the median is read at the middle of the 
+    non-missing values of each column.
+
+    Parameters
+    ----------
+    values : numpy.ndarray
+        2-D array of float.
+    overwrite_input : bool (optional)
+        If True, the values are sorted in place to save memory.
+
+    Returns
+    -------
+    numpy.ndarray
+        NaN for columns without any non-missing value.
+    '''
+    n_samples, n_features = values.shape
+    if n_samples == 0:
+        return np.full(n_features, np.nan)
+
+    if overwrite_input:
+        values.sort(axis=0)
+        sorted_values = values
+    else:
+        sorted_values = np.sort(values, axis=0)
+
+    n_valid = n_samples - np.count_nonzero(np.isnan(sorted_values), axis=0)
+    columns = np.arange(n_features)
+    lower = sorted_values[np.maximum(n_valid - 1, 0) // 2, columns]
+    upper = sorted_values[n_valid // 2, columns]
+
+    # Linear interpolation as in numpy.quantile, for identical results
+    weight = np.where(n_valid % 2 == 0, 0.5, 0.)
+    with np.errstate(invalid='ignore'):
+        difference = upper - lower
+        median = lower + difference * weight
+        np.subtract(
+            upper, difference * (1. - weight), out=median, where=weight >= 0.5)
+    median[n_valid == 0] = np.nan
+    return median
+#endregion
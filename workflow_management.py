@@ -25,15 +25,26 @@ Dependencies
 - `results_management` : Module for managing results.
 '''
 
+import os
+import json
+import hashlib
+import traceback
+import multiprocessing
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from joblib.externals.loky import get_reusable_executor
+
 from data_management import DataManager
 from pipeline_factory import PipelineBuilder
 from feature_selection import FeatureSelector
 from model_factory import ModelBuilder
+from fit_cache import FitCache
 from metrics_management import MetricsManager
 from model_evaluation import ModelEvaluator
 from model_key_creation import ModelKeyCreator
 from results_management import ResultsManager
 from config_management import UnifiedConfiguration
+import profiling
 
 #region: WorkflowManager.__init__
 class WorkflowManager:
@@ -56,6 +67,24 @@ class WorkflowManager:
         Object to create model keys.
     results_manager : ResultsManager
         Object to manage results storage and retrieval.
+
+    Notes
+    -----
+    Each (instruction, estimator) pair, i.e., each model key, is an 
+    independent task. If `n_jobs_outer` is set in the model configuration, 
+    these tasks are distributed across a pool of processes and the cores 
+    given by `n_jobs` are divided between the outer tasks and the inner 
+    cross-validation jobs of `ModelEvaluator` and `FeatureSelector`.
+
+    The status of each task is recorded in a run manifest, along with a hash 
+    of its inputs. Unless `resume` is false in the model configuration, tasks 
+    with complete and current results are skipped when the workflows are 
+    restarted.
+
+    Each task is profiled (see profiling.py). The time, fit and predict 
+    counts, and peak memory of each stage are written as the 'profile' result 
+    of the model key, and the top time sinks of the run are summarized in 
+    'profile_summary.csv' in the results directory.
     '''
     def __init__(self, config):
         '''
@@ -68,6 +97,17 @@ class WorkflowManager:
         '''
         self._config = config 
 
+        self.model_key_creator = ModelKeyCreator(
+            config.model.modeling_instructions
+            )
+
+        n_tasks = len(self.model_key_creator.create_identifier_key_mapping())
+        self._n_jobs_outer, n_jobs_inner = allocate_n_jobs(
+            config.model.n_jobs, 
+            getattr(config.model, 'n_jobs_outer', 1),
+            n_tasks
+            )
+
         self.data_manager = DataManager(
             config.data,
             config.path
@@ -79,29 +119,42 @@ class WorkflowManager:
             config.data.discrete_column_suffix
             )
 
+        # Optionally reuse identical fits, e.g., across folds and estimators
+        fit_cache = None
+        fit_cache_dir = getattr(config.model, 'fit_cache_dir', None)
+        if fit_cache_dir is not None:
+            fit_cache = FitCache(
+                fit_cache_dir, 
+                warm_start_forests=getattr(
+                    config.model, 'warm_start_forests', False)
+                )
+
         feature_selector = FeatureSelector(
             config.feature_selection, 
-            config.model.n_jobs
+            n_jobs_inner,
+            fit_cache=fit_cache
             )
 
-        self.model_builder = ModelBuilder(feature_selector)
+        self.model_builder = ModelBuilder(feature_selector, fit_cache=fit_cache)
 
         metrics_manager = MetricsManager(config.category_to_dict('metric'))
         self.model_evaluator = ModelEvaluator(
             config.evaluation, 
             metrics_manager,
             feature_selector=feature_selector,
-            n_jobs=config.model.n_jobs
+            n_jobs=n_jobs_inner,
+            fit_cache=fit_cache
             )
 
-        self.model_key_creator = ModelKeyCreator(
-            config.model.modeling_instructions
-            )
         self.results_manager = ResultsManager(
             config.path.results_dir,
             results_file_type=config.data.file_type,
-            model_key_creator=self.model_key_creator
+            model_key_creator=self.model_key_creator,
+            estimator_compress=getattr(config.model, 'estimator_compress', 0)
         )
+
+        # Cache for hashes of input files, which may be large
+        self._digest_for_file = {}
 #endregion
     
     #region: run
@@ -123,34 +176,295 @@ class WorkflowManager:
         # For reproducibility,
         self.results_manager.write_configuration(self._config)
 
-        for instruction in self._config.model.modeling_instructions:
+        tasks = [
+            (*task, self._compute_task_digest(*task)) 
+            for task in self._expand_model_tasks()
+            ]
+        
+        if getattr(self._config.model, 'resume', True):
+            tasks = [
+                task for task in tasks
+                if not self.results_manager.is_completed(
+                    self._create_model_key(*task[:2]), task[-1])
+            ]
+
+        # Initialize containers for the completed and any failed tasks.
+        completed_model_keys = []
+        failed_model_keys = []
+
+        if self._n_jobs_outer == 1:
+            for instruction, estimator_name, digest in tasks:
+                model_key = self._create_model_key(instruction, estimator_name)
+                self.results_manager.write_manifest_entry(model_key, 'running')
+                try:
+                    self._run_and_write_model_task(
+                        instruction, 
+                        estimator_name, 
+                        digest
+                        )
+                except Exception:
+                    traceback.print_exc()
+                    self.results_manager.write_manifest_entry(
+                        model_key, 'failed')
+                    failed_model_keys.append(model_key)
+                    continue
+                completed_model_keys.append(model_key)
+        else:
+            # Results are written by the workers, which only append records to 
+            # the metadata and manifest. This avoids sending the results back.
+            # NOTE: Forked workers can deadlock the nested joblib (loky) pools.
+            pool = ProcessPoolExecutor(
+                max_workers=self._n_jobs_outer, 
+                mp_context=multiprocessing.get_context('spawn')
+                )
+            # Submit the longest tasks (nested feature selection) first.
+            tasks = sorted(
+                tasks, 
+                key=lambda task: task[0]['select_features'] != 'true'
+                )
+            with pool:
+                task_for_future = {}  # initialize
+                for instruction, estimator_name, digest in tasks:
+                    model_key = self._create_model_key(
+                        instruction, estimator_name)
+                    self.results_manager.write_manifest_entry(
+                        model_key, 'running')
+                    future = pool.submit(
+                        _run_model_task_in_worker, 
+                        self, 
+                        instruction, 
+                        estimator_name, 
+                        digest
+                        )
+                    task_for_future[future] = model_key
+
+                for future in as_completed(task_for_future):
+                    model_key = task_for_future[future]
+                    try:
+                        future.result()
+                    except Exception:
+                        traceback.print_exc()
+                        self.results_manager.write_manifest_entry(
+                            model_key, 'failed')
+                        failed_model_keys.append(model_key)
+                        continue
+                    completed_model_keys.append(model_key)
+
+        self.results_manager.compact_metadata()
+
+        if completed_model_keys:
+            self._summarize_profiles(completed_model_keys)
+
+        if failed_model_keys:
+            raise RuntimeError(
+                f'{len(failed_model_keys)} model key(s) failed and will be '
+                f're-run upon restart: {failed_model_keys}'
+                )
+    #endregion
+
+    #region: _expand_model_tasks
+    def _expand_model_tasks(self):
+        '''
+        Expand the modeling instructions into independent tasks, one for each 
+        (instruction, estimator) pair.
+
+        Returns
+        -------
+        list of 2-tuple
+            Each tuple contains a modeling instruction (dict) and the name of 
+            an estimator (str).
+        '''
+        return [
+            (instruction, estimator_name)
+            for instruction in self._config.model.modeling_instructions
+            for estimator_name in instruction['estimators']
+        ]
+    #endregion
+
+    #region: _run_model_task
+    def _run_model_task(self, instruction, estimator_name):
+        '''
+        Load the data, then evaluate and build a model for a single task.
+
+        This method is self-contained so that it can be executed in a 
+        separate process.
+
+        Parameters
+        ----------
+        instruction : dict
+            Dictionary containing the modeling instruction.
+        estimator_name : str
+            Name of the estimator, as in the estimator configuration.
+
+        Returns
+        -------
+        model_key : tuple of str
+            Model key identifying the results.
+        all_results : dict
+            Dictionary containing the evaluation results and model parameters.
+        '''
+        with profiling.stage('load_data'):
+            X, y = self.data_manager.load_features_and_target(**instruction)
+
+        preprocessor_names = (
+            self._config.preprocessor.preprocessors_for_condition[
+                instruction['data_condition']]
+        )
+        estimator = (
+            self.pipeline_builder.instantiate_estimators(preprocessor_names)
+            [estimator_name]
+        )
+
+        all_results = self._process_instruction(instruction, X, y, estimator)
+
+        return self._create_model_key(instruction, estimator_name), all_results
+    #endregion
+
+    #region: _run_and_write_model_task
+    def _run_and_write_model_task(self, instruction, estimator_name, digest):
+        '''
+        Run a single task with a profiler, then write its results and its 
+        profile.
+
+        Parameters
+        ----------
+        instruction : dict
+            Dictionary containing the modeling instruction.
+        estimator_name : str
+            Name of the estimator, as in the estimator configuration.
+        digest : str
+            Hash of the inputs of the task, for the run manifest.
 
-            X, y = self.data_manager.load_features_and_target(**instruction)            
-            
-            preprocessor_names = (
-                self._config.preprocessor.preprocessors_for_condition[
-                    instruction['data_condition']]
+        Returns
+        -------
+        tuple of str
+            The model key.
+
+        Notes
+        -----
+        The profile includes the writing of the other results, so it is 
+        written last. It is not listed in the run manifest.
+        '''
+        with profiling.Profiler() as profiler:
+            model_key, all_results = self._run_model_task(
+                instruction, estimator_name)
+            self.results_manager.write_results(
+                model_key, 
+                all_results, 
+                digest=digest
+                )
+        self.results_manager.write_result(
+            profiler.to_frame(), model_key, 'profile')
+        return model_key
+    #endregion
+
+    #region: _summarize_profiles
+    def _summarize_profiles(self, model_keys, n=10):
+        '''
+        Print and write the top time sinks of the tasks in this run.
+
+        Parameters
+        ----------
+        model_keys : list of tuple of str
+            Model keys of the completed tasks.
+        n : int, optional
+            Number of stages in the summary. Default 10.
+
+        Returns
+        -------
+        pandas.DataFrame
+            Refer to `profiling.summarize()`.
+        '''
+        profile = pd.concat(
+            {
+                model_key : self.results_manager.read_result(
+                    model_key, 'profile') 
+                for model_key in model_keys
+            }, 
+            names=self.results_manager.read_model_key_names()
             )
-            estimator_for_name = (
-                self.pipeline_builder.instantiate_estimators(
-                preprocessor_names)
+        summary = profiling.summarize(profile, n=n)
+
+        summary_path = os.path.join(
+            self.results_manager.output_dir, 'profile_summary.csv')
+        summary.to_csv(summary_path)
+        with pd.option_context(
+                'display.width', 200, 'display.max_columns', None):
+            print(f'Top {len(summary)} time sinks:')
+            print(summary[['wall_time', 'share', 'task_time', 'cpu_time', 
+                           'n_fits', 'n_predicts', 'peak_memory']])
+        return summary
+    #endregion
+
+    #region: _create_model_key
+    def _create_model_key(self, instruction, estimator_name):
+        '''Refer to `ModelKeyCreator.create_model_key` for documentation'''
+        return self.model_key_creator.create_model_key(
+            instruction, 
+            estimator_name
             )
-            
-            for estimator_name in instruction['estimators']:
-                estimator = estimator_for_name[estimator_name]
-
-                all_results = self._process_instruction(
-                    instruction, 
-                    X, 
-                    y, 
-                    estimator
-                    )
-                
-                model_key = self.model_key_creator.create_model_key(
-                    instruction, 
-                    estimator_name
-                    )                
-                self.results_manager.write_results(model_key, all_results)
+    #endregion
+
+    #region: _compute_task_digest
+    def _compute_task_digest(self, instruction, estimator_name):
+        '''
+        Compute a hash of everything that determines the results of a task.
+
+        This includes the modeling instruction, the configuration of the 
+        estimator and its preprocessors, the evaluation, feature selection, 
+        and metric settings, and the contents of the input data files.
+
+        Parameters
+        ----------
+        instruction : dict
+            Dictionary containing the modeling instruction.
+        estimator_name : str
+            Name of the estimator, as in the estimator configuration.
+
+        Returns
+        -------
+        str
+            Hexadecimal SHA-256 digest.
+        '''
+        preprocessor_names = (
+            self._config.preprocessor.preprocessors_for_condition[
+                instruction['data_condition']]
+        )
+        preprocessor_settings = self._config.preprocessor.settings
+        input_paths = self.data_manager.get_input_paths(**instruction)
+
+        task_inputs = {
+            'model_key': self._create_model_key(instruction, estimator_name),
+            'estimator': self._config.estimator.__dict__[estimator_name],
+            'preprocessors': {
+                name: preprocessor_settings[name] 
+                for name in preprocessor_settings if name in preprocessor_names
+                },
+            'discrete_column_suffix': (
+                self._config.data.discrete_column_suffix),
+            'evaluation': self._config.category_to_dict('evaluation'),
+            'feature_selection': (
+                self._config.category_to_dict('feature_selection')),
+            'metric': self._config.category_to_dict('metric'),
+            'input_files': [self._file_digest(path) for path in input_paths]
+        }
+        return hashlib.sha256(
+            json.dumps(task_inputs, sort_keys=True).encode()
+            ).hexdigest()
+    #endregion
+
+    #region: _file_digest
+    def _file_digest(self, path, chunk_size=2**20):
+        '''
+        Helper function to compute (or retrieve) the SHA-256 digest of a file.
+        '''
+        if path not in self._digest_for_file:
+            file_hash = hashlib.sha256()
+            with open(path, 'rb') as file:
+                for chunk in iter(lambda: file.read(chunk_size), b''):
+                    file_hash.update(chunk)
+            self._digest_for_file[path] = file_hash.hexdigest()
+        return self._digest_for_file[path]
     #endregion
 
     #region: _process_instruction
@@ -197,10 +511,93 @@ class WorkflowManager:
             y, 
             select_features
         )
+
+        all_results = {**evaluation_results, **build_results}
+        if 'repeats' in evaluation_results and select_features:
+            # Also record the repeats of the selection for the final model
+            final_repeats = pd.DataFrame(
+                {'n_repeats' : [build_results['n_repeats_selection']]}, 
+                index=pd.MultiIndex.from_tuples(
+                    [('final_selection', -1)], names=['stage', 'replicate'])
+                )
+            all_results['repeats'] = pd.concat(
+                [evaluation_results['repeats'], final_repeats])
         
-        return {**evaluation_results, **build_results}
+        return all_results
     #endregion
 
+#region: _run_model_task_in_worker
+def _run_model_task_in_worker(
+        workflow_manager, instruction, estimator_name, digest):
+    '''
+    Run `WorkflowManager._run_and_write_model_task` within a pool of 
+    processes, i.e., run a task and write its results.
+
+    Any nested joblib workers are released after the task. Otherwise, the 
+    pool would not shut down until the idle timeout (300 s) of these workers 
+    had elapsed.
+
+    Returns
+    -------
+    tuple
+        The model key. The results are on disk. Avoid sending them back.
+    '''
+    try:
+        return workflow_manager._run_and_write_model_task(
+            instruction, estimator_name, digest)
+    finally:
+        get_reusable_executor().shutdown(wait=True)
+#endregion
+
+#region: allocate_n_jobs
+def allocate_n_jobs(n_jobs, n_jobs_outer=1, n_tasks=None):
+    '''
+    Divide a budget of CPU cores between outer tasks and inner jobs.
+
+    Parameters
+    ----------
+    n_jobs : int or None
+        Total number of cores. Follows the joblib.Parallel convention, i.e., 
+        negative values count back from the number of CPUs (-1 means all).
+    n_jobs_outer : int or None, optional
+        Number of outer tasks to run concurrently. Same convention as 
+        `n_jobs`. Default is 1, i.e., outer tasks are run serially.
+    n_tasks : int, optional
+        Number of outer tasks. If provided, the number of concurrent outer 
+        tasks will not exceed it.
+
+    Returns
+    -------
+    n_jobs_outer : int
+        Number of outer tasks to run concurrently.
+    n_jobs_inner : int or None
+        Number of jobs for each outer task. Equal to `n_jobs` if the outer 
+        tasks are run serially.
+    '''
+    n_jobs_outer = _effective_n_jobs(n_jobs_outer)
+    if n_tasks is not None:
+        n_jobs_outer = min(n_jobs_outer, max(n_tasks, 1))
+    if n_jobs_outer == 1:
+        return 1, n_jobs
+
+    n_jobs_total = _effective_n_jobs(n_jobs)
+    n_jobs_outer = min(n_jobs_outer, n_jobs_total)
+    n_jobs_inner = max(n_jobs_total // n_jobs_outer, 1)
+    return n_jobs_outer, n_jobs_inner
+#endregion
+
+#region: _effective_n_jobs
+def _effective_n_jobs(n_jobs):
+    '''
+    Helper function to convert n_jobs to a positive number of cores.
+    '''
+    if n_jobs is None:
+        return 1
+    if n_jobs < 0:
+        return max(os.cpu_count() + 1 + n_jobs, 1)
+    return max(n_jobs, 1)
+#endregion
+
 if __name__ == '__main__':
     config = UnifiedConfiguration()
     workflow_manager = WorkflowManager(config)